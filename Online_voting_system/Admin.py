@@ -1,11 +1,12 @@
 import subprocess as sb_p
 import tkinter as tk
-import register_with_eye as regV
-import admFunc as adFunc
 from tkinter import *
-from register_with_eye import *
-from admFunc import *
 from tkinter import messagebox
+from lazy_imports import lazy_import
+
+# loaded when their screen is opened (cv2, dframe/pandas, PIL)
+regV = lazy_import('register_with_eye')
+adFunc = lazy_import('admFunc')
 
 
 def AdminHome(root,frame1,frame3):
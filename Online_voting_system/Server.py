@@ -1,59 +1,548 @@
 import socket
+import asyncio
+import argparse
+import signal
+import time
+import queue
+import concurrent.futures
+import hmac
 import threading
 import dframe as df
+import protocol as proto
 from threading import Thread
 from dframe import *
 
-lock = threading.Lock()
+HOST = socket.gethostname()
+PORT = 4001
+BACKLOG = 10
+READ_TIMEOUT = 60       # seconds a client may stay silent before it is dropped
+SHUTDOWN_GRACE = 5      # seconds open sessions get to finish on shutdown
+GROUP_COMMIT_WINDOW = 0.005   # seconds a batch stays open after its first ballot
+GROUP_COMMIT_MAX = 256        # ballots per batch
+# Server-side biometrics: booths send live ORB descriptors (MSG_VERIFY_BIO) and
+# the server matches them against its own template cache, so templates and the
+# master key never leave the server. With REQUIRE_BIOMETRIC a VOTE is only
+# accepted from a voter who passed both AUTH and VERIFY_BIO on the connection.
+REQUIRE_BIOMETRIC = False
+TALLY_PUSH_INTERVAL = 0.2     # seconds between pushes to one results subscriber
+TALLY_HEARTBEAT = 5           # seconds of silence before an empty push
 
-def client_thread(connection):
 
-    data = connection.recv(1024)     #receiving voter details            #2
+class LiveTally:
+    """
+    The server's running tally: seeded once from dframe.show_result() and then
+    advanced by every committed ballot, so MSG_RESULT never touches storage.
+    version counts committed ballots; subscribers get the deltas.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = None
+        self.version = 0
+        self.subscribers = set()
 
-    #verify voter details
+    def load(self):
+        """(Re)seed from storage. Called before the server accepts connections."""
+        with self.lock:
+            self.counts = dict(df.show_result())
+            for sub in self.subscribers:
+                sub.reset(self.version, self.counts)
+
+    def apply(self, signs):
+        """Count ballots that are already durable."""
+        if not signs:
+            return
+        if self.counts is None:
+            self.load()     # storage already holds these ballots
+            return
+        delta = {}
+        for sign in signs:
+            delta[sign] = delta.get(sign, 0) + 1
+        with self.lock:
+            for sign, n in delta.items():
+                self.counts[sign] = self.counts.get(sign, 0) + n
+            self.version += len(signs)
+            for sub in self.subscribers:
+                sub.add(self.version, delta)
+
+    def snapshot(self):
+        """(version, counts) without reading storage."""
+        if self.counts is None:
+            self.load()
+        with self.lock:
+            return self.version, dict(self.counts)
+
+    def subscribe(self, sub):
+        """Register sub for deltas; returns the (version, counts) they apply to."""
+        if self.counts is None:
+            self.load()
+        with self.lock:
+            self.subscribers.add(sub)
+            sub.base = self.version
+            return self.version, dict(self.counts)
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+
+class TallySubscriber:
+    """
+    One results subscriber. Deltas are merged until the connection takes them,
+    so a slow admin screen gets one frame per TALLY_PUSH_INTERVAL, never a
+    backlog. wake is called (under LiveTally.lock) whenever something is pending.
+    """
+    def __init__(self, wake):
+        self.wake = wake
+        self.base = 0
+        self.version = 0
+        self.pending = {}
+        self.counts = None    # full counts to resend after LiveTally.load()
+
+    def add(self, version, delta):
+        for sign, n in delta.items():
+            self.pending[sign] = self.pending.get(sign, 0) + n
+        self.version = version
+        self.wake()
+
+    def reset(self, version, counts):
+        self.pending = {}
+        self.version = version
+        self.counts = dict(counts)
+        self.wake()
+
+    def take(self):
+        """Next MSG_TALLY payload (empty delta if nothing changed). Caller holds LiveTally.lock."""
+        if self.counts is not None:
+            payload = {'base': self.base, 'version': self.version, 'counts': self.counts}
+            self.counts = None
+        else:
+            payload = {'base': self.base, 'version': max(self.version, self.base), 'delta': self.pending}
+        self.base = payload['version']
+        self.pending = {}
+        return payload
+
+
+live_tally = LiveTally()
+
+
+class GroupCommitter:
+    """
+    Collects ballots arriving within GROUP_COMMIT_WINDOW (or up to
+    GROUP_COMMIT_MAX of them) and commits them with one dframe.vote_update_many
+    call: one ledger write, one fsync. Each submit() returns a
+    concurrent.futures.Future that resolves to True/False once its batch is
+    durable, so clients only hear 'Successful' after the commit.
+    """
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = Thread(target=self._run, name="group-commit", daemon=True)
+        self.thread.start()
+
+    def submit(self, sign, voter_id):
+        fut = concurrent.futures.Future()
+        self.queue.put((sign, voter_id, fut))
+        return fut
+
+    def stop(self):
+        """Commit whatever is queued, then stop the commit thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            results = df.vote_update_many([(sign, vid) for sign, vid, _ in batch])
+        except Exception as e:
+            print("Group commit failed:", e)
+            results = [False] * len(batch)
+        live_tally.apply([sign for (sign, _, _), ok in zip(batch, results) if ok])
+        for (_, _, fut), ok in zip(batch, results):
+            fut.set_result(ok)
+
+
+committer = None   # GroupCommitter when group commit is enabled (see start_group_commit)
+
+
+def start_group_commit(window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX):
+    global committer
+    committer = GroupCommitter(window, max_batch)
+    print("Group commit: window " + str(window * 1000) + " ms, up to " + str(max_batch) + " ballots")
+
+
+def stop_group_commit():
+    global committer
+    if committer is not None:
+        committer.stop()
+        committer = None
+
+
+def check_voter(data):
+    """
+    Verify a 'voter_id password' login message (text protocol).
+    Returns (voter_id, reply) where reply is Authenticate / VoteCasted / InvalidVoter.
+    """
     log = (data.decode()).split(' ')
+    if len(log) < 2:
+        print('Invalid Credentials')
+        return None, "InvalidVoter"
+    return login(log[0], log[1])
+
+
+def login(voter_id, passw):
+    """Verify voter_id / password. Returns (voter_id, reply) like check_voter."""
+    log = [voter_id, passw]
     try:
         log[0] = int(log[0])
 
-        if(df.verify(log[0],log[1])):                                
+        if(df.verify(log[0],log[1])):
             if(df.isEligible(log[0])):
                 print('Voter Logged in... ID:'+str(log[0]))
-                connection.send("Authenticate".encode())
+                return log[0], "Authenticate"
             else:
                 print('Vote Already Cast by ID:'+str(log[0]))
-                connection.send("VoteCasted".encode())
+                return log[0], "VoteCasted"
         else:
             print('Invalid Voter')
-            connection.send("InvalidVoter".encode())
-            return
+            return None, "InvalidVoter"
 
     except:
         print('Invalid Credentials')
-        connection.send("InvalidVoter".encode())
-        return
+        return None, "InvalidVoter"
 
 
-    data = connection.recv(1024)                                    #4 Get Vote
-    print("Vote Received from ID: "+str(log[0])+"  Processing...")
-    lock.acquire()
+def cast_vote(sign, voter_id):
+    """
+    Apply one ballot and return the reply sent back to the client.
+    No server-wide lock: dframe.vote_update serializes per voter. With group
+    commit enabled this blocks until the ballot's batch is on disk.
+    """
+    print("Vote Received from ID: "+str(voter_id)+"  Processing...")
     #update Database
-    if(df.vote_update(data.decode(),log[0])):
-        print("Vote Casted Sucessfully by voter ID = "+str(log[0]))
-        connection.send("Successful".encode())
+    if committer is not None:
+        return _vote_reply(committer.submit(sign, voter_id).result(), voter_id)
+    return _vote_reply(_vote_update(sign, voter_id), voter_id)
+
+
+async def async_cast_vote(sign, voter_id):
+    """cast_vote for the asyncio server: waits for the group commit without blocking the loop."""
+    print("Vote Received from ID: "+str(voter_id)+"  Processing...")
+    if committer is not None:
+        return _vote_reply(await asyncio.wrap_future(committer.submit(sign, voter_id)), voter_id)
+    return _vote_reply(_vote_update(sign, voter_id), voter_id)
+
+
+def _vote_update(sign, voter_id):
+    """df.vote_update without group commit; counts the ballot in live_tally once it is recorded."""
+    ok = df.vote_update(sign, voter_id)
+    if ok:
+        live_tally.apply([sign])
+    return ok
+
+
+def _vote_reply(ok, voter_id):
+    if ok:
+        print("Vote Casted Sucessfully by voter ID = "+str(voter_id))
+        return "Successful"
     else:
-        print("Vote Update Failed by voter ID = "+str(log[0]))
-        connection.send("Vote Update Failed".encode())
-                                                                        #5
+        print("Vote Update Failed by voter ID = "+str(voter_id))
+        return "Vote Update Failed"
+
 
-    lock.release()
+def verify_biometric(session, payload):
+    """
+    Match live descriptors against the stored template of an authenticated
+    voter. Templates are decrypted once and then served from dframe's
+    template cache. Returns the RESULT payload.
+    """
+    import biometric
+    try:
+        voter_id = int(payload.get('voter_id'))
+        live = proto.decode_descriptors(payload.get('descriptors', ''))
+    except (TypeError, ValueError, proto.ProtocolError):
+        return {'status': "Error", 'error': "bad voter_id or descriptors"}
+    if voter_id not in session['authed']:
+        return {'status': "NotAuthenticated", 'score': 0.0}
+    stored = df.load_eye_template(voter_id)
+    if stored is None:
+        return {'status': "NoTemplate", 'score': 0.0}
+    score = biometric.symmetric_score(live, stored)
+    if score < biometric.MATCH_THRESHOLD:
+        print("Eye check failed for ID:", voter_id, "score:", score)
+        return {'status': "NoMatch", 'score': score}
+    session['bio_ok'].add(voter_id)
+    row = df.get_voter_row(voter_id) or {}
+    return {'status': "Match", 'score': score, 'name': row.get('name', '')}
+
+
+def sync_ballots(payload):
+    """
+    Apply a booth's offline ballots (MSG_SYNC) in one vote_update_many commit.
+    A record that does not open with the master key, or names an unknown voter
+    or sign, is Rejected; a voter who already has a ballot is a Duplicate, so
+    uploading the same queue twice changes nothing. An upload that does not
+    split into whole records is refused as Malformed before anything is applied.
+    """
+    import base64
+    import offline_queue
+    try:
+        blob = base64.b64decode(payload.get('records', ''))
+        records = offline_queue.split_records(blob)
+        key = df._get_master_key_interactive()
+    except (ValueError, RuntimeError) as e:
+        return {'status': "Error", 'error': str(e)}
+    good = sum(len(r) for _, r in records)
+    if good != len(blob):
+        return {'status': "Malformed",
+                'error': f"{len(blob) - good} bytes after record {len(records)} do not form a record"}
+
+    results = ["Rejected"] * len(records)
+    ballots, where = [], []
+    for i, (_, record) in enumerate(records):
+        try:
+            vid, sign, _cast_ns = offline_queue.open_record(key, record)
+        except Exception:
+            continue
+        ballots.append((sign, vid))
+        where.append(i)
+
+    counted = []
+    for i, (sign, vid), ok in zip(where, ballots, df.vote_update_many(ballots) if ballots else []):
+        if ok:
+            results[i] = "Accepted"
+            counted.append(sign)
+        elif df.get_voter_row(vid) is not None and not df.isEligible(vid):
+            results[i] = "Duplicate"
+    live_tally.apply(counted)
+    print("Offline sync from", str(payload.get('booth', '?')) + ":", len(counted), "accepted of", len(records))
+    return {'status': "OK", 'results': results, 'accepted': len(counted)}
+
+
+def handle_request(session, msg_type, payload):
+    """
+    Answer one framed request. session is the per-connection state
+    ({'authed': voter ids that passed MSG_AUTH on this connection and have
+                not voted or logged out since,
+      'bio_ok': voter ids that also passed MSG_VERIFY_BIO}).
+    Returns the RESULT payload.
+    """
+    if msg_type == proto.MSG_AUTH:
+        voter_id, reply = login(payload.get('voter_id', ''), payload.get('passw', ''))
+        if reply == "Authenticate":
+            session['authed'].add(voter_id)
+        result = {'status': reply}
+
+    elif msg_type == proto.MSG_VOTE:
+        voter_id = _vote_target(session, payload)
+        if voter_id is None:
+            result = {'status': "Vote Update Failed", 'error': "not authenticated on this connection"}
+        else:
+            result = {'status': cast_vote(str(payload.get('sign', '')), voter_id)}
+
+    elif msg_type == proto.MSG_VERIFY_BIO:
+        result = verify_biometric(session, payload)
+
+    elif msg_type == proto.MSG_RESULT:
+        if results_allowed(payload):
+            version, counts = live_tally.snapshot()
+            result = {'status': "OK", 'version': version, 'counts': counts}
+        else:
+            result = NOT_AUTHORIZED.copy()
+
+    elif msg_type == proto.MSG_PING:
+        result = {'status': "OK"}
+
+    elif msg_type == proto.MSG_LOGOUT:
+        # the voter's turn is over without a ballot (failed eye check, cancelled, walked away)
+        try:
+            voter_id = int(payload.get('voter_id'))
+        except (TypeError, ValueError):
+            voter_id = None
+        session['authed'].discard(voter_id)
+        session['bio_ok'].discard(voter_id)
+        result = {'status': "OK"}
+
+    elif msg_type == proto.MSG_SYNC:
+        result = sync_ballots(payload)
+
+    elif msg_type == proto.MSG_BATCH:
+        results = []
+        for req in payload.get('requests', []):
+            if not isinstance(req, dict) or req.get('type') == proto.MSG_BATCH:
+                results.append({'status': "Error", 'error': "bad batch entry"})
+                continue
+            results.append(handle_request(session, req.get('type'), req.get('payload') or {}))
+        result = {'status': "OK", 'results': results}
+
+    else:
+        result = {'status': "Error", 'error': "unknown message type " + str(msg_type)}
+
+    if 'rid' in payload:
+        result['rid'] = payload['rid']
+    return result
+
+
+NOT_AUTHORIZED = {'status': "NotAuthorized", 'error': "the tally needs the observer token (database/results_token)"}
+
+
+def results_allowed(payload):
+    """True if a MSG_RESULT / MSG_SUBSCRIBE payload carries this server's observer token."""
+    token = proto.load_results_token(create=True)
+    if not token:
+        return False
+    return hmac.compare_digest(str(payload.get('token', '')).encode('utf-8'), token.encode('utf-8'))
+
+
+def _vote_target(session, payload):
+    """Voter id a VOTE request may act for on this connection (consumes the login), or None."""
+    try:
+        voter_id = int(payload.get('voter_id'))
+    except (TypeError, ValueError):
+        return None
+    if voter_id not in session['authed']:
+        return None
+    if REQUIRE_BIOMETRIC and voter_id not in session['bio_ok']:
+        return None
+    session['authed'].discard(voter_id)
+    session['bio_ok'].discard(voter_id)
+    return voter_id
+
+
+async def async_handle_request(session, msg_type, payload):
+    """
+    handle_request for the asyncio server. Votes (also inside a batch) wait for
+    their group commit concurrently, so a batch of N ballots costs one commit.
+    """
+    if msg_type == proto.MSG_AUTH:
+        # a password check is a calibrated PBKDF2 hash (~100 ms): off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, handle_request, session, msg_type, payload)
+    elif msg_type == proto.MSG_VOTE:
+        voter_id = _vote_target(session, payload)
+        if voter_id is None:
+            result = {'status': "Vote Update Failed", 'error': "not authenticated on this connection"}
+        else:
+            result = {'status': await async_cast_vote(str(payload.get('sign', '')), voter_id)}
+    elif msg_type == proto.MSG_VERIFY_BIO:
+        # ORB matching is CPU work: keep it off the event loop
+        result = await asyncio.get_running_loop().run_in_executor(None, verify_biometric, session, payload)
+    elif msg_type == proto.MSG_SYNC:
+        # thousands of decrypts plus an fsync: off the event loop too
+        result = await asyncio.get_running_loop().run_in_executor(None, sync_ballots, payload)
+    elif msg_type == proto.MSG_BATCH:
+        steps = []
+        for req in payload.get('requests', []):
+            if not isinstance(req, dict) or req.get('type') == proto.MSG_BATCH:
+                steps.append(_batch_error())
+                continue
+            step = async_handle_request(session, req.get('type'), req.get('payload') or {})
+            if req.get('type') == proto.MSG_AUTH:
+                # finish the login first: later votes in the batch may need it
+                step = asyncio.ensure_future(step)
+                await step
+            steps.append(step)
+        result = {'status': "OK", 'results': list(await asyncio.gather(*steps))}
+    else:
+        return handle_request(session, msg_type, payload)
+
+    if 'rid' in payload:
+        result['rid'] = payload['rid']
+    return result
+
+
+async def _batch_error():
+    return {'status': "Error", 'error': "bad batch entry"}
+
+
+def client_thread(connection):
+
+    data = connection.recv(1024)     #receiving voter details            #2
+
+    #verify voter details
+    voter_id, reply = check_voter(data)
+    connection.send(reply.encode())
+    if voter_id is None:
+        return
+
+    data = connection.recv(1024)                                    #4 Get Vote
+    connection.send(cast_vote(data.decode(), voter_id).encode())    #5
     connection.close()
 
 
-def voting_Server():
+def framed_client_thread(connection):
+    """Serve framed requests on one connection until the client disconnects."""
+    session = {'authed': set(), 'bio_ok': set()}
+    try:
+        while True:
+            msg_type, payload = proto.recv_frame(connection)
+            if msg_type == proto.MSG_SUBSCRIBE:
+                push_tally(connection, payload)
+                break
+            proto.send_frame(connection, proto.MSG_RESULT, handle_request(session, msg_type, payload))
+    except ConnectionError:
+        pass
+    except proto.ProtocolError as e:
+        print('Protocol error, closing connection:', e)
+    except OSError as e:
+        print('Connection lost:', e)
+    finally:
+        connection.close()
+
+
+def push_tally(connection, payload):
+    """Answer MSG_SUBSCRIBE with the current tally, then push merged deltas until the subscriber goes away."""
+    if not results_allowed(payload):
+        reply = NOT_AUTHORIZED.copy()
+        if 'rid' in payload:
+            reply['rid'] = payload['rid']
+        proto.send_frame(connection, proto.MSG_RESULT, reply)
+        return
+    ready = threading.Event()
+    sub = TallySubscriber(ready.set)
+    version, counts = live_tally.subscribe(sub)
+    try:
+        reply = {'status': "OK", 'version': version, 'counts': counts}
+        if 'rid' in payload:
+            reply['rid'] = payload['rid']
+        proto.send_frame(connection, proto.MSG_RESULT, reply)
+        while True:
+            ready.wait(TALLY_HEARTBEAT)
+            time.sleep(TALLY_PUSH_INTERVAL)
+            with live_tally.lock:
+                ready.clear()
+                update = sub.take()
+            proto.send_frame(connection, proto.MSG_TALLY, update)
+    finally:
+        live_tally.unsubscribe(sub)
+
+
+def voting_Server(host=HOST, port=PORT, backlog=BACKLOG, protocol=None):
+    protocol = protocol or proto.WIRE_PROTOCOL
+    live_tally.load()
+    proto.load_results_token(create=True)
 
     serversocket = socket.socket()
-    host = socket.gethostname()
-    port = 4001
 
     ThreadCount = 0
 
@@ -63,22 +552,204 @@ def voting_Server():
         print(str(e))
     print("Waiting for the connection")
 
-    serversocket.listen(10)
+    serversocket.listen(backlog)
 
-    print( "Listening on " + str(host) + ":" + str(port))
+    print( "Listening on " + str(host) + ":" + str(port) + " (" + protocol + " protocol)")
 
     while True :
         client, address = serversocket.accept()
 
         print('Connected to :', address)
 
-        client.send("Connection Established".encode())   ### 1
-        t = Thread(target = client_thread,args = (client,))
+        if protocol == "text":
+            client.send("Connection Established".encode())   ### 1
+            t = Thread(target = client_thread,args = (client,))
+        else:
+            proto.send_frame(client, proto.MSG_HELLO, {'version': proto.PROTOCOL_VERSION})
+            t = Thread(target = framed_client_thread,args = (client,))
         t.start()
         ThreadCount+=1
         # break
 
     serversocket.close()
 
+# ----------------- asyncio server ----------------- #
+# Same protocols as voting_Server (text: banner -> credentials -> vote, or framed
+# requests), but all sessions are coroutines on one event loop instead of one
+# thread each.
+# dframe lookups and the ballot append are O(1), so they run inline on the loop;
+# password checks (PBKDF2) run in the default executor.
+
+async def async_client_session(reader, writer, read_timeout=READ_TIMEOUT):
+    address = writer.get_extra_info('peername')
+    try:
+        writer.write("Connection Established".encode())   ### 1
+        await writer.drain()
+
+        data = await asyncio.wait_for(reader.read(1024), read_timeout)    #2
+        voter_id, reply = await asyncio.get_running_loop().run_in_executor(None, check_voter, data)
+        writer.write(reply.encode())
+        await writer.drain()
+        if reply != "Authenticate":
+            return
+
+        data = await asyncio.wait_for(reader.read(1024), read_timeout)    #4 Get Vote
+        if not data:
+            return
+        writer.write((await async_cast_vote(data.decode(), voter_id)).encode())   #5
+        await writer.drain()
+    except asyncio.TimeoutError:
+        print('Session timed out:', address)
+    except (ConnectionError, OSError) as e:
+        print('Connection lost:', address, e)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def async_framed_session(reader, writer, read_timeout=READ_TIMEOUT):
+    address = writer.get_extra_info('peername')
+    session = {'authed': set(), 'bio_ok': set()}
+    try:
+        proto.write_frame(writer, proto.MSG_HELLO, {'version': proto.PROTOCOL_VERSION})
+        await writer.drain()
+        while True:
+            msg_type, payload = await asyncio.wait_for(proto.read_frame(reader), read_timeout)
+            if msg_type == proto.MSG_SUBSCRIBE:
+                await async_push_tally(writer, payload)
+                break
+            proto.write_frame(writer, proto.MSG_RESULT, await async_handle_request(session, msg_type, payload))
+            await writer.drain()
+    except asyncio.IncompleteReadError:
+        pass
+    except asyncio.TimeoutError:
+        print('Session timed out:', address)
+    except proto.ProtocolError as e:
+        print('Protocol error, closing connection:', address, e)
+    except (ConnectionError, OSError) as e:
+        print('Connection lost:', address, e)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def async_push_tally(writer, payload):
+    """push_tally for the asyncio server; committed ballots wake it through call_soon_threadsafe."""
+    if not results_allowed(payload):
+        reply = NOT_AUTHORIZED.copy()
+        if 'rid' in payload:
+            reply['rid'] = payload['rid']
+        proto.write_frame(writer, proto.MSG_RESULT, reply)
+        await writer.drain()
+        return
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    sub = TallySubscriber(lambda: loop.call_soon_threadsafe(ready.set))
+    version, counts = live_tally.subscribe(sub)
+    try:
+        reply = {'status': "OK", 'version': version, 'counts': counts}
+        if 'rid' in payload:
+            reply['rid'] = payload['rid']
+        proto.write_frame(writer, proto.MSG_RESULT, reply)
+        await writer.drain()
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), TALLY_HEARTBEAT)
+            except asyncio.TimeoutError:
+                pass
+            await asyncio.sleep(TALLY_PUSH_INTERVAL)
+            with live_tally.lock:
+                ready.clear()
+                update = sub.take()
+            proto.write_frame(writer, proto.MSG_TALLY, update)
+            await writer.drain()
+    finally:
+        live_tally.unsubscribe(sub)
+
+
+async def _serve_async(host, port, backlog, read_timeout, protocol):
+    sessions = set()
+    live_tally.load()
+    proto.load_results_token(create=True)
+    handler = async_client_session if protocol == "text" else async_framed_session
+
+    async def on_connect(reader, writer):
+        print('Connected to :', writer.get_extra_info('peername'))
+        task = asyncio.current_task()
+        sessions.add(task)
+        try:
+            await handler(reader, writer, read_timeout)
+        finally:
+            sessions.discard(task)
+
+    server = await asyncio.start_server(on_connect, host, port, backlog=backlog)
+    print("Listening on " + str(host) + ":" + str(port) + " (asyncio, " + protocol + " protocol, backlog " + str(backlog) + ")")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C surfaces as KeyboardInterrupt in async_voting_Server
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        print("Shutting down: refusing new connections,", len(sessions), "session(s) open")
+        server.close()
+        await server.wait_closed()
+        if sessions:
+            done, pending = await asyncio.wait(set(sessions), timeout=SHUTDOWN_GRACE)
+            for task in pending:
+                task.cancel()
+        stop_group_commit()
+        df.sync_ledger()
+
+
+def async_voting_Server(host=HOST, port=PORT, backlog=1024, read_timeout=READ_TIMEOUT, protocol=None):
+    try:
+        asyncio.run(_serve_async(host, port, backlog, read_timeout, protocol or proto.WIRE_PROTOCOL))
+    except KeyboardInterrupt:
+        df.sync_ledger()
+    print("Server stopped")
+
+
 if __name__ == '__main__':
-    voting_Server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Online voting server")
+    parser.add_argument('--mode', choices=['threaded', 'asyncio'], default='threaded', help='Connection handling model')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--backlog', type=int, help='listen() backlog (default 10 threaded, 1024 asyncio)')
+    parser.add_argument('--timeout', type=float, default=READ_TIMEOUT, help='Per-connection read timeout in seconds (asyncio)')
+    parser.add_argument('--protocol', choices=['framed', 'text'], default=proto.WIRE_PROTOCOL, help='Wire protocol (text = legacy clients)')
+    parser.add_argument('--group-commit-ms', type=float, default=GROUP_COMMIT_WINDOW * 1000, help='Group-commit window in ms (0 = commit each ballot on its own)')
+    parser.add_argument('--group-commit-max', type=int, default=GROUP_COMMIT_MAX, help='Maximum ballots per group commit')
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default=df.STORAGE_BACKEND, help='Voter/tally storage backend')
+    parser.add_argument('--require-biometric', action='store_true', default=REQUIRE_BIOMETRIC, help='Only accept votes after a server-side eye match (VERIFY_BIO)')
+    args = parser.parse_args()
+
+    df.set_backend(args.storage)
+    if args.storage == 'csv':
+        df.lock_ledger_writer()     # refuse to share the ballot ledger with another server
+    REQUIRE_BIOMETRIC = args.require_biometric
+
+    if args.group_commit_ms > 0:
+        start_group_commit(args.group_commit_ms / 1000.0, args.group_commit_max)
+    try:
+        if args.mode == 'asyncio':
+            async_voting_Server(args.host, args.port, args.backlog or 1024, args.timeout, args.protocol)
+        else:
+            voting_Server(args.host, args.port, args.backlog or BACKLOG, args.protocol)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_group_commit()
+        df.sync_ledger()
@@ -1,5 +1,4 @@
 import tkinter as tk
-import socket
 from tkinter import *
 from PIL import ImageTk,Image
 
@@ -8,11 +7,12 @@ def voteCast(root,frame1,vote,client_socket):
     for widget in frame1.winfo_children():
         widget.destroy()
 
-    client_socket.send(vote.encode()) #4
-
-    message = client_socket.recv(1024) #Success message
-    print(message.decode()) #5
-    message = message.decode()
+    try:
+        message = client_socket.cast_vote(vote) #4 -> #5 Success message
+    except Exception as e:
+        print("Vote not delivered:", e)
+        message = "Vote Update Failed"
+    print(message)
     if(message=="Successful"):
         Label(frame1, text="Vote Casted Successfully", font=('Helvetica', 18, 'bold')).grid(row = 1, column = 1)
     else:
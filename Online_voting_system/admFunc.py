@@ -1,3 +1,5 @@
+import threading
+import time
 import tkinter as tk
 import dframe as df
 from tkinter import *
@@ -12,9 +14,119 @@ def resetAll(root,frame1):
     msg = Message(frame1, text="Reset Complete", width=500)
     msg.grid(row = 11, column = 0, columnspan = 5)
 
+# sign, label, logo, logo size (rows of the results screen, top to bottom)
+CANDIDATES = [
+    ('bjp',  "BJP              :       ",      "img/bjp.png",  (35,35)),
+    ('cong', " Cong             :          ",  "img/cong.jpg", (25,38)),
+    ('aap',  " AAP               :          ", "img/aap.png",  (45,30)),
+    ('ss',   " Shiv Sena    :          ",      "img/ss.png",   (40,35)),
+    ('nota', " NOTA            :          ",   "img/nota.jpg", (35,25)),
+]
+REFRESH_MS = 250          # how often the open results screen looks for new counts
+RECONNECT_DELAY = 2       # seconds between attempts to reach the server
+FEED_TIMEOUT = 15         # seconds without a push (the server sends a heartbeat every 5) before reconnecting
+
+_logos = {}   # image file -> PhotoImage, resized once per process
+
+
+def _logo(file, size):
+    if file not in _logos:
+        _logos[file] = ImageTk.PhotoImage((Image.open(file)).resize(size,Image.LANCZOS))
+    return _logos[file]
+
+
+class ResultsFeed:
+    """
+    Background subscription to one server's live tally (MSG_SUBSCRIBE).
+    The thread applies pushed deltas to counts; the Tk screen only polls
+    changed and redraws the labels whose numbers moved.
+    """
+    def __init__(self, host=None, port=None):
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.counts = None       # last known tally, None until the server answered once
+        self.online = False
+        self.changed = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="results-feed", daemon=True)
+            self.thread.start()
+
+    def snapshot(self):
+        self.changed.clear()
+        with self.lock:
+            return self.online, (dict(self.counts) if self.counts is not None else None)
+
+    def _set(self, counts=None, online=True, delta=None):
+        with self.lock:
+            if counts is not None:
+                self.counts = dict(counts)
+            if delta:
+                for sign, n in delta.items():
+                    self.counts[sign] = self.counts.get(sign, 0) + n
+            self.online = online
+        self.changed.set()
+
+    def _run(self):
+        from vote_client import VoteClient, SERVER_PORT
+        while True:
+            client = VoteClient(self.host, self.port or SERVER_PORT, timeout=FEED_TIMEOUT)
+            try:
+                if client.connect():
+                    version, counts = client.subscribe_results()
+                    self._set(counts)
+                    while True:
+                        update = client.next_tally()
+                        if 'counts' in update:
+                            self._set(update['counts'])
+                        elif update.get('base') != version:
+                            break   # missed an update: subscribe again for a fresh snapshot
+                        elif update.get('delta'):
+                            self._set(delta=update['delta'])
+                        version = update.get('version', version)
+            except Exception as e:
+                print("Results feed:", e)
+            finally:
+                client.close()
+            self._set(online=False)
+            time.sleep(RECONNECT_DELAY)
+
+
+_feeds = None   # one ResultsFeed per server (per shard in a sharded deployment)
+
+
+def _results_feeds():
+    global _feeds
+    if _feeds is None:
+        import shards
+        if shards.SHARD_MAP.exists():
+            _feeds = [ResultsFeed(s['host'], s['port']) for s in shards.ShardMap.load().shards]
+        else:
+            _feeds = [ResultsFeed()]
+    for feed in _feeds:
+        feed.start()
+    return _feeds
+
+
+def _merged_snapshot(feeds):
+    """(servers online, merged counts or None until every server answered once)."""
+    online, merged = 0, {}
+    for feed in feeds:
+        up, counts = feed.snapshot()
+        online += up
+        if counts is None:
+            merged = None
+        elif merged is not None:
+            for sign, n in counts.items():
+                merged[sign] = merged.get(sign, 0) + n
+    return online, merged
+
+
 def showVotes(root,frame1):
 
-    result = df.show_result()
     root.title("Votes")
     for widget in frame1.winfo_children():
         widget.destroy()
@@ -22,38 +134,52 @@ def showVotes(root,frame1):
     Label(frame1, text="Vote Count", font=('Helvetica', 18, 'bold')).grid(row = 0, column = 1, rowspan=1)
     Label(frame1, text="").grid(row = 1,column = 0)
 
-    vote = StringVar(frame1,"-1")
-
-    bjpLogo = ImageTk.PhotoImage((Image.open("img/bjp.png")).resize((35,35),Image.LANCZOS))
-    bjpImg = Label(frame1, image=bjpLogo).grid(row = 2,column = 0)
-
-    congLogo = ImageTk.PhotoImage((Image.open("img/cong.jpg")).resize((25,38),Image.LANCZOS))
-    congImg = Label(frame1, image=congLogo).grid(row = 3,column = 0)
-
-    aapLogo = ImageTk.PhotoImage((Image.open("img/aap.png")).resize((45,30),Image.LANCZOS))
-    aapImg = Label(frame1, image=aapLogo).grid(row = 4,column = 0)
-
-    ssLogo = ImageTk.PhotoImage((Image.open("img/ss.png")).resize((40,35),Image.LANCZOS))
-    ssImg = Label(frame1, image=ssLogo).grid(row = 5,column = 0)
-
-    notaLogo = ImageTk.PhotoImage((Image.open("img/nota.jpg")).resize((35,25),Image.LANCZOS))
-    notaImg = Label(frame1, image=notaLogo).grid(row = 6,column = 0)
-
-
-    Label(frame1, text="BJP              :       ", font=('Helvetica', 12, 'bold')).grid(row = 2, column = 1)
-    Label(frame1, text=result['bjp'], font=('Helvetica', 12, 'bold')).grid(row = 2, column = 2)
-
-    Label(frame1, text=" Cong             :          ", font=('Helvetica', 12, 'bold')).grid(row = 3, column = 1)
-    Label(frame1, text=result['cong'], font=('Helvetica', 12, 'bold')).grid(row = 3, column = 2)
-
-    Label(frame1, text=" AAP               :          ", font=('Helvetica', 12, 'bold')).grid(row = 4, column = 1)
-    Label(frame1, text=result['aap'], font=('Helvetica', 12, 'bold')).grid(row = 4, column = 2)
-
-    Label(frame1, text=" Shiv Sena    :          ", font=('Helvetica', 12, 'bold')).grid(row = 5, column = 1)
-    Label(frame1, text=result['ss'], font=('Helvetica', 12, 'bold')).grid(row = 5, column = 2)
-
-    Label(frame1, text=" NOTA            :          ", font=('Helvetica', 12, 'bold')).grid(row = 6, column = 1)
-    Label(frame1, text=result['nota'], font=('Helvetica', 12, 'bold')).grid(row = 6, column = 2)
+    counts = {}
+    for row, (sign, text, img, size) in enumerate(CANDIDATES, start=2):
+        Label(frame1, image=_logo(img, size)).grid(row = row,column = 0)
+        Label(frame1, text=text, font=('Helvetica', 12, 'bold')).grid(row = row, column = 1)
+        counts[sign] = StringVar(frame1, "0")
+        Label(frame1, textvariable=counts[sign], font=('Helvetica', 12, 'bold')).grid(row = row, column = 2)
+
+    status = StringVar(frame1, "Connecting to server...")
+    Label(frame1, text="").grid(row = len(CANDIDATES) + 2,column = 0)
+    statusLabel = Label(frame1, textvariable=status)
+    statusLabel.grid(row = len(CANDIDATES) + 3, column = 0, columnspan = 3)
+
+    feeds = _results_feeds()
+
+    def show_status(online):
+        if online == len(feeds):
+            status.set("Live")
+        elif len(feeds) > 1:
+            status.set(str(online) + " of " + str(len(feeds)) + " shards reachable, counts incomplete")
+        else:
+            status.set("Server not reachable, showing last known counts")
+
+    def show(result):
+        for sign, var in counts.items():
+            value = str(result.get(sign, 0))
+            if var.get() != value:
+                var.set(value)
+
+    def refresh():
+        if not statusLabel.winfo_exists():
+            return      # screen was left
+        if any(feed.changed.is_set() for feed in feeds):
+            online, result = _merged_snapshot(feeds)
+            if result is not None:
+                show(result)
+            show_status(online)
+        root.after(REFRESH_MS, refresh)
+
+    online, result = _merged_snapshot(feeds)
+    if result is None and len(feeds) == 1:
+        # no server answer yet: start from the stored counts
+        result = df.show_result()
+    show(result or {})
+    if online:
+        show_status(online)
+    root.after(REFRESH_MS, refresh)
 
     frame1.pack()
     root.mainloop()
@@ -63,4 +189,4 @@ def showVotes(root,frame1):
 #         root = Tk()
 #         root.geometry('500x500')
 #         frame1 = Frame(root)
-#         showVotes(root,frame1)
\ No newline at end of file
+#         showVotes(root,frame1)
@@ -6,9 +6,8 @@ import os
 import numpy as np
 
 def list_templates():
-    # read voterList and show who has templates
-    v = df._read_csv_safe(Path("database")/'voterList.csv')
-    v = df._normalize_voter_df(v)
+    # read voterList (resident store, includes un-compacted journal entries)
+    v = df.list_voters()
     print("VoterID | Name | HasTemplate | TemplateFile")
     for _, row in v.iterrows():
         vid = row['voter_id']
@@ -23,13 +22,8 @@ def delete_template(voter_id):
         print("Template not found for", voter_id)
         return
     try:
-        os.remove(p)
-        # remove raw image if exists
-        raw = Path("database")/ "eye_images" / f"{voter_id}.png"
-        if raw.exists():
-            os.remove(raw)
-        # clear csv pointer
-        df.set_eye_template_filename(voter_id, '')
+        # removes template + raw image, clears the pointer and updates the eye index
+        df.delete_template_files(voter_id)
         print("Deleted template for", voter_id)
     except Exception as e:
         print("Failed to delete template:", e)
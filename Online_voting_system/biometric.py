@@ -0,0 +1,180 @@
+# biometric.py
+# Shared eye-biometric engine for register_with_eye.py, voterlogin_with_eye.py,
+# eye_gallery.py and eye_index.py.
+#
+# - one pre-configured ORB detector and Hamming BFMatcher per thread
+#   (OpenCV objects are not safe to share between threads, and building them
+#   on every call was a fixed cost on the login path)
+# - describe(images) / match_many(query, gallery) batch APIs
+# - hamming_matrix / segment_scores: the vectorized form of the ratio test,
+#   giving the same scores as match_templates for many templates at once
+# - fuse_templates: one compact enrolment template from several captures
+import threading
+
+import numpy as np
+import cv2
+
+ORB_N_FEATURES = 500
+MATCH_THRESHOLD = 10   # ~8-15 depending on camera/lighting
+RATIO = 0.75           # Lowe ratio test
+DESCRIPTOR_BYTES = 32  # ORB
+
+# multi-frame enrolment
+ENROL_FRAMES = 5            # captures fused into one template
+FUSE_RADIUS = 48            # Hamming distance at which descriptors count as the same feature
+FUSE_MIN_SUPPORT = 1        # other captures a feature must also appear in
+FUSED_MAX_DESCRIPTORS = 300
+FUSED_MIN_DESCRIPTORS = 50  # below this the fused template falls back to the best single capture
+
+_tls = threading.local()
+
+
+def detector():
+    """This thread's ORB detector."""
+    orb = getattr(_tls, 'orb', None)
+    if orb is None:
+        orb = _tls.orb = cv2.ORB_create(ORB_N_FEATURES)
+    return orb
+
+
+def matcher():
+    """This thread's Hamming brute-force matcher."""
+    bf = getattr(_tls, 'bf', None)
+    if bf is None:
+        bf = _tls.bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+    return bf
+
+# ----------------- descriptors ----------------- #
+
+def make_descriptors(img_gray):
+    """ORB descriptors of one grayscale image, or None."""
+    if img_gray is None:
+        return None
+    kps, des = detector().detectAndCompute(img_gray, None)
+    return des
+
+
+def describe(images):
+    """Descriptors for each image (None where no keypoints were found)."""
+    orb = detector()
+    return [None if img is None else orb.detectAndCompute(img, None)[1] for img in images]
+
+# ----------------- matching ----------------- #
+
+def match_templates(des1, des2):
+    """Number of des1 descriptors whose best match in des2 passes the ratio test."""
+    if des1 is None or des2 is None:
+        return 0
+    try:
+        matches = matcher().knnMatch(des1, des2, k=2)
+    except cv2.error:
+        return 0
+    good = 0
+    for m_n in matches:
+        if len(m_n) < 2:
+            continue
+        m, n = m_n
+        if m.distance < RATIO * n.distance:
+            good += 1
+    return good
+
+
+def symmetric_score(live, stored):
+    """Average of both matching directions (the 1:1 login score)."""
+    return (match_templates(live, stored) + match_templates(stored, live)) / 2.0
+
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words):
+        return np.bitwise_count(words)
+else:
+    _POP8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _POP8[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_matrix(query, block):
+    """(M, B) uint16 Hamming distances between two uint8 descriptor matrices."""
+    q = np.ascontiguousarray(query, dtype=np.uint8).view(np.uint64)
+    g = np.ascontiguousarray(block, dtype=np.uint8).view(np.uint64)
+    dist = np.zeros((q.shape[0], g.shape[0]), dtype=np.uint16)
+    for w in range(q.shape[1]):
+        dist += _popcount(q[:, w, None] ^ g[None, :, w])
+    return dist
+
+
+def segment_scores(dist, starts, lengths, ratio=RATIO):
+    """
+    Per-segment ratio-test score for a distance block whose columns are split
+    into segments at starts. A query row counts for a segment when its best
+    distance d1 there satisfies d1 < ratio * d2 for every other distance d2,
+    i.e. it is the only column with ratio * d <= d1.
+    """
+    best = np.minimum.reduceat(dist, starts, axis=1)
+    best_full = np.repeat(best, lengths, axis=1)
+    num, den = ratio.as_integer_ratio()
+    within = (dist.astype(np.uint32) * num <= best_full.astype(np.uint32) * den)
+    counts = np.add.reduceat(within.view(np.uint8), starts, axis=1, dtype=np.uint16)
+    scores = (counts == 1).sum(axis=0)
+    scores[lengths < 2] = 0      # knnMatch(k=2) yields no pair against a 1-row template
+    return scores
+
+
+def match_many(query, gallery):
+    """
+    match_templates(query, g) for every template g in gallery, in one
+    vectorized pass. Returns an int array of scores (0 for empty templates).
+    """
+    scores = np.zeros(len(gallery), dtype=np.int64)
+    if query is None or len(query) == 0:
+        return scores
+    keep = [i for i, g in enumerate(gallery) if g is not None and len(g)]
+    if not keep:
+        return scores
+    parts = [np.ascontiguousarray(gallery[i], dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES) for i in keep]
+    lengths = np.array([len(p) for p in parts])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    dist = hamming_matrix(query, np.concatenate(parts))
+    scores[keep] = segment_scores(dist, starts, lengths)
+    return scores
+
+# ----------------- enrolment ----------------- #
+
+def fuse_templates(descriptor_sets, max_descriptors=FUSED_MAX_DESCRIPTORS, radius=FUSE_RADIUS):
+    """
+    Fuse the descriptors of several captures of the same eye into one template.
+    Features are clustered across captures (Hamming distance <= radius); a
+    cluster is kept only if it also shows up in FUSE_MIN_SUPPORT or more other
+    captures, most-supported first, and is stored as the bitwise majority of its
+    members. Noise seen in a single frame is dropped and the template is capped
+    at max_descriptors, so it matches more reliably and more cheaply.
+    """
+    sets = [np.ascontiguousarray(d, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+            for d in descriptor_sets if d is not None and len(d)]
+    if not sets:
+        return None
+    if len(sets) == 1:
+        return sets[0][:max_descriptors]
+    pool = np.concatenate(sets)
+    frame = np.repeat(np.arange(len(sets)), [len(d) for d in sets])
+    close = hamming_matrix(pool, pool) <= radius
+    seen_in = np.stack([close[:, frame == f].any(axis=1) for f in range(len(sets))], axis=1)
+    support = seen_in.sum(axis=1) - 1          # captures other than its own
+
+    fused = []
+    taken = np.zeros(len(pool), dtype=bool)
+    for i in np.argsort(-support, kind='stable'):
+        if support[i] < FUSE_MIN_SUPPORT or len(fused) >= max_descriptors:
+            break
+        if taken[i]:
+            continue
+        members = close[i] & ~taken
+        taken |= members
+        bits = np.unpackbits(pool[members], axis=1)
+        fused.append(np.packbits(bits.mean(axis=0) >= 0.5))
+
+    if len(fused) < FUSED_MIN_DESCRIPTORS:
+        # captures too different to agree on: keep the richest single one
+        return max(sets, key=len)[:max_descriptors]
+    return np.array(fused, dtype=np.uint8)
@@ -0,0 +1,173 @@
+# bulk_import.py
+# Import a whole voter roll (CSV or Parquet) in one streaming pass instead of
+# calling dframe.taking_data_voter once per row.
+#
+#   python bulk_import.py roll.csv [--chunksize 50000] [--no-resume]
+#
+# - the source is read in chunks and normalized with dframe._normalize_voter_df
+#   (vectorized, the same column aliases the rest of the app accepts)
+# - each chunk's voter ids are assigned contiguously after the current last id
+# - plaintext passwords are salted and hashed (passwords.py) in a process
+#   pool before the chunk is written; this is most of the import time
+# - each chunk is appended to the active storage backend in one write
+# - progress (source rows consumed) is checkpointed around every chunk write;
+#   re-running the same command after an interruption continues where it
+#   stopped, even if voters were registered elsewhere in between
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import dframe as df
+import passwords
+
+DEFAULT_CHUNKSIZE = 50000
+
+
+def _checkpoint_path(source: Path) -> Path:
+    return df.path / f"import_{source.stem}.progress.json"
+
+
+def _source_sig(source: Path):
+    st = source.stat()
+    return {'source': str(source.resolve()), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _load_checkpoint(source: Path):
+    cp = _checkpoint_path(source)
+    if not cp.exists():
+        return None
+    try:
+        state = json.loads(cp.read_text(encoding='utf-8'))
+    except ValueError:
+        return None
+    sig = _source_sig(source)
+    if any(state.get(k) != v for k, v in sig.items()):
+        print("Source changed since the last run; starting from the beginning.")
+        return None
+    return state
+
+
+def _save_checkpoint(source: Path, rows_done, first_vid, pending=None):
+    """
+    rows_done: source rows already imported. pending: the chunk being written
+    ({'rows', 'last_vid', 'last_row'}), so a resume can tell whether it landed.
+    """
+    cp = _checkpoint_path(source)
+    state = dict(_source_sig(source), rows_done=rows_done, first_vid=first_vid, pending=pending)
+    tmp = cp.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state), encoding='utf-8')
+    os.replace(tmp, cp)
+
+
+def _read_chunks(source: Path, chunksize, skip_rows):
+    """Yield DataFrames of at most chunksize rows (all columns as str), skipping skip_rows data rows."""
+    if source.suffix.lower() in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet import needs pyarrow (pip install pyarrow)")
+        skipped = 0
+        for batch in pq.ParquetFile(str(source)).iter_batches(batch_size=chunksize):
+            # nulls to '' before str (not 'None'/'nan'); integer columns with nulls stay integers
+            chunk = batch.to_pandas(integer_object_nulls=True).astype(object).fillna('').astype(str)
+            if skipped + len(chunk) <= skip_rows:
+                skipped += len(chunk)
+                continue
+            if skipped < skip_rows:
+                chunk = chunk.iloc[skip_rows - skipped:]
+                skipped = skip_rows
+            yield chunk
+    else:
+        skip = range(1, skip_rows + 1) if skip_rows else None
+        for chunk in pd.read_csv(source, dtype=str, chunksize=chunksize, skiprows=skip):
+            yield chunk.fillna('')
+
+
+_FINGERPRINT = ('name', 'zone', 'city', 'passw')   # passw is a salted hash: unique per row
+
+
+def _landed(backend, pending):
+    """True if the chunk described by a checkpoint's pending entry is in the backend."""
+    row = backend.get_voter_row(pending['last_vid'])
+    return row is not None and all(str(row.get(c, '')) == pending['last_row'][c] for c in _FINGERPRINT)
+
+
+def _prepare_chunk(chunk: pd.DataFrame, first_vid, workers=None):
+    """Vectorized normalization + contiguous id assignment + password hashing for one chunk."""
+    out = df._normalize_voter_df(chunk).copy()
+    out['voter_id'] = np.arange(first_vid, first_vid + len(out), dtype=np.int64).astype(str)
+    out['hasVoted'] = 0
+    out['eye_template'] = ''
+    plain = out['passw'].astype(str)
+    todo = (plain != '') & ~plain.map(passwords.is_hashed)
+    if todo.any():
+        out.loc[todo, 'passw'] = passwords.hash_passwords(plain[todo].tolist(), workers)
+    return out
+
+
+def import_voter_roll(source, chunksize=DEFAULT_CHUNKSIZE, resume=True, workers=None):
+    """
+    Stream source into the active storage backend.
+    Returns (rows imported in this run, first voter id of the roll or None).
+    """
+    source = Path(source)
+    backend = df.get_backend()
+
+    rows_done = 0
+    first_vid = None
+    state = _load_checkpoint(source) if resume else None
+    if state is not None:
+        rows_done = int(state['rows_done'])
+        first_vid = state.get('first_vid')
+        pending = state.get('pending')
+        if pending and _landed(backend, pending):
+            # interrupted between the chunk write and its checkpoint
+            rows_done += int(pending['rows'])
+        _save_checkpoint(source, rows_done, first_vid)
+        print(f"Resuming {source.name} after {rows_done} rows")
+
+    imported = 0
+    last_vid = None
+    t0 = time.perf_counter()
+    for chunk in _read_chunks(source, chunksize, rows_done):
+        if chunk.empty:
+            continue
+        batch = _prepare_chunk(chunk, backend.next_voter_id(), workers)
+        if first_vid is None:
+            first_vid = int(batch['voter_id'].iloc[0])
+        last = batch.iloc[-1]
+        pending = {'rows': len(batch), 'last_vid': str(last['voter_id']),
+                   'last_row': {c: str(last[c]) for c in _FINGERPRINT}}
+        _save_checkpoint(source, rows_done, first_vid, pending)
+        backend.add_voters_bulk(batch)
+        rows_done += len(batch)
+        imported += len(batch)
+        last_vid = int(last['voter_id'])
+        _save_checkpoint(source, rows_done, first_vid)
+        elapsed = time.perf_counter() - t0
+        print(f"  {rows_done} rows ({imported / elapsed:,.0f} rows/s)")
+
+    elapsed = time.perf_counter() - t0
+    rate = imported / elapsed if elapsed > 0 else 0.0
+    print(f"Imported {imported} voters from {source.name} in {elapsed:.2f}s ({rate:,.0f} rows/s)"
+          + (f"; ids {first_vid}..{last_vid}" if last_vid is not None else ""))
+    # the checkpoint is kept: re-running a finished import is a no-op
+    return imported, (first_vid if rows_done else None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import a voter roll (CSV or Parquet)")
+    parser.add_argument('source', help='Roll file (.csv, .parquet)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='Rows per chunk')
+    parser.add_argument('--no-resume', action='store_true', help='Ignore an existing progress checkpoint')
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default=df.STORAGE_BACKEND, help='Storage backend to import into')
+    parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (default: all cores)')
+    args = parser.parse_args()
+
+    df.set_backend(args.storage)
+    import_voter_roll(args.source, args.chunksize, resume=not args.no_resume, workers=args.workers)
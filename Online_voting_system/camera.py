@@ -0,0 +1,317 @@
+# camera.py
+# Persistent eye-camera capture shared by register_with_eye.py and
+# voterlogin_with_eye.py.
+#
+# - one CameraService per camera index, opened once (in the background) and
+#   kept open; opening a booth camera costs 1-2 s, so it is no longer paid per
+#   voter
+# - a grabber thread keeps reading and holds only the newest frames in a small
+#   ring buffer, so a snapshot is never a stale buffered frame
+# - snapshot() is non-blocking: the eye box (ROI) of the newest frame in
+#   grayscale, or None if no frame has arrived yet
+# - auto-capture: while scoring is on, the grabber rates every eye box
+#   (Laplacian-variance sharpness, exposure, ORB keypoints on a half-size
+#   pyramid level) and keeps the best usable one; capture_eye_image takes it
+#   as soon as it is good enough, or the best one once AUTO_CAPTURE_BUDGET
+#   has passed, so operators no longer press 'c' and retry bad frames
+import atexit
+import threading
+import time
+from collections import deque
+
+import cv2
+
+RING_SIZE = 4
+ROI_BOX = (0.25, 0.2, 0.75, 0.8)     # x0, y0, x1, y1 as fractions of the frame
+CAMERA_OPEN_TIMEOUT = 5.0            # seconds capture_eye_image waits for a first frame
+REOPEN_AFTER_FAILURES = 30           # consecutive failed reads before reopening the device
+REOPEN_DELAY = 1.0
+
+# auto-capture / frame quality
+AUTO_CAPTURE = True
+AUTO_CAPTURE_BUDGET = 2.0      # seconds to look for the best frame
+AUTO_CAPTURE_ACCEPT = 0.9      # quality score that ends the search early
+MIN_SHARPNESS = 60.0           # Laplacian variance
+SHARPNESS_TARGET = 300.0
+MIN_KEYPOINTS = 40             # ORB keypoints on the half-size image
+KEYPOINT_TARGET = 150
+EXPOSURE_RANGE = (50, 205)     # acceptable mean gray level
+MAX_CLIPPED = 0.10             # fraction of pixels at 0-5 or 250-255
+QUALITY_ORB_FEATURES = 300
+BURST_FRAME_BUDGET = 0.6       # seconds per extra enrolment frame
+
+
+def roi_rect(frame):
+    """Pixel rectangle (x0, y0, x1, y1) of the eye box in frame."""
+    h, w = frame.shape[:2]
+    x0, y0, x1, y1 = ROI_BOX
+    return int(w * x0), int(h * y0), int(w * x1), int(h * y1)
+
+
+def roi_gray(frame):
+    """Eye box of a BGR frame, in grayscale."""
+    x0, y0, x1, y1 = roi_rect(frame)
+    roi = frame[y0:y1, x0:x1]
+    return roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+
+def frame_quality(gray, orb):
+    """
+    Rate an eye box. Returns {"sharpness", "exposure", "keypoints", "ok", "score"}
+    where ok means every gate passed and score (0..1) ranks usable frames.
+    """
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    mean = float(gray.mean())
+    clipped = float(((gray <= 5) | (gray >= 250)).mean())
+    lo, hi = EXPOSURE_RANGE
+    exposure = max(0.0, 1.0 - abs(mean - 128.0) / 128.0) * (1.0 - clipped)
+    keypoints = len(orb.detect(cv2.pyrDown(gray), None))
+    ok = (sharpness >= MIN_SHARPNESS and keypoints >= MIN_KEYPOINTS
+          and lo <= mean <= hi and clipped <= MAX_CLIPPED)
+    score = (min(sharpness / SHARPNESS_TARGET, 1.0) * min(keypoints / KEYPOINT_TARGET, 1.0)
+             * min(exposure / 0.6, 1.0))
+    return {'sharpness': sharpness, 'exposure': exposure, 'keypoints': keypoints, 'ok': ok, 'score': score}
+
+
+class CameraService:
+    def __init__(self, index):
+        self.index = index
+        self._ring = deque(maxlen=RING_SIZE)   # (seq, timestamp, frame)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self.opened = threading.Event()        # set once the device delivered a frame
+        self.failed = threading.Event()        # set if the device could not be opened
+        self._scoring = False
+        self._best = (None, None)              # (gray eye box, quality) while scoring
+        self.last_quality = None
+        self._orb = None                       # grabber thread's own detector
+        self._thread = threading.Thread(target=self._run, name=f"camera-{index}", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.index)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def _run(self):
+        cap = self._open()
+        if cap is None:
+            print(f"Camera {self.index} not available.")
+            self.failed.set()
+            return
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    failures += 1
+                    if failures >= REOPEN_AFTER_FAILURES:
+                        cap.release()
+                        time.sleep(REOPEN_DELAY)
+                        cap = self._open()
+                        if cap is None:
+                            print(f"Camera {self.index} lost.")
+                            self.failed.set()
+                            return
+                        failures = 0
+                    continue
+                failures = 0
+                with self._cond:
+                    self._seq += 1
+                    self._ring.append((self._seq, time.monotonic(), frame))
+                    self._cond.notify_all()
+                self.opened.set()
+                if self._scoring:
+                    self._score(frame)
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def _score(self, frame):
+        if self._orb is None:
+            self._orb = cv2.ORB_create(QUALITY_ORB_FEATURES)
+        gray = roi_gray(frame)
+        q = frame_quality(gray, self._orb)
+        with self._cond:
+            self.last_quality = q
+            if q['ok'] and (self._best[1] is None or q['score'] > self._best[1]['score']):
+                self._best = (gray, q)
+
+    def start_scoring(self):
+        """Rate every new frame in the grabber and remember the best usable one."""
+        with self._cond:
+            self._best = (None, None)
+            self.last_quality = None
+            self._scoring = True
+
+    def stop_scoring(self):
+        self._scoring = False
+
+    def best(self):
+        """(gray eye box, quality) of the best usable frame since start_scoring, or (None, None)."""
+        with self._cond:
+            return self._best
+
+    def auto_capture(self, budget=AUTO_CAPTURE_BUDGET, accept=AUTO_CAPTURE_ACCEPT):
+        """
+        Headless auto-capture: wait up to budget seconds (after the camera is
+        ready) for a frame scoring >= accept; returns the best usable eye box
+        seen, or None.
+        """
+        if not self.wait_ready():
+            return None
+        self.start_scoring()
+        try:
+            deadline = time.monotonic() + budget
+            while time.monotonic() < deadline:
+                gray, q = self.best()
+                if q is not None and q['score'] >= accept:
+                    break
+                time.sleep(0.02)
+            return self.best()[0]
+        finally:
+            self.stop_scoring()
+
+    def wait_ready(self, timeout=CAMERA_OPEN_TIMEOUT):
+        """Block until the first frame arrives; False if the camera failed or timed out."""
+        deadline = time.monotonic() + timeout
+        while not self.opened.is_set() and not self.failed.is_set():
+            if time.monotonic() >= deadline:
+                return False
+            self.opened.wait(0.05)
+        return self.opened.is_set()
+
+    def latest(self):
+        """(frame, seq) of the newest BGR frame, or (None, 0)."""
+        with self._cond:
+            if not self._ring:
+                return None, 0
+            seq, _, frame = self._ring[-1]
+            return frame, seq
+
+    def frames(self):
+        """Snapshot of the ring buffer as [(seq, timestamp, frame)], oldest first."""
+        with self._cond:
+            return list(self._ring)
+
+    def wait_newer(self, seq, timeout=1.0):
+        """Wait for a frame newer than seq; returns (frame, seq) or (None, seq) on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq or self._stop.is_set(), timeout)
+            if self._seq > seq and self._ring:
+                s, _, frame = self._ring[-1]
+                return frame, s
+            return None, seq
+
+    def snapshot(self):
+        """Grayscale eye box of the newest frame, or None (never blocks)."""
+        frame, _ = self.latest()
+        return None if frame is None else roi_gray(frame)
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=2)
+
+
+_cameras = {}
+_cameras_lock = threading.Lock()
+
+
+def get_camera(index=0):
+    """Shared CameraService for index (opened in the background on first use)."""
+    try:
+        index = int(index)
+    except (TypeError, ValueError):
+        index = 0
+    with _cameras_lock:
+        cam = _cameras.get(index)
+        if cam is None or cam.failed.is_set():
+            cam = _cameras[index] = CameraService(index)
+        return cam
+
+
+def release_all():
+    with _cameras_lock:
+        cams = list(_cameras.values())
+        _cameras.clear()
+    for cam in cams:
+        cam.close()
+
+atexit.register(release_all)
+
+
+def capture_eye_image(camera_index=0, window_name="Capture Eye - press 'c' to capture, 'q' to cancel", auto=None):
+    """
+    Preview camera_index with the eye box and return a grayscale eye box, or None if cancelled.
+    With auto (default AUTO_CAPTURE) the best-rated frame is taken by itself: as soon as
+    one scores AUTO_CAPTURE_ACCEPT, else the best usable one after AUTO_CAPTURE_BUDGET
+    (the preview keeps running until a usable frame shows up). 'c' captures at once.
+    """
+    auto = AUTO_CAPTURE if auto is None else auto
+    cam = get_camera(camera_index)
+    if not cam.wait_ready():
+        if not cam.failed.is_set():
+            print(f"Camera {cam.index} did not deliver a frame in time.")
+        return None
+    captured = None
+    shown = 0
+    deadline = time.monotonic() + AUTO_CAPTURE_BUDGET
+    if auto:
+        cam.start_scoring()
+    try:
+        while True:
+            frame, seq = cam.latest()
+            if cam.failed.is_set() or frame is None:
+                break
+            if auto:
+                best, q = cam.best()
+                if q is not None and (q['score'] >= AUTO_CAPTURE_ACCEPT or time.monotonic() >= deadline):
+                    captured = best
+                    print(f"Auto-captured: sharpness {q['sharpness']:.0f}, keypoints {q['keypoints']}, score {q['score']:.2f}")
+                    break
+            if seq != shown:
+                shown = seq
+                view = frame.copy()
+                x0, y0, x1, y1 = roi_rect(view)
+                cv2.rectangle(view, (x0, y0), (x1, y1), (255,255,255), 2)
+                hint = "Hold still - capturing automatically" if auto else "Press 'c' to capture"
+                cv2.putText(view, f"Cam {cam.index} - Place eye in box. {hint}, 'q' to cancel.", (10,30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 1)
+                q = cam.last_quality
+                if auto and q is not None:
+                    cv2.putText(view, f"sharp {q['sharpness']:.0f}  kp {q['keypoints']}  exp {q['exposure']:.2f}", (10,55),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,255,0) if q['ok'] else (0,0,255), 1)
+                cv2.imshow(window_name, view)
+            k = cv2.waitKey(10) & 0xFF
+            if k == ord('c'):
+                captured = cam.best()[0] if auto and cam.best()[0] is not None else cam.snapshot()
+                break
+            elif k == ord('q'):
+                break
+    finally:
+        cam.stop_scoring()
+    cv2.destroyWindow(window_name)
+    return captured
+
+
+def capture_eye_burst(camera_index=0, count=5, window_name="Capture Eye - press 'c' to capture, 'q' to cancel"):
+    """
+    Enrolment capture: the first eye box comes from capture_eye_image, then up
+    to count - 1 more usable ones are auto-captured from the following frames.
+    Returns a list of grayscale eye boxes (empty if cancelled).
+    """
+    first = capture_eye_image(camera_index, window_name)
+    if first is None:
+        return []
+    images = [first]
+    cam = get_camera(camera_index)
+    for _ in range(count - 1):
+        img = cam.auto_capture(budget=BURST_FRAME_BUDGET, accept=2.0)   # >1: use the whole budget, keep the best
+        if img is not None:
+            images.append(img)
+    return images
@@ -8,10 +8,14 @@ from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
-try:
-    import keyring
-except Exception:
-    keyring = None
+
+def _keyring():
+    """The keyring module (slow to import: it probes every backend), or None."""
+    try:
+        import keyring
+    except Exception:
+        return None
+    return keyring
 
 
 # ---------------------------
@@ -38,6 +42,7 @@ def store_key_in_keyring(service: str, username: str, key: bytes) -> bool:
     Store base64(key) in OS keyring (Windows Credential Manager, macOS Keychain,
     Linux Secret Service).
     """
+    keyring = _keyring()
     if keyring is None:
         return False
     try:
@@ -50,6 +55,7 @@ def store_key_in_keyring(service: str, username: str, key: bytes) -> bool:
 
 def get_key_from_keyring(service: str, username: str) -> Optional[bytes]:
     """Retrieve master AES key from OS keyring."""
+    keyring = _keyring()
     if keyring is None:
         return None
     try:
@@ -78,21 +84,23 @@ def derive_key_from_passphrase(passphrase: str, salt: bytes, iterations: int = 2
 #  AES-GCM ENCRYPT / DECRYPT
 # ---------------------------
 
-def encrypt_bytes_aes_gcm(key: bytes, plaintext: bytes) -> Tuple[bytes, bytes]:
+def encrypt_bytes_aes_gcm(key: bytes, plaintext: bytes, associated_data: Optional[bytes] = None) -> Tuple[bytes, bytes]:
     """
     AES-GCM encryption.
     Returns (nonce, ciphertext).
     Nonce is 12 bytes (recommended size for AES-GCM).
+    associated_data is authenticated but not encrypted (e.g. the voter id a
+    record belongs to); decryption must pass the same bytes.
     """
     nonce = secrets.token_bytes(12)
     aesgcm = AESGCM(key)
-    ciphertext = aesgcm.encrypt(nonce, plaintext, associated_data=None)
+    ciphertext = aesgcm.encrypt(nonce, plaintext, associated_data=associated_data)
     return nonce, ciphertext
 
 
-def decrypt_bytes_aes_gcm(key: bytes, nonce: bytes, ciphertext: bytes) -> bytes:
+def decrypt_bytes_aes_gcm(key: bytes, nonce: bytes, ciphertext: bytes, associated_data: Optional[bytes] = None) -> bytes:
     """
     AES-GCM decryption (raises exception if authentication fails).
     """
     aesgcm = AESGCM(key)
-    return aesgcm.decrypt(nonce, ciphertext, associated_data=None)
+    return aesgcm.decrypt(nonce, ciphertext, associated_data=associated_data)
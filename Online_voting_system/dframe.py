@@ -4,17 +4,19 @@ from pathlib import Path
 import numpy as np
 import json
 import os
-
-# optional image save libraries (used only if raw_image is provided)
-try:
-    import cv2
-except Exception:
-    cv2 = None
-
-try:
-    import imageio
-except Exception:
-    imageio = None
+import abc
+import atexit
+import contextlib
+import itertools
+import struct
+import threading
+import time
+import zlib
+
+import passwords
+from passwords import VerifyCache
+from template_cache import TemplateCache
+from lazy_imports import optional_import
 
 # --- CONFIG --- #
 # adjust this path if your database folder is elsewhere
@@ -32,6 +34,12 @@ CAND_COLS  = ['sign', 'Name', 'Vote Count']
 # subfolders for biometric artifacts (inside database/)
 EYE_TEMPLATES_DIR = path / "eye_templates"
 EYE_IMAGES_DIR    = path / "eye_images"
+EYE_INDEX_DIR     = path / "eye_index"     # 1:N identification index (eye_index.py)
+EYE_TEMPLATE_PACK = path / "eye_templates.pack"   # packed store (template_store.py)
+
+# "files": one <vid>.enc/.npz per voter; "packed": template_store.py;
+# "auto": packed once eye_templates.pack exists (python template_store.py --migrate)
+EYE_TEMPLATE_STORE = "auto"
 
 # Encryption settings
 USE_ENCRYPTION = True   # set False to always use plaintext .npz files
@@ -117,7 +125,10 @@ def _normalize_voter_df(df: pd.DataFrame) -> pd.DataFrame:
 def _write_voter_df(df: pd.DataFrame):
     p = path / 'voterList.csv'
     _ensure_dir()
-    df.to_csv(p, index=False)
+    # write to a temp file first so a crash never leaves a half-written roll
+    tmp = p.with_suffix('.csv.tmp')
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, p)
 
 def _ensure_voter_file():
     p = path / 'voterList.csv'
@@ -125,17 +136,485 @@ def _ensure_voter_file():
     if not p.exists() or p.stat().st_size == 0:
         pd.DataFrame(columns=VOTER_COLS).to_csv(p, index=False)
 
-# ----------------- Public (existing) functions ----------------- #
+def _lock_file(fh, wait):
+    """Exclusive OS lock on the open file fh; raises OSError if wait is False and it is held."""
+    if os.name == 'nt':
+        import msvcrt
+        fh.seek(0)
+        while True:
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if not wait:
+                    raise
+                time.sleep(0.05)
+    else:
+        import fcntl
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+
+def _unlock_file(fh):
+    if os.name == 'nt':
+        import msvcrt
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+# ----------------- Resident voter store ----------------- #
+# voterList.csv is parsed once into an in-memory index keyed by voter_id.
+# Mutations are appended to a write-behind journal (one JSON object per line)
+# and only folded back into the CSV when the journal grows past
+# VOTER_JOURNAL_COMPACT_EVERY entries, on flush_voters() or at exit.
+# Several processes share the roll (Server, Admin, a second homePage window):
+# every change to voterList.csv or the journal is made under _roll_lock(),
+# which also locks VOTER_STORE_LOCK and first catches up with the other
+# processes' journal entries, so none of them is written over or dropped.
+
+VOTER_JOURNAL = path / 'voterList.journal'
+VOTER_STORE_LOCK = path / 'voterList.lock'
+VOTER_JOURNAL_COMPACT_EVERY = 5000
+
+_voter_index = None      # dict: voter_id (str) -> row dict (canonical columns)
+_voter_sig = None        # on-disk signature the index was built from
+_journal_entries = 0
+_journal_size = 0        # journal bytes already applied to _voter_index
+_journal_dirty = False   # True once this process appended to the journal
+_roll_fh = None          # open VOTER_STORE_LOCK while this process holds it
+_roll_depth = 0
+
+# Locking: _store_lock guards whole-store operations (reload, journal, compaction).
+# A ballot only takes the stripe lock of its voter (check-and-set of hasVoted plus
+# the ledger append) and the short _ledger_lock inside it. Whole-store operations
+# take every stripe via _exclusive(). Order: _store_lock -> stripes -> _ledger_lock.
+VOTER_LOCK_STRIPES = 64
+_store_lock = threading.RLock()
+_voter_locks = [threading.RLock() for _ in range(VOTER_LOCK_STRIPES)]
+_ledger_lock = threading.Lock()
+
+def _stripe_of(voter_id):
+    return hash(str(voter_id)) % VOTER_LOCK_STRIPES
+
+def _voter_lock(voter_id):
+    return _voter_locks[_stripe_of(voter_id)]
+
+@contextlib.contextmanager
+def _exclusive():
+    """Hold the store lock and every voter stripe (no ballot can be in flight)."""
+    with _store_lock, contextlib.ExitStack() as stack:
+        for lk in _voter_locks:
+            stack.enter_context(lk)
+        yield
+
+@contextlib.contextmanager
+def _roll_file():
+    """Hold _store_lock and the cross-process VOTER_STORE_LOCK (re-entrant)."""
+    global _roll_fh, _roll_depth
+    with _store_lock:
+        if _roll_depth == 0:
+            _ensure_dir()
+            fh = open(VOTER_STORE_LOCK, 'a+b')
+            try:
+                _lock_file(fh, wait=True)
+            except BaseException:
+                fh.close()
+                raise
+            _roll_fh = fh
+        _roll_depth += 1
+        try:
+            yield
+        finally:
+            _roll_depth -= 1
+            if _roll_depth == 0:
+                fh, _roll_fh = _roll_fh, None
+                try:
+                    _unlock_file(fh)
+                finally:
+                    fh.close()
+
+@contextlib.contextmanager
+def _roll_lock():
+    """
+    _roll_file() with the resident index caught up with the files on entry.
+    Changes to the index are made inside it, after reading the index there.
+    """
+    with _roll_file():
+        if _roll_depth == 1:
+            _refresh()
+        yield
 
-def count_reset():
-    """Reset hasVoted in voterList and Vote Count in cand_list."""
+def _stat_sig(p: Path):
+    try:
+        st = p.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _voter_files_sig():
+    """
+    Cheap signature of the on-disk state the resident index was built from.
+    The ballot ledger is not part of it: ledger growth is applied incrementally.
+    """
+    return (_stat_sig(path / 'voterList.csv'), _stat_sig(VOTER_JOURNAL),
+            _stat_sig(path / 'cand_list.csv'), _stat_sig(TALLY_SNAPSHOT))
+
+def _load_state():
+    """
+    Parse voterList.csv and the tally base once, then replay the voter journal
+    and the ballot ledger on top of them.
+    """
+    global _voter_index, _voter_sig, _journal_entries, _journal_size
     _ensure_voter_file()
+    df_v = _normalize_voter_df(_read_csv_safe(path / 'voterList.csv'))
+    index = {}
+    for row in df_v.to_dict('records'):
+        row['voter_id'] = str(row['voter_id'])
+        index[row['voter_id']] = row
+
+    entries = good = 0
+    if VOTER_JOURNAL.exists():
+        good = 0
+        with open(VOTER_JOURNAL, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line after a crash; everything before it is valid
+                    break
+                _apply_journal_entry(index, entry)
+                entries += 1
+                good += len(line)
+        if good != VOTER_JOURNAL.stat().st_size:
+            with open(VOTER_JOURNAL, 'r+b') as f:
+                f.truncate(good)
+
+    _voter_index = index
+    _journal_entries = entries
+    _journal_size = good
+    _load_tally_base()
+    _read_ledger_tail()
+    _voter_sig = _voter_files_sig()
+
+def _apply_journal_entry(index, entry):
+    op = entry.get('op')
+    if op == 'add':
+        row = dict(entry['row'])
+        index[str(row['voter_id'])] = row
+    elif op == 'set':
+        row = index.get(str(entry['voter_id']))
+        if row is not None:
+            row.update(entry['fields'])
+
+def _refresh():
+    """Load the resident state, or catch up with changes made by another process."""
+    if _voter_index is None or _voter_files_sig() != _voter_sig:
+        with _exclusive(), _roll_file():
+            if _voter_index is None or _voter_files_sig() != _voter_sig:
+                _load_state()
+    elif _ledger_size() > _ledger_seen:
+        with _store_lock:
+            _read_ledger_tail()
+
+def _voters():
+    """Return the resident voter index (dict voter_id -> row)."""
+    _refresh()
+    return _voter_index
+
+def _journal_append(entry):
+    """
+    Persist one mutation (write-behind) and compact when the journal is large.
+    The caller holds _roll_lock() and has already applied entry to the index.
+    """
+    global _voter_sig, _journal_entries, _journal_size, _journal_dirty
+    with _roll_lock():
+        with open(VOTER_JOURNAL, 'ab') as f:
+            f.write((json.dumps(entry) + '\n').encode('utf-8'))
+            _journal_size = f.tell()
+        _journal_entries += 1
+        _journal_dirty = True
+        _voter_sig = _voter_files_sig()
+        if _journal_entries >= VOTER_JOURNAL_COMPACT_EVERY:
+            _compact_voters()
+
+def _compact_voters():
+    """Rewrite voterList.csv from the resident index and drop the journal entries it now holds."""
+    global _voter_sig, _journal_entries, _journal_size, _journal_dirty
+    with _roll_lock():
+        if _voter_index is None:
+            return
+        _write_voter_df(pd.DataFrame(list(_voter_index.values()), columns=VOTER_COLS))
+        if VOTER_JOURNAL.exists():
+            with open(VOTER_JOURNAL, 'rb') as f:
+                f.seek(_journal_size)
+                rest = f.read()
+            if rest:
+                # never the case under the lock, but only what the CSV holds may go
+                tmp = VOTER_JOURNAL.with_suffix('.tmp')
+                tmp.write_bytes(rest)
+                os.replace(tmp, VOTER_JOURNAL)
+            else:
+                VOTER_JOURNAL.unlink()
+        _journal_entries = 0
+        _journal_size = 0
+        _journal_dirty = False
+        _voter_sig = _voter_files_sig()
+
+def flush_voters():
+    """Fold this process's pending journal entries into voterList.csv."""
+    with _store_lock:
+        if _voter_index is not None and _journal_dirty:
+            _compact_voters()
+
+# ----------------- Ballot ledger ----------------- #
+# Every accepted ballot is one fixed-size record appended to ballots.ledger;
+# nothing is rewritten per vote. Tallies are kept in memory as
+# tally_snapshot.json (counts up to a ledger offset) plus the ledger tail.
+# compact_ledger() advances the snapshot and writes the counts back into
+# cand_list.csv. On load the ledger tail is replayed, so hasVoted and the
+# counts survive a crash even if the CSVs were never rewritten.
+# One process appends (it holds ballots.ledger.lock while the ledger is open
+# for writing); any number of others may read and replay it.
+
+BALLOT_LEDGER = path / 'ballots.ledger'
+LEDGER_WRITER_LOCK = path / 'ballots.ledger.lock'
+TALLY_SNAPSHOT = path / 'tally_snapshot.json'
+LEDGER_FSYNC_EVERY = 32        # fsync after this many ballots ...
+LEDGER_FSYNC_INTERVAL = 0.5    # ... or this many seconds, whichever comes first
+LEDGER_SNAPSHOT_EVERY = 10000  # ballots between automatic tally snapshots
+
+# record: voter_id, sign (NUL padded), cast time (ns since epoch), crc32 of the preceding fields
+_BALLOT = struct.Struct('<Q16sqI')
+_BALLOT_BODY = struct.Struct('<Q16sq')
+SIGN_MAX_BYTES = 16      # longest candidate sign (UTF-8) a ballot record holds
+
+TALLY_SHARDS = 16
+
+class _ShardedTally:
+    """
+    Candidate counters split into shards: each thread increments its own shard,
+    so concurrent ballots never contend on one counter. Reads merge the shards.
+    """
+    _slots = threading.local()
+    _next_slot = itertools.count()
+
+    def __init__(self, base, shards=TALLY_SHARDS):
+        self.base = dict(base)
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def __contains__(self, sign):
+        return sign in self.base
+
+    def add(self, sign, n=1):
+        slot = getattr(self._slots, 'slot', None)
+        if slot is None:
+            slot = self._slots.slot = next(self._next_slot)
+        counts, lock = self._shards[slot % len(self._shards)]
+        with lock:
+            counts[sign] = counts.get(sign, 0) + n
+
+    def counts(self):
+        merged = dict(self.base)
+        for counts, lock in self._shards:
+            with lock:
+                for sign, n in counts.items():
+                    merged[sign] += n
+        return merged
+
+_cand_signs = []         # candidate signs in cand_list.csv order
+_tally = _ShardedTally({})   # sign -> count (snapshot + ledger tail)
+_ledger_seen = 0         # ledger bytes already folded into _tally / hasVoted
+_snapshot_offset = 0     # ledger offset covered by the snapshot
+_ledger_fh = None        # append handle, opened by the first vote in this process
+_ledger_writer = None    # open LEDGER_WRITER_LOCK, held for the life of the process
+_unsynced = 0
+_last_fsync = 0.0
+
+def _pack_ballot(vid, sign):
+    sign = str(sign).encode('utf-8')
+    if len(sign) > SIGN_MAX_BYTES:
+        # '16s' would cut it, and the replayed ballot would match no candidate
+        raise ValueError(f"candidate sign longer than {SIGN_MAX_BYTES} bytes: {sign!r}")
+    body = _BALLOT_BODY.pack(int(vid), sign, time.time_ns())
+    return body + struct.pack('<I', zlib.crc32(body))
+
+def _load_tally_base():
+    """Load candidate signs and the tally base (snapshot if present, else cand_list.csv)."""
+    global _cand_signs, _tally, _ledger_seen, _snapshot_offset
+    df_c = _read_csv_safe(path / 'cand_list.csv')
+    if df_c.empty or 'sign' not in df_c.columns:
+        signs, counts = [], {}
+    else:
+        signs = [str(s) for s in df_c['sign']]
+        if 'Vote Count' in df_c.columns:
+            vc = pd.to_numeric(df_c['Vote Count'], errors='coerce').fillna(0).astype(int)
+        else:
+            vc = [0] * len(signs)
+        counts = dict(zip(signs, (int(c) for c in vc)))
+    too_long = [s for s in signs if len(s.encode('utf-8')) > SIGN_MAX_BYTES]
+    if too_long:
+        print(f"Warning: candidate signs longer than {SIGN_MAX_BYTES} bytes cannot receive ballots:", too_long)
+
+    offset = 0
+    if TALLY_SNAPSHOT.exists():
+        try:
+            snap = json.loads(TALLY_SNAPSHOT.read_text(encoding='utf-8'))
+            offset = int(snap.get('offset', 0))
+            counts = {s: int(snap.get('counts', {}).get(s, 0)) for s in signs}
+        except (ValueError, OSError) as e:
+            print("Warning: unreadable tally snapshot, using cand_list.csv:", e)
+            offset = 0
+
+    _cand_signs = signs
+    _tally = _ShardedTally({s: counts.get(s, 0) for s in signs})
+    _snapshot_offset = offset
+    _ledger_seen = offset
+
+def _ledger_size():
+    try:
+        return BALLOT_LEDGER.stat().st_size
+    except OSError:
+        return 0
+
+def _read_ledger_tail():
+    """Fold complete ballot records after _ledger_seen into the tally and voter index."""
+    with _ledger_lock:
+        _read_ledger_tail_locked()
+
+def _read_ledger_tail_locked():
+    global _ledger_seen
+    size = _ledger_size()
+    if size <= _ledger_seen:
+        return
+    with open(BALLOT_LEDGER, 'rb') as f:
+        f.seek(_ledger_seen)
+        data = f.read(size - _ledger_seen)
+    usable = len(data) - len(data) % _BALLOT.size
+    for vid, sign, _ts, crc in _BALLOT.iter_unpack(data[:usable]):
+        body = _BALLOT_BODY.pack(vid, sign, _ts)
+        if zlib.crc32(body) != crc:
+            # torn/corrupt record: stop here, the writer truncates it on open
+            break
+        sign = sign.rstrip(b'\0').decode('utf-8')
+        if sign in _tally:
+            _tally.add(sign)
+        row = _voter_index.get(str(vid)) if _voter_index is not None else None
+        if row is not None:
+            row['hasVoted'] = 1
+        _ledger_seen += _BALLOT.size
+
+def lock_ledger_writer():
+    """
+    Take LEDGER_WRITER_LOCK for this process (released when it exits).
+    _ledger_seen is this process's view of the ledger end, so a second
+    appending process would make both replay and compaction skip ballots.
+    """
+    global _ledger_writer
+    if _ledger_writer is not None:
+        return
+    fh = open(LEDGER_WRITER_LOCK, 'a+b')
+    try:
+        _lock_file(fh, wait=False)
+    except OSError:
+        fh.close()
+        raise RuntimeError(f"{BALLOT_LEDGER} is already being written by another process "
+                           "(one vote server per data directory)")
+    _ledger_writer = fh
+
+def _ledger_file():
+    """
+    Return the append handle (caller holds _ledger_lock and has just refreshed),
+    truncating a torn tail left by a crash.
+    """
+    global _ledger_fh, _last_fsync
+    if _ledger_fh is None:
+        _ensure_dir()
+        lock_ledger_writer()
+        _read_ledger_tail_locked()
+        if _ledger_size() > _ledger_seen:
+            with open(BALLOT_LEDGER, 'r+b') as f:
+                f.truncate(_ledger_seen)
+        _ledger_fh = open(BALLOT_LEDGER, 'ab')
+        _last_fsync = time.monotonic()
+    return _ledger_fh
+
+def _ledger_append(records: bytes, count: int, durable=False):
+    """
+    Append packed ballots; fsync in batches of LEDGER_FSYNC_EVERY / LEDGER_FSYNC_INTERVAL,
+    or right away if durable is True.
+    """
+    global _ledger_seen, _unsynced, _last_fsync
+    with _ledger_lock:
+        fh = _ledger_file()
+        fh.write(records)
+        fh.flush()
+        _ledger_seen = fh.tell()
+        _unsynced += count
+        if durable or _unsynced >= LEDGER_FSYNC_EVERY or time.monotonic() - _last_fsync >= LEDGER_FSYNC_INTERVAL:
+            os.fsync(fh.fileno())
+            _unsynced = 0
+            _last_fsync = time.monotonic()
+
+def _maybe_snapshot():
+    if (_ledger_seen - _snapshot_offset) // _BALLOT.size >= LEDGER_SNAPSHOT_EVERY:
+        compact_ledger()
+
+def sync_ledger():
+    """Force pending ballots to disk."""
+    global _unsynced, _last_fsync
+    with _ledger_lock:
+        if _ledger_fh is not None and _unsynced:
+            _ledger_fh.flush()
+            os.fsync(_ledger_fh.fileno())
+            _unsynced = 0
+            _last_fsync = time.monotonic()
+
+def compact_ledger():
+    """
+    Write a tally snapshot at the current ledger offset.
+    hasVoted is flushed to voterList.csv first and the counts are mirrored into
+    cand_list.csv, so everything before the snapshot offset is in the CSVs.
+    """
+    global _snapshot_offset, _voter_sig
+    with _roll_lock(), _exclusive():
+        _refresh()
+        sync_ledger()
+        _compact_voters()
+
+        counts = _tally.counts()
+        cfile = path / 'cand_list.csv'
+        df_c = _read_csv_safe(cfile)
+        if not df_c.empty and 'sign' in df_c.columns:
+            df_c['Vote Count'] = [counts.get(str(s), 0) for s in df_c['sign']]
+            df_c.to_csv(cfile, index=False)
+
+        tmp = TALLY_SNAPSHOT.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'offset': _ledger_seen, 'counts': counts}), encoding='utf-8')
+        os.replace(tmp, TALLY_SNAPSHOT)
+        _snapshot_offset = _ledger_seen
+        _voter_sig = _voter_files_sig()
+
+def _shutdown_store():
+    with _store_lock:
+        if _ledger_fh is not None and _ledger_seen > _snapshot_offset:
+            compact_ledger()
+        else:
+            flush_voters()
+
+atexit.register(_shutdown_store)
+
+# ----------------- CSV backend ----------------- #
+# Implementations behind CsvBackend (see "Storage backends" at the end of
+# this module); callers use the public wrappers defined there.
+
+def _csv_count_reset():
+    """Reset hasVoted in voterList and Vote Count in cand_list (and empty the ballot ledger)."""
     # voters
-    vfile = path/'voterList.csv'
-    df_v = _read_csv_safe(vfile)
-    df_v = _normalize_voter_df(df_v)
-    df_v['hasVoted'] = 0
-    _write_voter_df(df_v)
+    with _roll_lock(), _exclusive():
+        for row in _voters().values():
+            row['hasVoted'] = 0
+        _compact_voters()
+        _reset_ledger()
 
     # candidates
     cfile = path/'cand_list.csv'
@@ -152,150 +631,236 @@ def count_reset():
     df_c.to_csv(cfile, index=False)
 
 
-def reset_voter_list():
+def _reset_ledger():
+    """Zero the tally snapshot, then drop all ledger records."""
+    global _ledger_fh, _unsynced, _voter_index
+    with _exclusive(), _ledger_lock:
+        _ensure_dir()
+        if _ledger_fh is not None:
+            _ledger_fh.close()
+            _ledger_fh = None
+            _unsynced = 0
+        tmp = TALLY_SNAPSHOT.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'offset': 0, 'counts': {}}), encoding='utf-8')
+        os.replace(tmp, TALLY_SNAPSHOT)
+        if BALLOT_LEDGER.exists():
+            with open(BALLOT_LEDGER, 'r+b') as f:
+                f.truncate(0)
+        # force a full reload on next access
+        _voter_index = None
+
+
+def _csv_reset_voter_list():
     """Replace voterList.csv with empty file (canonical headers)."""
-    _ensure_dir()
-    pd.DataFrame(columns=VOTER_COLS).to_csv(path/'voterList.csv', index=False)
+    with _roll_lock(), _exclusive():
+        _voters().clear()
+        _compact_voters()
 
 
-def reset_cand_list():
+def _csv_reset_cand_list():
     _ensure_dir()
     pd.DataFrame(columns=CAND_COLS).to_csv(path/'cand_list.csv', index=False)
+    _reset_ledger()
 
 
-def verify(vid, passw):
+def _csv_verify(vid, passw):
     """
-    Return True if (voter_id, passw) match a row.
-    passw is compared exactly to stored value (no hashing here).
+    Return True if (voter_id, passw) match a row: passw is checked against the
+    stored salted hash (or the plaintext of a row not yet migrated).
     """
-    df = _read_csv_safe(path/'voterList.csv')
-    if df.empty:
-        return False
-    df = _normalize_voter_df(df)
-    matched = df[(df['voter_id'].astype(str) == str(vid)) & (df['passw'].astype(str) == str(passw))]
-    return not matched.empty
+    row = _voters().get(str(vid))
+    return row is not None and passwords.check_password(row['passw'], passw)
 
 
-def isEligible(vid):
+def _csv_isEligible(vid):
     """
     True if voter exists and hasVoted == 0
     """
-    df = _read_csv_safe(path/'voterList.csv')
-    if df.empty:
-        return False
-    df = _normalize_voter_df(df)
-    row = df[df['voter_id'].astype(str) == str(vid)]
-    if row.empty:
+    row = _voters().get(str(vid))
+    if row is None:
         return False
-    return int(row['hasVoted'].iloc[0]) == 0
+    return int(row['hasVoted']) == 0
 
 
-def vote_update(sign, vid):
+def _csv_vote_update(sign, vid):
     """
-    Increment candidate Vote Count where Sign==sign and mark voter hasVoted=1.
-    Returns True on success.
+    Record a ballot for sign and mark voter hasVoted=1.
+    The ballot is a single append to the ledger; the tally is updated in memory.
+    Only this voter's lock stripe is held, so ballots of different voters proceed
+    concurrently. Returns True on success.
     """
-    # check eligibility first
-    if not isEligible(vid):
+    key, sign = str(vid), str(sign)
+    # check eligibility first (cheap, unlocked pre-check)
+    voters = _voters()
+    if key not in voters or sign not in _tally:
         return False
-
-    # update candidate file
-    cfile = path/'cand_list.csv'
-    df_c = _read_csv_safe(cfile)
-    if df_c.empty:
-        return False
-    # ensure Vote Count col
-    if 'Vote Count' not in df_c.columns:
-        df_c['Vote Count'] = 0
-    df_c['Vote Count'] = pd.to_numeric(df_c['Vote Count'], errors='coerce').fillna(0).astype(int)
-
-    mask = df_c['sign'].astype(str) == str(sign)
-    if not mask.any():
+    try:
+        record = _pack_ballot(vid, sign)
+    except (ValueError, struct.error):
         return False
 
-    df_c.loc[mask, 'Vote Count'] = df_c.loc[mask, 'Vote Count'] + 1
-    df_c.to_csv(cfile, index=False)
-
-    # mark voter hasVoted
-    vfile = path/'voterList.csv'
-    df_v = _read_csv_safe(vfile)
-    df_v = _normalize_voter_df(df_v)
-    voter_mask = df_v['voter_id'].astype(str) == str(vid)
-    if not voter_mask.any():
-        return False
-    df_v.loc[voter_mask, 'hasVoted'] = 1
-    _write_voter_df(df_v)
+    with _voter_lock(key):
+        # re-read under the stripe: atomic check-and-set of hasVoted
+        row = (_voter_index or {}).get(key)
+        if row is None or int(row['hasVoted']) != 0:
+            return False
+        _ledger_append(record, 1)
+        row['hasVoted'] = 1
+        _tally.add(sign)
+    _maybe_snapshot()
     return True
 
 
-def show_result():
-    """Return dict Sign -> Vote Count (int)."""
-    cfile = path/'cand_list.csv'
-    df_c = _read_csv_safe(cfile)
-    if df_c.empty or 'sign' not in df_c.columns or 'Vote Count' not in df_c.columns:
-        return {}
-    df_c['Vote Count'] = pd.to_numeric(df_c['Vote Count'], errors='coerce').fillna(0).astype(int)
-    return { str(r['sign']): int(r['Vote Count']) for _, r in df_c.iterrows() }
-
-
-def taking_data_voter(name, gender, zone, city, passw, age=18):
+def _csv_vote_update_many(ballots):
+    """
+    Group commit: apply a batch of (sign, vid) ballots with one ledger write and
+    one fsync. Returns a list of booleans (same order as ballots); a voter that
+    appears twice in the batch only gets the first ballot.
+    """
+    _voters()
+    results = [False] * len(ballots)
+    stripes = sorted({_stripe_of(vid) for _, vid in ballots})
+    with contextlib.ExitStack() as stack:
+        # every stripe involved, in a fixed order, so batches never deadlock each other
+        for i in stripes:
+            stack.enter_context(_voter_locks[i])
+
+        accepted = []   # (index, row, sign)
+        records = []
+        for i, (sign, vid) in enumerate(ballots):
+            key, sign = str(vid), str(sign)
+            row = (_voter_index or {}).get(key)
+            if row is None or int(row['hasVoted']) != 0 or sign not in _tally:
+                continue
+            try:
+                records.append(_pack_ballot(vid, sign))
+            except (ValueError, struct.error):
+                continue
+            row['hasVoted'] = 1     # claim now so a duplicate later in the batch is refused
+            accepted.append((i, row, sign))
+
+        if accepted:
+            try:
+                _ledger_append(b''.join(records), len(records), durable=True)
+            except Exception:
+                for _, row, _ in accepted:
+                    row['hasVoted'] = 0
+                raise
+            for i, _, sign in accepted:
+                _tally.add(sign)
+                results[i] = True
+    _maybe_snapshot()
+    return results
+
+
+def _csv_show_result():
+    """Return dict Sign -> Vote Count (int), from the tally snapshot plus the ledger tail."""
+    _refresh()
+    return _tally.counts()
+
+
+def _csv_taking_data_voter(name, gender, zone, city, passw, age=18):
     """
     Add a new voter and return voter_id.
     Signature: name, gender, zone, city, passw, age=18
     """
+    with _roll_lock():
+        voters = _voters()
+
+        # Generate new voter_id
+        vid = _csv_next_voter_id()
+
+        # Build new row
+        new_row = {
+            'voter_id': str(vid),
+            'name': name,
+            'gender': gender,
+            'zone': zone,
+            'city': city,
+            'age': int(age) if age is not None else 18,
+            'passw': passw,
+            'hasVoted': 0,
+            'eye_template': ''
+        }
+
+        # Append
+        voters[new_row['voter_id']] = new_row
+        _journal_append({'op': 'add', 'row': new_row})
+    return vid
 
-    _ensure_voter_file()
-    vfile = path / 'voterList.csv'
-    df_v = _read_csv_safe(vfile)
-    df_v = _normalize_voter_df(df_v)
 
-    # Generate new voter_id
-    if df_v.empty:
-        vid = 10001
-    else:
-        try:
-            last = df_v['voter_id'].iloc[-1]
-            vid = int(last) + 1
-        except Exception:
-            vid = 10001 + len(df_v)
-
-    # Build new row
-    new_row = {
-        'voter_id': vid,
-        'name': name,
-        'gender': gender,
-        'zone': zone,
-        'city': city,
-        'age': int(age) if age is not None else 18,
-        'passw': passw,
-        'hasVoted': 0,
-        'eye_template': ''
-    }
-
-    # Append
-    df_v = pd.concat([df_v, pd.DataFrame([new_row])], ignore_index=True)
-    _write_voter_df(df_v)
-    return vid
+def _csv_next_voter_id():
+    """Id the next registered voter will get (last id + 1, 10001 for an empty roll, see voter_id_range)."""
+    voters = _voters()
+    if not voters:
+        return _next_in_range(None)
+    try:
+        last_id = int(next(reversed(voters)))
+    except ValueError:
+        last_id = 10000 + len(voters)
+    return _next_in_range(last_id)
+
+
+def _csv_set_passwords(pairs):
+    """Replace the stored password of each (voter_id, stored form) pair in one voterList.csv write."""
+    with _roll_lock(), _exclusive():
+        voters = _voters()
+        changed = 0
+        for vid, stored in pairs:
+            row = voters.get(str(vid))
+            if row is not None:
+                row['passw'] = stored
+                changed += 1
+        _compact_voters()
+    return changed
+
+
+def _csv_add_voters_bulk(df_new: pd.DataFrame):
+    """
+    Append already-normalized voter rows (voter_id assigned) to voterList.csv
+    in one write and add them to the resident index. Used by bulk_import.py.
+    """
+    global _voter_sig
+    with _roll_lock(), _exclusive():
+        _refresh()
+        if _journal_entries:
+            # fold pending single-row changes first so the CSV is the whole roll
+            _compact_voters()
+        _ensure_voter_file()
+        df_new = df_new[VOTER_COLS].copy()
+        df_new['voter_id'] = df_new['voter_id'].astype(str)
+        check_new_voter_ids(df_new['voter_id'])
+        with open(path / 'voterList.csv', 'a', newline='', encoding='utf-8') as f:
+            df_new.to_csv(f, header=False, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        for row in df_new.to_dict('records'):
+            _voter_index[row['voter_id']] = row
+        _voter_sig = _voter_files_sig()
+    return len(df_new)
 
 # ----------------- Eye template helpers (encryption-aware) ----------------- #
 
-# Attempt to import crypto utilities (optional)
-_crypto_ok = False
-try:
-    from crypto_utils import (
-        get_key_from_keyring,
-        encode_key_b64,
-        decode_key_b64,
-        encrypt_bytes_aes_gcm,
-        decrypt_bytes_aes_gcm,
-        derive_key_from_passphrase,
-        generate_key,
-        store_key_in_keyring,
-        get_key_from_keyring
-    )
-    _crypto_ok = True
-except Exception:
-    _crypto_ok = False
+# Crypto utilities (optional). crypto_utils pulls in cryptography and keyring,
+# so it is only imported when a template is actually encrypted or decrypted;
+# if that import fails for any reason, templates are kept in plaintext.
+def _crypto():
+    return optional_import('crypto_utils')
+
+def _crypto_ok():
+    return _crypto() is not None
+
+def get_key_from_keyring(service, username):
+    return _crypto().get_key_from_keyring(service, username)
+
+def derive_key_from_passphrase(passphrase, salt):
+    return _crypto().derive_key_from_passphrase(passphrase, salt)
+
+def encrypt_bytes_aes_gcm(key, plaintext, associated_data=None):
+    return _crypto().encrypt_bytes_aes_gcm(key, plaintext, associated_data)
+
+def decrypt_bytes_aes_gcm(key, nonce, ciphertext, associated_data=None):
+    return _crypto().decrypt_bytes_aes_gcm(key, nonce, ciphertext, associated_data)
 
 def _template_basename_for_vid(vid, encrypted: bool):
     """Return file base name (no directory) for a given voter id."""
@@ -307,30 +872,117 @@ def _template_basename_for_vid(vid, encrypted: bool):
 def _image_filename_for_vid(vid):
     return f"{vid}.png"
 
-def _get_master_key_interactive() -> bytes:
+def _encrypted_templates():
+    return USE_ENCRYPTION and _crypto_ok()
+
+# The master key is derived once per process (keyring lookup or the 200k-round
+# PBKDF2 passphrase prompt) and kept in a bytearray so it can be zeroized by
+# forget_master_key(), which also runs at interpreter exit.
+_master_key = None           # bytearray or None
+_master_key_source = None    # 'keyring' | 'passphrase'
+_master_key_lock = threading.Lock()
+
+def _get_master_key_interactive() -> bytearray:
     """
-    Return key bytes.
+    Return the cached master key, deriving it on first use.
     - Prefer OS keyring via crypto_utils.get_key_from_keyring
     - Fallback to passphrase-derived key using SALT_PATH
     Raises RuntimeError if no key available.
     """
+    global _master_key, _master_key_source
     if not USE_ENCRYPTION:
         raise RuntimeError("Encryption disabled by configuration (USE_ENCRYPTION=False)")
+    if not _crypto_ok():
+        raise RuntimeError("Crypto utilities not available. Install crypto_utils.py and required packages.")
 
-    if _crypto_ok:
+    with _master_key_lock:
+        if _master_key is not None:
+            return _master_key
         # try keyring
         key = get_key_from_keyring(KEYRING_SERVICE, KEYRING_USERNAME)
-        if key is not None:
-            return key
-        # else fallback to passphrase-derived key
-        if not SALT_PATH.exists():
-            raise RuntimeError(f"Master key not in keyring and salt file not found at {SALT_PATH}. Create salt or store key in keyring.")
-        salt = SALT_PATH.read_bytes()
-        import getpass
-        passphrase = getpass.getpass("Enter biometric passphrase (used to derive key): ")
-        return derive_key_from_passphrase(passphrase, salt)
+        source = 'keyring'
+        if key is None:
+            # else fallback to passphrase-derived key
+            if not SALT_PATH.exists():
+                raise RuntimeError(f"Master key not in keyring and salt file not found at {SALT_PATH}. Create salt or store key in keyring.")
+            salt = SALT_PATH.read_bytes()
+            import getpass
+            passphrase = getpass.getpass("Enter biometric passphrase (used to derive key): ")
+            key = derive_key_from_passphrase(passphrase, salt)
+            source = 'passphrase'
+        _master_key = bytearray(key)
+        _master_key_source = source
+        return _master_key
+
+def forget_master_key():
+    """Zeroize and drop the cached master key (the next use derives it again)."""
+    global _master_key, _master_key_source
+    with _master_key_lock:
+        if _master_key is not None:
+            for i in range(len(_master_key)):
+                _master_key[i] = 0
+        _master_key = None
+        _master_key_source = None
+
+def set_master_key(key):
+    """Install an already-resolved master key (e.g. handed to a worker process by match_service)."""
+    global _master_key, _master_key_source
+    forget_master_key()
+    with _master_key_lock:
+        _master_key = bytearray(key)
+        _master_key_source = 'provided'
+
+def _on_decrypt_failure():
+    """A passphrase typo yields a wrong key that fails every tag check: forget it so the next call re-prompts."""
+    if _master_key_source == 'passphrase':
+        forget_master_key()
+
+atexit.register(forget_master_key)
+
+# Decrypted descriptors, keyed by voter id and validated against the template
+# file's (name, size, mtime_ns); see template_cache.py.
+_template_cache = TemplateCache()
+
+_template_store = None
+_template_store_lock = threading.Lock()
+
+def _packed():
+    """True when templates live in the packed store rather than one file per voter."""
+    if EYE_TEMPLATE_STORE == "packed":
+        return True
+    return EYE_TEMPLATE_STORE == "auto" and (_template_store is not None or EYE_TEMPLATE_PACK.exists())
+
+def get_template_store():
+    """The process's PackedTemplateStore (created on first use)."""
+    global _template_store
+    with _template_store_lock:
+        if _template_store is None:
+            from template_store import PackedTemplateStore
+            _ensure_dir()
+            _template_store = PackedTemplateStore(
+                EYE_TEMPLATE_PACK, _get_master_key_interactive if _encrypted_templates() else None)
+        return _template_store
+
+def _template_file_sig(voter_id):
+    """Signature of the voter's stored template, or None: (basename, size, mtime_ns) of
+    the .enc/.npz file (.enc preferred), or the packed record's (name, generation, offset)."""
+    if _packed():
+        return get_template_store().sig(voter_id)
+    for encrypted in (True, False):
+        fpath = EYE_TEMPLATES_DIR / _template_basename_for_vid(voter_id, encrypted=encrypted)
+        try:
+            st = fpath.stat()
+        except OSError:
+            continue
+        return (fpath.name, st.st_size, st.st_mtime_ns)
+    return None
+
+def invalidate_eye_template(voter_id=None):
+    """Drop one voter's cached descriptors (or all of them when voter_id is None)."""
+    if voter_id is None:
+        _template_cache.clear()
     else:
-        raise RuntimeError("Crypto utilities not available. Install crypto_utils.py and required packages.")
+        _template_cache.invalidate(voter_id)
 
 def save_encrypted_template(voter_id, descriptors: np.ndarray):
     """
@@ -343,7 +995,7 @@ def save_encrypted_template(voter_id, descriptors: np.ndarray):
     if descriptors is None:
         return False
 
-    if USE_ENCRYPTION and _crypto_ok:
+    if USE_ENCRYPTION and _crypto_ok():
         # serialize descriptors to bytes
         from io import BytesIO
         bio = BytesIO()
@@ -364,6 +1016,7 @@ def save_encrypted_template(voter_id, descriptors: np.ndarray):
             with open(out_path, "wb") as f:
                 f.write(nonce)
                 f.write(ciphertext)
+            _template_cache.invalidate(voter_id)
             # update CSV pointer
             set_eye_template_filename(voter_id, out_path.name)
             return True
@@ -381,6 +1034,7 @@ def _save_plain_template(voter_id, descriptors: np.ndarray):
         fname = _template_basename_for_vid(voter_id, encrypted=False)
         fpath = EYE_TEMPLATES_DIR / fname
         np.savez_compressed(fpath, descriptors=descriptors)
+        _template_cache.invalidate(voter_id)
         set_eye_template_filename(voter_id, fpath.name)
         return True
     except Exception as e:
@@ -397,7 +1051,7 @@ def load_encrypted_template(voter_id):
     enc_path = EYE_TEMPLATES_DIR / _template_basename_for_vid(voter_id, encrypted=True)
     if not enc_path.exists():
         return None
-    if not (USE_ENCRYPTION and _crypto_ok):
+    if not (USE_ENCRYPTION and _crypto_ok()):
         print("Encryption requested but crypto not available; cannot decrypt:", enc_path)
         return None
     data = enc_path.read_bytes()
@@ -411,6 +1065,7 @@ def load_encrypted_template(voter_id):
         plain = decrypt_bytes_aes_gcm(key, nonce, ciphertext)
     except Exception as e:
         print("Decryption/auth failed:", e)
+        _on_decrypt_failure()
         return None
     # load numpy array from bytes
     from io import BytesIO
@@ -445,30 +1100,49 @@ def _load_plain_template(voter_id):
         print("Failed to load plaintext template:", e)
         return None
 
+_templates_written = 0   # template saves / deletions made by this process
+
+def eye_templates_sig():
+    """
+    Cheap signature of the template store (no per-voter stat): changes when a
+    template file is added or removed, the packed store grows, or this process
+    saves or deletes a template. A template rewritten in place by another
+    process does not change it.
+    """
+    return (_templates_written, _stat_sig(EYE_TEMPLATES_DIR), _stat_sig(EYE_TEMPLATE_PACK))
+
 def save_eye_template(voter_id, descriptors, raw_image=None):
     """
     Public API expected by register_with_eye.py
-    - Saves encrypted template if configured, otherwise plaintext .npz.
+    - Saves encrypted template if configured, otherwise plaintext .npz
+      (one record in eye_templates.pack when the packed store is in use).
     - Saves raw_image (best-effort) to database/eye_images/<vid>.png (unencrypted).
     - Updates voterList.csv 'eye_template' to stored filename.
     Returns True on success, False otherwise.
     """
+    global _templates_written
     ok = False
-    try:
-        ok = save_encrypted_template(voter_id, descriptors)
-    except Exception as e:
-        print("save_encrypted_template call failed:", e)
-        ok = False
+    if _packed():
+        ok = _save_packed_template(voter_id, descriptors)
+    else:
+        try:
+            ok = save_encrypted_template(voter_id, descriptors)
+        except Exception as e:
+            print("save_encrypted_template call failed:", e)
+            ok = False
 
-    if not ok:
-        # fallback to plaintext save
-        ok = _save_plain_template(voter_id, descriptors)
+        if not ok:
+            # fallback to plaintext save
+            ok = _save_plain_template(voter_id, descriptors)
 
     # save raw image if provided
     if raw_image is not None:
         try:
             imgname = _image_filename_for_vid(voter_id)
             imgpath = EYE_IMAGES_DIR / imgname
+            # optional image save libraries (imported only when a raw image is saved)
+            cv2 = optional_import('cv2')
+            imageio = optional_import('imageio') if cv2 is None else None
             if cv2 is not None:
                 # cv2.imwrite expects BGR or grayscale; if array is grayscale it's fine
                 cv2.imwrite(str(imgpath), raw_image)
@@ -480,31 +1154,110 @@ def save_eye_template(voter_id, descriptors, raw_image=None):
         except Exception as e:
             print("Warning: failed to save raw image:", e)
 
+    if ok:
+        _templates_written += 1
+        _notify_eye_index('on_template_saved', voter_id, descriptors)
     return ok
 
-def load_eye_template(voter_id):
-    """
-    Public API expected by voterlogin_with_eye.py
-    - Attempts to load & decrypt descriptors using load_encrypted_template (reads <vid>.enc)
-    - If encrypted loader isn't available or fails, attempts plaintext .npz load for backward compatibility.
-    Returns descriptors numpy array or None.
-    """
+def _notify_eye_index(hook, *args):
+    """Keep a built 1:N index current (nothing to do until eye_index has been built once)."""
+    if not EYE_INDEX_DIR.exists():
+        return
+    try:
+        import eye_index
+        getattr(eye_index, hook)(*args)
+    except Exception as e:
+        print("Warning: eye index update failed:", e)
+
+def _save_packed_template(voter_id, descriptors):
+    """Append descriptors to the packed store (plaintext record if the key is unavailable, like the file layout)."""
+    if descriptors is None:
+        return False
+    encrypt = _encrypted_templates()
+    if encrypt:
+        try:
+            _get_master_key_interactive()
+        except Exception as e:
+            print("Encryption key unavailable:", e)
+            encrypt = False
+    try:
+        get_template_store().put(voter_id, descriptors, encrypt=encrypt)
+    except Exception as e:
+        print("Failed to save template to the packed store:", e)
+        return False
+    _template_cache.invalidate(voter_id)
+    set_eye_template_filename(voter_id, EYE_TEMPLATE_PACK.name)
+    return True
+
+def _load_packed_template(voter_id):
+    try:
+        return get_template_store().get(voter_id)
+    except Exception as e:
+        print("Decryption/auth failed:", e)
+        _on_decrypt_failure()
+        return None
+
+def _load_template_file(voter_id):
+    """Descriptors from the voter's own .enc (or legacy .npz) file, or None."""
+    des = None
     # try encrypted loader first if enabled
     if USE_ENCRYPTION:
         try:
             des = load_encrypted_template(voter_id)
-            if des is not None:
-                return des
         except Exception as e:
             print("Encrypted load failed:", e)
             # fall through to plaintext load
 
     # fallback to plaintext .npz (legacy)
-    return _load_plain_template(voter_id)
+    if des is None:
+        des = _load_plain_template(voter_id)
+    return des
+
+def _list_template_files():
+    """Voter ids with a .enc/.npz template file."""
+    _ensure_dir()
+    vids = set()
+    for entry in os.scandir(EYE_TEMPLATES_DIR):
+        stem, ext = os.path.splitext(entry.name)
+        if ext in ('.enc', '.npz'):
+            vids.add(stem)
+    return vids
+
+def list_eye_templates():
+    """Voter ids that have a stored eye template."""
+    if _packed():
+        return set(get_template_store().voter_ids())
+    return _list_template_files()
+
+def load_eye_template(voter_id):
+    """
+    Public API expected by voterlogin_with_eye.py
+    - Served from the decrypted-template cache while the file is unchanged
+    - Reads the packed store (template_store.py) when it is in use, else:
+    - Attempts to load & decrypt descriptors using load_encrypted_template (reads <vid>.enc)
+    - If encrypted loader isn't available or fails, attempts plaintext .npz load for backward compatibility.
+    Returns descriptors numpy array (read-only when cached) or None.
+    """
+    sig = _template_file_sig(voter_id)
+    if sig is None:
+        return None
+    des = _template_cache.get(voter_id, sig)
+    if des is not None:
+        return des
+
+    if sig[0] == EYE_TEMPLATE_PACK.name:
+        des = _load_packed_template(voter_id)
+    else:
+        des = _load_template_file(voter_id)
+    if des is not None:
+        _template_cache.put(voter_id, sig, des)
+    return des
 
 def get_eye_template_path(voter_id):
     """Return the full path (string) to the template file if exists, else None."""
     _ensure_dir()
+    if _packed():
+        return str(EYE_TEMPLATE_PACK) if get_template_store().sig(voter_id) else None
     # prefer encrypted file
     enc = EYE_TEMPLATES_DIR / _template_basename_for_vid(voter_id, encrypted=True)
     if enc.exists():
@@ -518,51 +1271,52 @@ def has_eye_template(voter_id):
     """True if we have a saved template for the voter."""
     return get_eye_template_path(voter_id) is not None
 
-def set_eye_template_filename(voter_id, filename):
+def _csv_set_eye_template_filename(voter_id, filename):
     """
     Update voterList.csv and set 'eye_template' column for the voter to filename.
     filename should be just the basename (e.g. '10001.enc' or '10001.npz') or ''.
     """
-    _ensure_voter_file()
-    vfile = path/'voterList.csv'
-    df_v = _read_csv_safe(vfile)
-    df_v = _normalize_voter_df(df_v)
-    mask = df_v['voter_id'].astype(str) == str(voter_id)
-    if not mask.any():
-        return False
-    df_v.loc[mask, 'eye_template'] = filename if filename else ''
-    _write_voter_df(df_v)
+    with _roll_lock():
+        row = _voters().get(str(voter_id))
+        if row is None:
+            return False
+        row['eye_template'] = filename if filename else ''
+        _journal_append({'op': 'set', 'voter_id': str(voter_id), 'fields': {'eye_template': row['eye_template']}})
     return True
 
-def get_voter_row(voter_id):
+def _csv_get_voter_row(voter_id):
     """Return dict of voter row (canonical columns) or None."""
-    df_v = _read_csv_safe(path/'voterList.csv')
-    if df_v.empty:
-        return None
-    df_v = _normalize_voter_df(df_v)
-    row = df_v[df_v['voter_id'].astype(str) == str(voter_id)]
-    if row.empty:
+    row = _voters().get(str(voter_id))
+    if row is None:
         return None
-    return row.iloc[0].to_dict()
+    return dict(row)
 
 # ----------------- Admin helpers ----------------- #
 
-def list_voters():
+def _csv_list_voters():
     """Return normalized DataFrame of voters"""
-    _ensure_voter_file()
-    df_v = _read_csv_safe(path/'voterList.csv')
-    return _normalize_voter_df(df_v)
+    with _store_lock:
+        return pd.DataFrame(list(_voters().values()), columns=VOTER_COLS)
 
 def delete_template_files(voter_id):
     """
     Delete template and raw image for voter_id, and clear CSV pointer.
     """
-    tpl = get_eye_template_path(voter_id)
-    if tpl:
+    global _templates_written
+    if _packed():
         try:
-            os.remove(tpl)
+            get_template_store().delete(voter_id)
         except Exception as e:
-            print("Warning: failed to remove template file:", e)
+            print("Warning: failed to remove packed template:", e)
+    else:
+        tpl = get_eye_template_path(voter_id)
+        if tpl:
+            try:
+                os.remove(tpl)
+            except Exception as e:
+                print("Warning: failed to remove template file:", e)
+    _templates_written += 1
+    _template_cache.invalidate(voter_id)
     # remove raw image
     imgp = EYE_IMAGES_DIR / _image_filename_for_vid(voter_id)
     if imgp.exists():
@@ -572,4 +1326,229 @@ def delete_template_files(voter_id):
             print("Warning: failed to remove raw image:", e)
     # clear CSV pointer
     set_eye_template_filename(voter_id, '')
+    _notify_eye_index('on_template_deleted', voter_id)
     return True
+
+# ----------------- Storage backends ----------------- #
+# The voter roll and the tally sit behind a StorageBackend. CsvBackend is the
+# original pandas/CSV store; SqliteBackend (sqlite_store.py) keeps both in one
+# WAL-mode database. Pick one with STORAGE_BACKEND or set_backend().
+
+STORAGE_BACKEND = "csv"          # "csv" or "sqlite"
+SQLITE_PATH = path / "voters.db"
+
+# A shard's data directory (shards.py --split) holds the block of voter ids it
+# may hand out, so ids registered on different shards never collide.
+VOTER_ID_RANGE = path / "voter_ids.json"     # {"first": id, "last": id}
+
+def voter_id_range():
+    """(first, last) voter ids new registrations here may get, or None when any id will do."""
+    try:
+        ids = json.loads(VOTER_ID_RANGE.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+    return int(ids['first']), int(ids['last'])
+
+def _next_in_range(last_id):
+    """Id for the next registration after last_id (the newest id, None for an empty roll)."""
+    ids = voter_id_range()
+    if ids is None:
+        return 10001 if last_id is None else last_id + 1
+    first, last = ids
+    vid = last_id + 1 if last_id is not None and last_id >= first else first
+    if vid > last:
+        raise RuntimeError(f"voter ids {first}-{last} of this data directory are used up")
+    return vid
+
+def check_new_voter_ids(voter_ids):
+    """Raise ValueError if an id to be registered lies outside VOTER_ID_RANGE."""
+    ids = voter_id_range()
+    if ids is None:
+        return
+    outside = [v for v in voter_ids if not ids[0] <= int(v) <= ids[1]]
+    if outside:
+        raise ValueError(f"voter ids outside this shard's range {ids[0]}-{ids[1]}: {outside[:5]}")
+
+class StorageBackend(abc.ABC):
+    """Operations every voter/tally store must provide (a backend missing one cannot be created)."""
+
+    @abc.abstractmethod
+    def verify(self, vid, passw):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def isEligible(self, vid):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def vote_update(self, sign, vid):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def vote_update_many(self, ballots):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def show_result(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def taking_data_voter(self, name, gender, zone, city, passw, age=18):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def next_voter_id(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_voters_bulk(self, df_new):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_passwords(self, pairs):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_eye_template_filename(self, voter_id, filename):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_voter_row(self, voter_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_voters(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def count_reset(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reset_voter_list(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reset_cand_list(self):
+        raise NotImplementedError
+
+
+class CsvBackend(StorageBackend):
+    """voterList.csv / cand_list.csv with the resident index and ballot ledger."""
+    verify = staticmethod(_csv_verify)
+    isEligible = staticmethod(_csv_isEligible)
+    vote_update = staticmethod(_csv_vote_update)
+    vote_update_many = staticmethod(_csv_vote_update_many)
+    show_result = staticmethod(_csv_show_result)
+    taking_data_voter = staticmethod(_csv_taking_data_voter)
+    next_voter_id = staticmethod(_csv_next_voter_id)
+    add_voters_bulk = staticmethod(_csv_add_voters_bulk)
+    set_passwords = staticmethod(_csv_set_passwords)
+    set_eye_template_filename = staticmethod(_csv_set_eye_template_filename)
+    get_voter_row = staticmethod(_csv_get_voter_row)
+    list_voters = staticmethod(_csv_list_voters)
+    count_reset = staticmethod(_csv_count_reset)
+    reset_voter_list = staticmethod(_csv_reset_voter_list)
+    reset_cand_list = staticmethod(_csv_reset_cand_list)
+
+
+_backend = None
+
+def set_backend(backend):
+    """Select the storage backend: "csv", "sqlite" or a StorageBackend instance."""
+    global _backend
+    if isinstance(backend, StorageBackend):
+        _backend = backend
+    elif backend == "csv":
+        _backend = CsvBackend()
+    elif backend == "sqlite":
+        from sqlite_store import SqliteBackend
+        _backend = SqliteBackend(SQLITE_PATH)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend!r}")
+    return _backend
+
+def get_backend() -> StorageBackend:
+    if _backend is None:
+        set_backend(STORAGE_BACKEND)
+    return _backend
+
+# ----------------- Public functions (delegate to the active backend) ----------------- #
+
+# A successful verify() is remembered for passwords.VERIFY_CACHE_TTL seconds,
+# together with the voter's eligibility once isEligible() has looked it up,
+# so one login's repeated checks cost one hash and one lookup. Every ballot
+# drops its voter's entry.
+_verify_cache = VerifyCache()
+
+def verify(vid, passw):
+    """Return True if (voter_id, passw) match a voter."""
+    if _verify_cache.verified(vid, passw):
+        return True
+    ok = get_backend().verify(vid, passw)
+    if ok:
+        _verify_cache.put(vid, passw)
+    return ok
+
+def isEligible(vid):
+    """True if voter exists and hasVoted == 0"""
+    eligible = _verify_cache.eligible(vid)
+    if eligible is None:
+        eligible = get_backend().isEligible(vid)
+        _verify_cache.set_eligible(vid, eligible)
+    return eligible
+
+def clear_verify_cache():
+    _verify_cache.clear()
+
+def vote_update(sign, vid):
+    """Record a ballot for sign and mark voter hasVoted=1. Returns True on success."""
+    try:
+        return get_backend().vote_update(sign, vid)
+    finally:
+        _verify_cache.invalidate(vid)
+
+def vote_update_many(ballots):
+    """Apply a batch of (sign, vid) ballots in one durable commit. Returns a list of booleans."""
+    try:
+        return get_backend().vote_update_many(ballots)
+    finally:
+        for _, vid in ballots:
+            _verify_cache.invalidate(vid)
+
+def show_result():
+    """Return dict Sign -> Vote Count (int)."""
+    return get_backend().show_result()
+
+def taking_data_voter(name, gender, zone, city, passw, age=18):
+    """
+    Add a new voter and return voter_id. passw is stored as a salted hash.
+    Signature: name, gender, zone, city, passw, age=18
+    """
+    return get_backend().taking_data_voter(name, gender, zone, city, passwords.hash_password(passw), age)
+
+def set_eye_template_filename(voter_id, filename):
+    """Set the voter's 'eye_template' pointer to filename (basename or '')."""
+    return get_backend().set_eye_template_filename(voter_id, filename)
+
+def get_voter_row(voter_id):
+    """Return dict of voter row (canonical columns) or None."""
+    return get_backend().get_voter_row(voter_id)
+
+def list_voters():
+    """Return normalized DataFrame of voters"""
+    return get_backend().list_voters()
+
+def count_reset():
+    """Reset hasVoted for every voter and every candidate's Vote Count."""
+    _verify_cache.clear()
+    return get_backend().count_reset()
+
+def reset_voter_list():
+    """Remove all voters."""
+    _verify_cache.clear()
+    return get_backend().reset_voter_list()
+
+def reset_cand_list():
+    """Remove all candidates."""
+    return get_backend().reset_cand_list()
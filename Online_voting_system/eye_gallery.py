@@ -0,0 +1,419 @@
+# eye_gallery.py
+# Packed in-memory gallery of every enrolled voter's ORB descriptors, used by
+# register_with_eye.reg_server to check a new enrolment against the whole
+# electorate (the old loop only looked at voters sharing the new password).
+#
+# - all descriptors live in one contiguous (N, 32) uint8 matrix; each voter
+#   owns a contiguous run of rows (a segment) recorded in the owner arrays
+# - search computes Hamming distances block by block as popcount(XOR) over
+#   uint64 words and applies the same per-voter ratio test as
+#   biometric.match_templates, so scores equal the old pairwise
+#   BFMatcher scores
+# - blocks are spread over a thread pool (numpy releases the GIL)
+# - sync() reloads only templates whose files changed since the last call;
+#   get_gallery() only runs it when dframe.eye_templates_sig() moved (a
+#   template added or removed) or GALLERY_SYNC_INTERVAL passed, so a duplicate
+#   check does not stat every template file
+# - GALLERY_MMAP (sealed server volumes only: descriptors are NOT encrypted at
+#   rest): MappedGallery keeps the rows in one raw uint8 file under database/
+#   opened with np.memmap, so a matcher process starts without decrypting or
+#   copying anything and every worker shares the same pages in the OS page
+#   cache; descriptors(vid) is a zero-copy view
+#
+#   python eye_gallery.py --sync-mmap | --stats
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import dframe as df
+from biometric import DESCRIPTOR_BYTES, hamming_matrix, segment_scores
+
+GALLERY_BLOCK_ROWS = 4096      # gallery rows per distance block
+GALLERY_WORKERS = os.cpu_count() or 1
+GALLERY_MMAP = False           # see MappedGallery; only on encrypted/sealed server volumes
+GALLERY_META = df.path / "eye_gallery.json"
+GALLERY_SYNC_INTERVAL = 30     # seconds; full sync for templates rewritten in place by other processes
+
+
+class DescriptorGallery:
+    def __init__(self):
+        self._des = np.empty((0, DESCRIPTOR_BYTES), dtype=np.uint8)
+        self._rows = 0
+        self._owner = []          # per segment: voter id (str)
+        self._start = []          # per segment: first row
+        self._length = []         # per segment: row count
+        self._alive = []          # per segment: False once removed/replaced
+        self._segment_of = {}     # voter id -> segment index
+        self._sigs = {}           # voter id -> template file signature at load
+        self._dead_rows = 0
+        self._blocks = None       # cached [(seg_lo, seg_hi)] plan
+        self._lock = threading.RLock()
+        self._pool = None
+
+    def __len__(self):
+        return len(self._segment_of)
+
+    @property
+    def rows(self):
+        return self._rows - self._dead_rows
+
+    # --- mutation --- #
+
+    def add(self, voter_id, descriptors, sig=None):
+        """Add (or replace) voter_id's descriptors."""
+        vid = str(voter_id)
+        des = np.ascontiguousarray(descriptors, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+        with self._lock:
+            self.remove(vid)
+            if len(des) == 0:
+                return
+            need = self._rows + len(des)
+            if need > len(self._des):
+                grown = np.empty((max(need, 2 * len(self._des), 1024), DESCRIPTOR_BYTES), dtype=np.uint8)
+                grown[:self._rows] = self._des[:self._rows]
+                self._des = grown
+            self._des[self._rows:need] = des
+            self._segment_of[vid] = len(self._owner)
+            self._owner.append(vid)
+            self._start.append(self._rows)
+            self._length.append(len(des))
+            self._alive.append(True)
+            self._rows = need
+            self._sigs[vid] = sig
+            self._blocks = None
+
+    def remove(self, voter_id):
+        vid = str(voter_id)
+        with self._lock:
+            seg = self._segment_of.pop(vid, None)
+            self._sigs.pop(vid, None)
+            if seg is None:
+                return
+            self._alive[seg] = False
+            self._dead_rows += self._length[seg]
+            self._blocks = None
+            if self._dead_rows * 2 > self._rows:
+                self._compact()
+
+    def _compact(self):
+        keep = [i for i, alive in enumerate(self._alive) if alive]
+        parts = [self._des[self._start[i]:self._start[i] + self._length[i]] for i in keep]
+        self._des = np.concatenate(parts) if parts else np.empty((0, DESCRIPTOR_BYTES), dtype=np.uint8)
+        self._owner = [self._owner[i] for i in keep]
+        self._length = [self._length[i] for i in keep]
+        self._start = [0] + list(itertools.accumulate(self._length))[:-1] if keep else []
+        self._alive = [True] * len(keep)
+        self._segment_of = {vid: i for i, vid in enumerate(self._owner)}
+        self._rows = len(self._des)
+        self._dead_rows = 0
+
+    def descriptors(self, voter_id):
+        """Copy of voter_id's descriptors, or None."""
+        with self._lock:
+            seg = self._segment_of.get(str(voter_id))
+            if seg is None:
+                return None
+            return self._des[self._start[seg]:self._start[seg] + self._length[seg]].copy()
+
+    def refresh(self, voter_id):
+        """Reload one voter if their template file changed (cheaper than sync() for 1:1 checks)."""
+        vid = str(voter_id)
+        sig = df._template_file_sig(vid)
+        with self._lock:
+            if sig is None:
+                self.remove(vid)
+            elif self._sigs.get(vid) != sig:
+                des = df.load_eye_template(vid)
+                if des is None:
+                    self.remove(vid)
+                else:
+                    self.add(vid, des, sig)
+
+    def sync(self):
+        """Bring the gallery in line with the stored templates; returns the number of voters (re)loaded."""
+        vids = df.list_eye_templates()
+        loaded = 0
+        with self._lock:
+            for vid in list(self._sigs):
+                if vid not in vids:
+                    self.remove(vid)
+            for vid in vids:
+                sig = df._template_file_sig(vid)
+                if sig is None or self._sigs.get(vid) == sig:
+                    continue
+                des = df.load_eye_template(vid)
+                if des is None:
+                    self.remove(vid)
+                    continue
+                self.add(vid, des, sig)
+                loaded += 1
+        return loaded
+
+    # --- search --- #
+
+    def _plan(self):
+        """Split live segments into blocks of about GALLERY_BLOCK_ROWS rows (segments never straddle blocks)."""
+        if self._blocks is None:
+            blocks, lo, rows = [], 0, 0
+            for i, n in enumerate(self._length):
+                if rows and rows + n > GALLERY_BLOCK_ROWS:
+                    blocks.append((lo, i))
+                    lo, rows = i, 0
+                rows += n
+            if lo < len(self._length):
+                blocks.append((lo, len(self._length)))
+            self._blocks = blocks
+        return self._blocks
+
+    def _score_block(self, query, lo, hi, min_score):
+        start = np.array(self._start[lo:hi])
+        length = np.array(self._length[lo:hi])
+        r0, r1 = start[0], start[-1] + length[-1]
+        scores = segment_scores(hamming_matrix(query, self._des[r0:r1]), start - r0, length)
+        hits = []
+        for i in np.nonzero(scores >= min_score)[0]:
+            if self._alive[lo + i]:
+                hits.append((self._owner[lo + i], int(scores[i])))
+        return hits
+
+    def search(self, query, min_score, limit=None):
+        """
+        Voters whose template scores >= min_score against query, best first,
+        as [(voter_id, score)]. With limit, stops once that many are found.
+        """
+        if query is None or len(query) == 0:
+            return []
+        query = np.ascontiguousarray(query, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+        hits = []
+        with self._lock:
+            blocks = self._plan()
+            if GALLERY_WORKERS > 1 and len(blocks) > 1:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(GALLERY_WORKERS, thread_name_prefix='gallery')
+                for w in range(0, len(blocks), GALLERY_WORKERS):
+                    wave = blocks[w:w + GALLERY_WORKERS]
+                    for found in self._pool.map(lambda b: self._score_block(query, b[0], b[1], min_score), wave):
+                        hits.extend(found)
+                    if limit and len(hits) >= limit:
+                        break
+            else:
+                for lo, hi in blocks:
+                    hits.extend(self._score_block(query, lo, hi, min_score))
+                    if limit and len(hits) >= limit:
+                        break
+        hits.sort(key=lambda h: -h[1])
+        return hits[:limit] if limit else hits
+
+
+
+class MappedGallery(DescriptorGallery):
+    """
+    DescriptorGallery whose rows live in a memory-mapped raw file shared by
+    every process. GALLERY_META (JSON) names the raw file and lists each
+    voter's (start, length, template sig); changes append rows to the raw file
+    and then replace the meta file, so readers never see unwritten rows.
+    Writers take the same kind of lock file as template_store. Once dead rows
+    are over half the file it is rewritten under the next generation's name.
+    """
+
+    def __init__(self, meta_path=GALLERY_META):
+        super().__init__()
+        self.meta_path = meta_path
+        self.generation = 0
+        self._raw_name = None
+        self._meta_stat = None
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        """Re-open the mapping if another process published a new meta file."""
+        try:
+            st = os.stat(self.meta_path)
+            st = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            st = None
+        if st == self._meta_stat:
+            return False
+        self._reset_segments()
+        if st is not None:
+            with open(self.meta_path, 'rb') as f:
+                meta = json.load(f)
+            self.generation, self._raw_name, rows = meta['generation'], meta['raw'], meta['rows']
+            if rows:
+                self._des = np.memmap(self.meta_path.with_name(self._raw_name), dtype=np.uint8, mode='r',
+                                      shape=(rows, DESCRIPTOR_BYTES))
+            self._rows = rows
+            for i, (vid, start, length, sig) in enumerate(meta['segments']):
+                self._owner.append(vid)
+                self._start.append(start)
+                self._length.append(length)
+                self._alive.append(vid is not None)
+                if vid is None:
+                    self._dead_rows += length
+                else:
+                    self._segment_of[vid] = i
+                    self._sigs[vid] = tuple(sig) if sig else None
+        self._meta_stat = st
+        return True
+
+    def _reset_segments(self):
+        self._des = np.empty((0, DESCRIPTOR_BYTES), dtype=np.uint8)
+        self._rows = 0
+        self._owner, self._start, self._length, self._alive = [], [], [], []
+        self._segment_of, self._sigs = {}, {}
+        self._dead_rows = 0
+        self._blocks = None
+
+    def _publish(self, changed, removed):
+        """Apply [(vid, descriptors, sig)] and removed vids to the shared files."""
+        from template_store import writer_lock
+        with self._lock, writer_lock(self.meta_path.with_name(self.meta_path.name + '.lock')):
+            self._reload()
+            changed = [(str(v), d, s) for v, d, s in changed if self._sigs.get(str(v)) != s]
+            removed = [str(v) for v in removed if str(v) in self._sigs]
+            if not changed and not removed:
+                return
+            for vid in removed + [v for v, _, _ in changed]:
+                seg = self._segment_of.pop(vid, None)
+                self._sigs.pop(vid, None)
+                if seg is not None:
+                    self._alive[seg] = False
+                    self._dead_rows += self._length[seg]
+            new = [(v, np.ascontiguousarray(d, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES), s)
+                   for v, d, s in changed if d is not None and len(d)]
+            # dead segments stay listed (owner None) so segments keep tiling the rows
+            segments = [[self._owner[i], self._start[i], self._length[i], self._sigs[self._owner[i]]]
+                        if alive else [None, self._start[i], self._length[i], None]
+                        for i, alive in enumerate(self._alive)]
+            generation, raw_name, rows = self.generation, self._raw_name, self._rows
+            old_raw = None
+            if raw_name is None or self._dead_rows * 2 > rows:
+                # first write, or mostly dead: rewrite the live rows into a new file
+                old_raw = raw_name
+                generation = self.generation + 1 if raw_name else 0
+                raw_name = f"eye_gallery_{generation:06d}.u8"
+                segments = [seg for seg in segments if seg[0] is not None]
+                with open(self.meta_path.with_name(raw_name), 'wb') as f:
+                    rows = 0
+                    for seg in segments:
+                        f.write(self._des[seg[1]:seg[1] + seg[2]].tobytes())
+                        seg[1] = rows
+                        rows += seg[2]
+                    rows = self._append_rows(f, rows, new, segments)
+            else:
+                with open(self.meta_path.with_name(raw_name), 'r+b') as f:
+                    f.seek(rows * DESCRIPTOR_BYTES)
+                    rows = self._append_rows(f, rows, new, segments)
+            meta = {'generation': generation, 'raw': raw_name, 'rows': rows, 'segments': segments}
+            tmp = self.meta_path.with_name(self.meta_path.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(meta, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            self._des = np.empty((0, DESCRIPTOR_BYTES), dtype=np.uint8)   # release the old mapping
+            os.replace(tmp, self.meta_path)
+            self._reload()
+            if old_raw:
+                try:
+                    os.remove(self.meta_path.with_name(old_raw))
+                except OSError:
+                    pass    # still mapped by another process (Windows); removed by the next rewrite
+
+    @staticmethod
+    def _append_rows(f, rows, new, segments):
+        for vid, des, sig in new:
+            f.write(des.tobytes())
+            segments.append([vid, rows, len(des), sig])
+            rows += len(des)
+        f.flush()
+        os.fsync(f.fileno())
+        return rows
+
+    def add(self, voter_id, descriptors, sig=None):
+        self._publish([(voter_id, descriptors, sig)], [])
+
+    def remove(self, voter_id):
+        self._publish([], [voter_id])
+
+    def descriptors(self, voter_id):
+        """Zero-copy, read-only view of voter_id's rows in the mapped file, or None."""
+        with self._lock:
+            self._reload()
+            seg = self._segment_of.get(str(voter_id))
+            if seg is None:
+                return None
+            return self._des[self._start[seg]:self._start[seg] + self._length[seg]]
+
+    def refresh(self, voter_id):
+        with self._lock:
+            self._reload()
+        super().refresh(voter_id)
+
+    def search(self, query, min_score, limit=None):
+        with self._lock:
+            self._reload()
+        return super().search(query, min_score, limit)
+
+    def sync(self):
+        """Bring the mapped file in line with the stored templates in one append; returns voters (re)loaded."""
+        vids = df.list_eye_templates()
+        with self._lock:
+            self._reload()
+            removed = [vid for vid in self._sigs if vid not in vids]
+            changed = []
+            for vid in vids:
+                sig = df._template_file_sig(vid)
+                if sig is not None and self._sigs.get(vid) == sig:
+                    continue
+                des = df.load_eye_template(vid) if sig is not None else None
+                if des is None:
+                    removed.append(vid)
+                else:
+                    changed.append((vid, des, sig))
+            self._publish(changed, removed)
+            return len(changed)
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+_synced_sig = None       # df.eye_templates_sig() when the gallery was last synced
+_synced_at = 0.0
+
+def get_gallery():
+    """
+    Process-wide gallery, synced with the template store when its signature
+    changed since the last sync, and at least every GALLERY_SYNC_INTERVAL.
+    """
+    global _gallery, _synced_sig, _synced_at
+    with _gallery_lock:
+        if _gallery is None:
+            _gallery = MappedGallery() if GALLERY_MMAP else DescriptorGallery()
+        sig = df.eye_templates_sig()     # taken first: a change during sync is seen next time
+        now = time.monotonic()
+        if sig != _synced_sig or now - _synced_at >= GALLERY_SYNC_INTERVAL:
+            _gallery.sync()
+            _synced_sig, _synced_at = sig, now
+        return _gallery
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Eye descriptor gallery")
+    parser.add_argument('--sync-mmap', action='store_true', help='Build/update the memory-mapped gallery file')
+    parser.add_argument('--stats', action='store_true')
+    args = parser.parse_args()
+
+    if args.sync_mmap:
+        g = MappedGallery()
+        n = g.sync()
+        print(f"Mapped gallery: {len(g)} voters, {g.rows} rows ({n} (re)loaded) -> {g.meta_path.with_name(g._raw_name or '')}")
+    elif args.stats:
+        g = MappedGallery() if GALLERY_MMAP else get_gallery()
+        print(f"{type(g).__name__}: {len(g)} voters, {g.rows} rows")
+    else:
+        parser.print_help()
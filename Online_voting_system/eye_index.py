@@ -0,0 +1,408 @@
+# eye_index.py
+# 1:N eye identification ("who is this eye?") over all enrolled templates,
+# using bit-sampling LSH on the 256-bit ORB descriptors.
+#
+#   python eye_index.py --build | --stats
+#
+# - LSH_TABLES hash tables, each keyed by LSH_BITS fixed bit positions of a
+#   descriptor; two descriptors at Hamming distance d share a key with
+#   probability (1 - d/256) ** LSH_BITS, so close matches collide and random
+#   pairs almost never do
+# - a query descriptor looks up its key in every table (binary search in
+#   sorted key arrays) and votes for the owners it collides with; only the
+#   best LSH_SHORTLIST voters are scored exactly against their templates, so
+#   cost grows with bucket size, not with the number of enrolled voters
+# - the index holds hash keys and owner ids only (no descriptors); it is
+#   stored under database/eye_index as segment files, encrypted with the
+#   template key when template encryption is on
+# - dframe.save_eye_template / delete_template_files keep a built index
+#   current by appending small segments (a deletion is a tombstone segment);
+#   segments are merged once there are more than LSH_MAX_SEGMENTS
+# - identify() first reads segment files other processes wrote since this one
+#   loaded (one directory listing), so their enrolments are never missed
+# - load() reconciles the index with database/eye_templates, so templates
+#   written while the index was not loaded are picked up
+import argparse
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import dframe as df
+from biometric import DESCRIPTOR_BYTES, hamming_matrix, segment_scores
+
+LSH_TABLES = 8
+LSH_BITS = 20
+LSH_SEED = 20240611          # fixed, so every process samples the same bits
+LSH_MAX_BUCKET = 4096        # larger buckets carry no information; skipped
+LSH_SHORTLIST = 8            # voters scored exactly per query
+LSH_MAX_SEGMENTS = 16
+MATCH_THRESHOLD = 10         # same scale as the login / registration checks
+
+
+def _bit_positions():
+    rng = np.random.default_rng(LSH_SEED)
+    return np.stack([rng.choice(DESCRIPTOR_BYTES * 8, LSH_BITS, replace=False) for _ in range(LSH_TABLES)])
+
+
+def hash_keys(descriptors, positions):
+    """(LSH_TABLES, n) uint32 keys: bit j of key t is bit positions[t, j] of the descriptor."""
+    des = np.ascontiguousarray(descriptors, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+    keys = np.zeros((len(positions), len(des)), dtype=np.uint32)
+    for t, pos in enumerate(positions):
+        for j, p in enumerate(pos):
+            keys[t] |= ((des[:, p >> 3] >> (p & 7)) & 1).astype(np.uint32) << j
+    return keys
+
+# ----------------- segments ----------------- #
+
+class _Segment:
+    """Immutable slice of the index: per table, sorted keys and the owner (index into vids) of each key."""
+
+    def __init__(self, seq, vids, sigs, skeys, sowner, removed=()):
+        self.seq = seq
+        self.vids = vids          # list of voter id str
+        self.sigs = sigs          # list of template file signatures (tuples)
+        self.skeys = skeys        # (LSH_TABLES, n) uint32, each row sorted
+        self.sowner = sowner      # (LSH_TABLES, n) int32
+        self.removed = list(removed)   # voter ids deleted as of this segment
+
+    @classmethod
+    def build(cls, seq, items, positions):
+        """items: [(voter_id, descriptors, sig)]"""
+        keys, owner = [], []
+        for i, (_, des, _) in enumerate(items):
+            keys.append(hash_keys(des, positions))
+            owner.append(np.full(keys[-1].shape[1], i, dtype=np.int32))
+        return cls.from_keys(seq, [str(v) for v, _, _ in items], [s for _, _, s in items],
+                             np.concatenate(keys, axis=1), np.concatenate(owner))
+
+    @classmethod
+    def tombstone(cls, seq, vids):
+        """A segment without keys that removes vids from every older segment."""
+        return cls(seq, [], [], np.zeros((LSH_TABLES, 0), dtype=np.uint32),
+                   np.zeros((LSH_TABLES, 0), dtype=np.int32), removed=[str(v) for v in vids])
+
+    @classmethod
+    def from_keys(cls, seq, vids, sigs, keys, owner):
+        """keys (LSH_TABLES, n); owner (n,) or per table (LSH_TABLES, n)."""
+        order = np.argsort(keys, axis=1, kind='stable')
+        owner = np.broadcast_to(owner, keys.shape)
+        return cls(seq, vids, sigs, np.take_along_axis(keys, order, axis=1),
+                   np.take_along_axis(owner, order, axis=1).astype(np.int32))
+
+    def rows(self):
+        return self.skeys.shape[1]
+
+    def live_entries(self, live):
+        """(vids, sigs, keys, owner) of the voters still owned by this segment; owner indexes the returned vids."""
+        keep = np.array([live.get(v, (None,))[0] == self.seq for v in self.vids], dtype=bool)
+        if not keep.any():
+            return [], [], None, None
+        remap = (np.cumsum(keep) - 1).astype(np.int32)
+        mask = keep[self.sowner]
+        n = int(mask[0].sum())
+        keys = self.skeys[mask].reshape(len(mask), n)
+        owner = remap[self.sowner[mask]].reshape(len(mask), n)
+        vids = [v for v, k in zip(self.vids, keep) if k]
+        sigs = [s for s, k in zip(self.sigs, keep) if k]
+        return vids, sigs, keys, owner
+
+    def votes(self, qkeys):
+        """Owner indices colliding with qkeys (LSH_TABLES, m), oversized buckets skipped."""
+        hits = []
+        for t in range(len(qkeys)):
+            lo = np.searchsorted(self.skeys[t], qkeys[t], side='left')
+            hi = np.searchsorted(self.skeys[t], qkeys[t], side='right')
+            for a, b in zip(lo, hi):
+                if 0 < b - a <= LSH_MAX_BUCKET:
+                    hits.append(self.sowner[t, a:b])
+        return np.concatenate(hits) if hits else np.empty(0, dtype=np.int32)
+
+    # --- persistence --- #
+
+    def to_bytes(self):
+        bio = io.BytesIO()
+        np.savez(bio, skeys=self.skeys, sowner=self.sowner,
+                 meta=np.frombuffer(json.dumps({'vids': self.vids, 'sigs': self.sigs,
+                                                'removed': self.removed}).encode('utf-8'), dtype=np.uint8))
+        return bio.getvalue()
+
+    @classmethod
+    def from_bytes(cls, seq, data):
+        npz = np.load(io.BytesIO(data))
+        meta = json.loads(npz['meta'].tobytes().decode('utf-8'))
+        return cls(seq, meta['vids'], [tuple(s) if s else None for s in meta['sigs']], npz['skeys'], npz['sowner'],
+                   meta.get('removed', []))
+
+
+def _encrypted():
+    return df.USE_ENCRYPTION and df._crypto_ok()
+
+
+def _segment_path(seq):
+    return df.EYE_INDEX_DIR / f"seg_{seq:06d}.{'enc' if _encrypted() else 'npz'}"
+
+
+def _write_segment(seg):
+    """Persist seg under a sequence number no other process has used (seg.seq may be bumped)."""
+    data = seg.to_bytes()
+    if _encrypted():
+        nonce, ciphertext = df.encrypt_bytes_aes_gcm(df._get_master_key_interactive(), data)
+        data = nonce + ciphertext
+    tmp = df.EYE_INDEX_DIR / f"seg_{os.getpid()}_{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        while True:
+            try:
+                os.link(tmp, _segment_path(seg.seq))   # atomic, fails if the name is taken
+                return seg.seq
+            except FileExistsError:
+                seg.seq += 1
+    finally:
+        os.remove(tmp)
+
+
+def _segment_files():
+    """{seq: path} of the segment files under database/eye_index."""
+    if not df.EYE_INDEX_DIR.exists():
+        return {}
+    return {int(p.stem.split('_')[1]): p for p in df.EYE_INDEX_DIR.iterdir() if p.suffix in ('.enc', '.npz')}
+
+
+def _read_segment(p):
+    data = p.read_bytes()
+    if p.suffix == '.enc':
+        data = df.decrypt_bytes_aes_gcm(df._get_master_key_interactive(), data[:12], data[12:])
+    return _Segment.from_bytes(int(p.stem.split('_')[1]), data)
+
+# ----------------- index ----------------- #
+
+class EyeIndex:
+    def __init__(self):
+        self.positions = _bit_positions()
+        self._segments = []       # oldest first
+        self._live = {}           # voter id -> (segment seq, sig)
+        self._removed = {}        # voter id -> seq of the tombstone that removed it
+        self._skipped = set()     # seqs of unreadable segment files
+        self._next_seq = 1
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._live)
+
+    def load(self):
+        """Read all segments from disk, then reconcile with the template folder."""
+        with self._lock:
+            self._read_segments(_segment_files())
+            self.sync()
+        return self
+
+    def _read_segments(self, files):
+        self._segments, self._live, self._removed, self._skipped = [], {}, {}, set()
+        for seq in sorted(files):
+            self._read(seq, files[seq])
+
+    def _read(self, seq, p):
+        try:
+            seg = _read_segment(p)
+        except Exception as e:
+            print("Skipping unreadable index segment", p.name, ":", e)
+            self._skipped.add(seq)
+            return
+        self._apply(seg)
+
+    def _apply(self, seg):
+        """Add a segment; for each voter the highest sequence number (entry or tombstone) wins."""
+        self._segments.append(seg)
+        for vid, sig in zip(seg.vids, seg.sigs):
+            if seg.seq > max(self._live.get(vid, (0,))[0], self._removed.get(vid, 0)):
+                self._live[vid] = (seg.seq, sig)
+                self._removed.pop(vid, None)
+        for vid in seg.removed:
+            if seg.seq > max(self._live.get(vid, (0,))[0], self._removed.get(vid, 0)):
+                self._live.pop(vid, None)
+                self._removed[vid] = seg.seq
+        self._next_seq = max(self._next_seq, seg.seq + 1)
+
+    def refresh(self):
+        """
+        Read segment files other processes wrote since this one last looked
+        (one directory listing; only new files are read). A segment gone from
+        disk means another process compacted, so everything is reread.
+        Returns True if the index changed.
+        """
+        files = _segment_files()
+        with self._lock:
+            known = {seg.seq for seg in self._segments} | self._skipped
+            if any(seg.seq not in files for seg in self._segments):
+                self._read_segments(files)
+                return True
+            new = sorted(files.keys() - known)
+            for seq in new:
+                self._read(seq, files[seq])
+            return bool(new)
+
+    def sync(self):
+        """Index templates that are new or changed on disk, forget deleted ones. Returns voters (re)indexed."""
+        on_disk = {vid: df._template_file_sig(vid) for vid in df.list_eye_templates()}
+        with self._lock:
+            for vid in [v for v in self._live if v not in on_disk]:
+                del self._live[vid]
+            items = []
+            for vid, sig in on_disk.items():
+                if sig is None or self._live.get(vid, (None, None))[1] == sig:
+                    continue
+                des = df.load_eye_template(vid)
+                if des is not None and len(des):
+                    items.append((vid, des, sig))
+            if items:
+                self.add_many(items)
+            return len(items)
+
+    def add_many(self, items):
+        """Index [(voter_id, descriptors, sig)] as one new segment (persisted)."""
+        items = [(str(v), d, tuple(s) if s else None) for v, d, s in items if d is not None and len(d)]
+        if not items:
+            return
+        with self._lock:
+            self._append(_Segment.build(self._next_seq, items, self.positions))
+
+    def add(self, voter_id, descriptors, sig=None):
+        self.add_many([(voter_id, descriptors, sig)])
+
+    def remove(self, voter_id):
+        """Drop voter_id, here and (through a tombstone segment) in every other process."""
+        with self._lock:
+            self._append(_Segment.tombstone(self._next_seq, [voter_id]))
+
+    def _append(self, seg):
+        """Persist a new segment after catching up with other processes (so its seq is the newest)."""
+        self.refresh()
+        df.EYE_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        seg.seq = max(seg.seq, self._next_seq)
+        self._next_seq = _write_segment(seg) + 1
+        self._apply(seg)
+        if len(self._segments) > LSH_MAX_SEGMENTS:
+            self.compact()
+
+    def compact(self):
+        """Merge every segment into one, dropping replaced and removed voters."""
+        with self._lock:
+            self.refresh()
+            vids, sigs, keys, owner = [], [], [], []
+            for seg in self._segments:
+                v, s, k, o = seg.live_entries(self._live)
+                if not v:
+                    continue
+                keys.append(k)
+                owner.append(o + len(vids))
+                vids += v
+                sigs += s
+            old = self._segments
+            self._segments = []
+            if vids:
+                merged = _Segment.from_keys(self._next_seq, vids, sigs,
+                                            np.concatenate(keys, axis=1), np.concatenate(owner, axis=1))
+                self._next_seq = _write_segment(merged) + 1
+                self._segments = [merged]
+                for vid, sig in zip(vids, sigs):
+                    self._live[vid] = (merged.seq, sig)
+            for seg in old:
+                try:
+                    os.remove(_segment_path(seg.seq))
+                except OSError:
+                    pass
+
+    def candidates(self, descriptors, shortlist=LSH_SHORTLIST):
+        """Voters whose descriptors collide most often with the query, as [(voter_id, collisions)]."""
+        qkeys = hash_keys(descriptors, self.positions)
+        votes = {}
+        with self._lock:
+            for seg in self._segments:
+                owners = seg.votes(qkeys)
+                if not len(owners):
+                    continue
+                idx, counts = np.unique(owners, return_counts=True)
+                for i, c in zip(idx, counts):
+                    vid = seg.vids[i]
+                    if self._live.get(vid, (None,))[0] == seg.seq:
+                        votes[vid] = votes.get(vid, 0) + int(c)
+        return sorted(votes.items(), key=lambda kv: -kv[1])[:shortlist]
+
+    def identify(self, descriptors, min_score=MATCH_THRESHOLD, limit=None):
+        """
+        Enrolled voters matching descriptors, best first, as [(voter_id, score)].
+        score uses the same ratio test as the 1:1 check, on the LSH shortlist only.
+        """
+        if descriptors is None or len(descriptors) == 0:
+            return []
+        self.refresh()
+        query = np.ascontiguousarray(descriptors, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+        hits = []
+        for vid, _ in self.candidates(query):
+            stored = df.load_eye_template(vid)
+            if stored is None or len(stored) < 2:
+                continue
+            stored = np.ascontiguousarray(stored, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+            score = int(segment_scores(hamming_matrix(query, stored), np.array([0]), np.array([len(stored)]))[0])
+            if score >= min_score:
+                hits.append((vid, score))
+        hits.sort(key=lambda h: -h[1])
+        return hits[:limit] if limit else hits
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def index_built():
+    """True once an index has been built under database/eye_index."""
+    return df.EYE_INDEX_DIR.exists()
+
+
+def get_index():
+    """Process-wide index (loaded from disk, built on first use)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = EyeIndex().load()
+        return _index
+
+
+def identify(descriptors, min_score=MATCH_THRESHOLD, limit=None):
+    return get_index().identify(descriptors, min_score, limit)
+
+
+def on_template_saved(voter_id, descriptors):
+    """Hook called by dframe.save_eye_template."""
+    get_index().add(voter_id, descriptors, df._template_file_sig(voter_id))
+
+
+def on_template_deleted(voter_id):
+    """Hook called by dframe.delete_template_files."""
+    get_index().remove(voter_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / inspect the 1:N eye identification index")
+    parser.add_argument('--build', action='store_true', help='Index every template in database/eye_templates')
+    parser.add_argument('--stats', action='store_true', help='Show index size')
+    args = parser.parse_args()
+
+    if args.build:
+        t0 = time.perf_counter()
+        idx = get_index()
+        idx.compact()
+        print(f"Indexed {len(idx)} voters in {time.perf_counter() - t0:.2f}s")
+    elif args.stats:
+        idx = get_index()
+        rows = sum(seg.rows() for seg in idx._segments)
+        print(f"{len(idx)} voters, {rows} descriptors, {len(idx._segments)} segments")
+    else:
+        parser.print_help()
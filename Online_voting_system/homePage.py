@@ -1,8 +1,11 @@
 import subprocess as sb_p
 import tkinter as tk
 from tkinter import *
-from Admin import AdmLogin
-from voterlogin_with_eye import voterLogin
+from lazy_imports import lazy_import
+
+# screens (and their pandas/cv2/PIL/crypto imports) load when first opened
+Admin = lazy_import('Admin')
+voterlogin = lazy_import('voterlogin_with_eye')
 
 
 def Home(root, frame1, frame2):
@@ -22,10 +25,10 @@ def Home(root, frame1, frame2):
     Label(frame1, text="Home", font=('Helvetica', 25, 'bold')).grid(row = 0, column = 1, rowspan=1)
     Label(frame1, text="").grid(row = 1,column = 0)
     #Admin Login
-    admin = Button(frame1, text="Admin Login", width=15, command = lambda: AdmLogin(root, frame1))
+    admin = Button(frame1, text="Admin Login", width=15, command = lambda: Admin.AdmLogin(root, frame1))
 
     #Voter Login
-    voter = Button(frame1, text="Voter Login", width=15, command = lambda: voterLogin(root, frame1))
+    voter = Button(frame1, text="Voter Login", width=15, command = lambda: voterlogin.voterLogin(root, frame1))
 
     #New Tab
     newTab = Button(frame1, text="New Window", width=15, command = lambda: sb_p.call('start python homePage.py', shell=True))
@@ -0,0 +1,101 @@
+# lazy_imports.py
+# Deferred imports for the GUI entry points, so a booth kiosk draws the home
+# window before pandas, numpy, cv2, PIL or the crypto stack are loaded.
+#
+#   python lazy_imports.py [--budget-ms 250] [--top 15]
+#
+# - lazy_import(name) returns a module object at once and runs the module on
+#   first attribute access (importlib.util.LazyLoader); homePage and Admin
+#   reach their screens through such handles, so a screen's dependencies load
+#   when it is opened
+# - optional_import(name) is for optional features (cv2, crypto_utils): call
+#   it where the feature is used; it really imports the module, so one that is
+#   installed but broken counts as missing instead of failing later, and a
+#   failed import leaves nothing half-loaded in sys.modules
+# - the report runs `python -X importtime -c "import homePage"` in a fresh
+#   interpreter, prints the slowest imports and fails if the home screen's
+#   imports exceed STARTUP_BUDGET_MS or pull in one of HEAVY_MODULES
+import argparse
+import importlib
+import importlib.util
+import os
+import subprocess
+import sys
+
+STARTUP_BUDGET_MS = 250
+HEAVY_MODULES = ('pandas', 'numpy', 'cv2', 'PIL', 'cryptography', 'keyring', 'dframe')
+
+
+def lazy_import(name):
+    """Module name, executed on first attribute access (already-imported modules are returned as they are)."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+_optional = {}
+
+
+def optional_import(name):
+    """Module name, imported now, or None if it is missing or fails to import (the answer is remembered)."""
+    if name not in _optional:
+        try:
+            module = importlib.import_module(name)
+            getattr(module, '__name__')          # runs a lazy_import handle made elsewhere
+        except Exception:
+            for loaded in [m for m in sys.modules if m == name or m.startswith(name + '.')]:
+                del sys.modules[loaded]
+            module = None
+        _optional[name] = module
+    return _optional[name]
+
+# ----------------- startup report ----------------- #
+
+def import_times(entry="homePage"):
+    """[(module, self_us, cumulative_us)] for importing entry in a fresh interpreter."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {entry}"],
+                          cwd=here, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"import {entry} failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cum_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cum_us)))
+    return rows
+
+
+def startup_report(entry="homePage", budget_ms=STARTUP_BUDGET_MS, top=15):
+    """Print the import-time breakdown of entry; returns True if it is within budget."""
+    rows = import_times(entry)
+    total_ms = sum(self_us for _, self_us, _ in rows) / 1000.0
+    print(f"import {entry}: {total_ms:.0f} ms over {len(rows)} modules (budget {budget_ms} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, self_us, cum_us in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"{cum_us / 1000.0:14.1f} {self_us / 1000.0:8.1f}  {name}")
+    heavy = sorted({name.split('.')[0] for name, _, _ in rows} & set(HEAVY_MODULES))
+    if heavy:
+        print("Loaded at startup but should be lazy:", ', '.join(heavy))
+    ok = total_ms <= budget_ms and not heavy
+    print("OK" if ok else "OVER BUDGET")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time report for the GUI entry point")
+    parser.add_argument('--entry', default='homePage', help='Module to import')
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    args = parser.parse_args()
+    sys.exit(0 if startup_report(args.entry, args.budget_ms, args.top) else 1)
@@ -0,0 +1,313 @@
+# match_service.py
+# Local biometric matching service, so ORB extraction and matching run off the
+# Tk main thread and scale across cores.
+#
+#   python match_service.py [--workers N] [--port 4002]
+#
+# - a ProcessPoolExecutor of matcher workers; each worker preloads the eye
+#   gallery (eye_gallery.py) once for identify jobs, and a verify job loads
+#   only the claimed voter's template, so a job costs one ORB pass plus matching
+# - jobs arrive over a local socket using the framed protocol (protocol.py,
+#   MSG_MATCH); replies come back in request order per connection, but jobs
+#   from one connection still run in parallel
+# - booth side: verify_async / identify_async return concurrent.futures
+#   Futures; wait_responsive() keeps Tk painting while one is pending. With
+#   no service running the same jobs run on a local background thread
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import protocol as proto
+
+MATCH_HOST = "127.0.0.1"
+MATCH_PORT = 4002
+MATCH_WORKERS = os.cpu_count() or 1
+GALLERY_SYNC_INTERVAL = 2.0   # seconds between full gallery syncs for identify jobs
+CONNECT_TIMEOUT = 0.5
+
+# ----------------- image payloads ----------------- #
+
+def encode_image(img_gray):
+    img = np.ascontiguousarray(img_gray, dtype=np.uint8)
+    return {'image': base64.b64encode(img.tobytes()).decode('ascii'), 'shape': list(img.shape)}
+
+
+def decode_image(payload):
+    raw = base64.b64decode(payload['image'])
+    return np.frombuffer(raw, dtype=np.uint8).reshape(payload['shape'])
+
+# ----------------- matching jobs (run in workers or locally) ----------------- #
+
+_gallery = None
+_last_sync = 0.0
+
+
+def _worker_init(master_key):
+    """Process-pool initializer: install the key and preload the gallery."""
+    global _gallery, _last_sync
+    import dframe as df
+    import eye_gallery
+    if master_key is not None:
+        df.set_master_key(master_key)
+    _gallery = eye_gallery.get_gallery()
+    _last_sync = time.monotonic()
+
+
+def _get_gallery():
+    global _gallery
+    if _gallery is None:
+        import eye_gallery
+        _gallery = eye_gallery.get_gallery()
+    return _gallery
+
+
+def run_verify(voter_id, img_gray):
+    """1:1 check. Returns {"status": ok | NoTemplate | NoDescriptors, "score"}."""
+    import biometric
+    import dframe as df
+    # only the claimed voter's template (cached per file); the gallery is for identify
+    stored = df.load_eye_template(voter_id)
+    if stored is None:
+        return {'status': 'NoTemplate', 'score': 0.0}
+    live = biometric.make_descriptors(img_gray)
+    if live is None:
+        return {'status': 'NoDescriptors', 'score': 0.0}
+    return {'status': 'ok', 'score': float(biometric.symmetric_score(live, stored))}
+
+
+def run_identify(img_gray, min_score):
+    """1:N lookup. Returns {"status": ok | NoDescriptors, "hits": [[voter_id, score], ...]}."""
+    global _last_sync
+    import biometric
+    import eye_index
+    live = biometric.make_descriptors(img_gray)
+    if live is None:
+        return {'status': 'NoDescriptors', 'hits': []}
+    if eye_index.index_built():
+        hits = eye_index.identify(live, min_score, limit=1)
+    else:
+        gallery = _get_gallery()
+        if time.monotonic() - _last_sync > GALLERY_SYNC_INTERVAL:
+            gallery.sync()
+            _last_sync = time.monotonic()
+        hits = gallery.search(live, min_score, limit=1)
+    return {'status': 'ok', 'hits': [[vid, score] for vid, score in hits]}
+
+
+def run_job(payload):
+    """Entry point for one MSG_MATCH payload (picklable for the process pool)."""
+    op = payload.get('op')
+    try:
+        img = decode_image(payload)
+    except (KeyError, ValueError, TypeError):
+        return {'status': 'Error', 'error': 'bad image'}
+    if op == 'verify':
+        return run_verify(str(payload.get('voter_id', '')), img)
+    if op == 'identify':
+        return run_identify(img, int(payload.get('min_score', 10)))
+    return {'status': 'Error', 'error': f'unknown op {op!r}'}
+
+# ----------------- service ----------------- #
+
+async def _match_session(reader, writer, pool):
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue()
+
+    async def write_replies():
+        while True:
+            rid, fut = await pending.get()
+            if fut is None:
+                return
+            try:
+                reply = await fut
+            except Exception as e:
+                reply = {'status': 'Error', 'error': str(e)}
+            if rid is not None:
+                reply['rid'] = rid
+            proto.write_frame(writer, proto.MSG_RESULT, reply)
+            await writer.drain()
+
+    writer_task = asyncio.create_task(write_replies())
+    try:
+        proto.write_frame(writer, proto.MSG_HELLO, {'version': proto.PROTOCOL_VERSION})
+        await writer.drain()
+        while True:
+            msg_type, payload = await proto.read_frame(reader)
+            if msg_type != proto.MSG_MATCH:
+                fut = loop.create_future()
+                fut.set_result({'status': 'Error', 'error': f'unsupported message type {msg_type}'})
+            else:
+                fut = loop.run_in_executor(pool, run_job, payload)
+            await pending.put((payload.get('rid'), fut))
+    except asyncio.IncompleteReadError:
+        pass
+    except proto.ProtocolError as e:
+        print('Protocol error, closing connection:', e)
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        await pending.put((None, None))
+        try:
+            await writer_task
+        except (ConnectionError, OSError):
+            pass
+        writer.close()
+
+
+async def _serve(host, port, workers):
+    import dframe as df
+    key = None
+    if df.USE_ENCRYPTION and df._crypto_ok():
+        try:
+            key = bytes(df._get_master_key_interactive())
+        except Exception as e:
+            print("Master key unavailable; workers will only read plaintext templates:", e)
+    with ProcessPoolExecutor(workers, initializer=_worker_init, initargs=(key,)) as pool:
+        # start every worker now so galleries are loaded before the first job
+        list(pool.map(time.sleep, [0] * workers))
+        server = await asyncio.start_server(lambda r, w: _match_session(r, w, pool), host, port)
+        print(f"Match service on {host}:{port} with {workers} worker(s)")
+        async with server:
+            await server.serve_forever()
+
+
+def match_service(host=MATCH_HOST, port=MATCH_PORT, workers=MATCH_WORKERS):
+    try:
+        asyncio.run(_serve(host, port, workers))
+    except KeyboardInterrupt:
+        pass
+    print("Match service stopped")
+
+# ----------------- booth side ----------------- #
+
+class MatchClient:
+    """Pipelined connection to the service; submit() returns a Future per job."""
+
+    def __init__(self, host=MATCH_HOST, port=MATCH_PORT):
+        self.sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+        try:
+            msg_type, payload = proto.recv_frame(self.sock)
+        except (OSError, proto.ProtocolError):
+            self.sock.close()
+            raise
+        if msg_type != proto.MSG_HELLO:
+            self.sock.close()
+            raise proto.ProtocolError("not a match service")
+        self.sock.settimeout(None)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._rid = 0
+        self.closed = False
+        threading.Thread(target=self._read_replies, name="match-client", daemon=True).start()
+
+    def submit(self, payload):
+        fut = Future()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("match service connection closed")
+            self._rid += 1
+            payload = dict(payload, rid=self._rid)
+            self._pending.append(fut)
+            proto.send_frame(self.sock, proto.MSG_MATCH, payload)
+        return fut
+
+    def _read_replies(self):
+        try:
+            while True:
+                msg_type, reply = proto.recv_frame(self.sock)
+                with self._lock:
+                    fut = self._pending.popleft()
+                fut.set_result(reply)
+        except (ConnectionError, OSError, proto.ProtocolError, IndexError) as e:
+            with self._lock:
+                self.closed = True
+                while self._pending:
+                    self._pending.popleft().set_exception(ConnectionError(f"match service lost: {e}"))
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+_client = None
+_client_lock = threading.Lock()
+_local = ThreadPoolExecutor(1, thread_name_prefix='match-local')
+
+
+def _get_client():
+    """Shared MatchClient, or None when no service is listening."""
+    global _client
+    with _client_lock:
+        if _client is None or _client.closed:
+            try:
+                _client = MatchClient()
+            except (OSError, proto.ProtocolError):
+                _client = None
+        return _client
+
+
+def _submit(payload, local_fn, *args):
+    """Send the job to the service (falling back to the local thread if it is down or drops the job)."""
+    client = _get_client()
+    if client is None:
+        return _local.submit(local_fn, *args)
+    result = Future()
+
+    def relay(src):
+        try:
+            result.set_result(src.result())
+        except ConnectionError:
+            _local.submit(local_fn, *args).add_done_callback(relay_local)
+        except Exception as e:
+            result.set_exception(e)
+
+    def relay_local(src):
+        try:
+            result.set_result(src.result())
+        except Exception as e:
+            result.set_exception(e)
+
+    try:
+        client.submit(payload).add_done_callback(relay)
+    except (ConnectionError, OSError):
+        _local.submit(local_fn, *args).add_done_callback(relay_local)
+    return result
+
+
+def verify_async(voter_id, img_gray):
+    """Future -> {"status", "score"} for a 1:1 check of a live capture."""
+    return _submit(dict(encode_image(img_gray), op='verify', voter_id=str(voter_id)),
+                   run_verify, str(voter_id), img_gray)
+
+
+def identify_async(img_gray, min_score=10):
+    """Future -> {"status", "hits"} for a 1:N lookup of a live capture."""
+    return _submit(dict(encode_image(img_gray), op='identify', min_score=int(min_score)),
+                   run_identify, img_gray, int(min_score))
+
+
+def wait_responsive(widget, fut, poll=0.02):
+    """Wait for fut while letting Tk keep processing events; returns its result."""
+    while not fut.done():
+        widget.update()
+        time.sleep(poll)
+    return fut.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local biometric matching service")
+    parser.add_argument('--host', default=MATCH_HOST)
+    parser.add_argument('--port', type=int, default=MATCH_PORT)
+    parser.add_argument('--workers', type=int, default=MATCH_WORKERS, help='Matcher processes')
+    args = parser.parse_args()
+    match_service(args.host, args.port, args.workers)
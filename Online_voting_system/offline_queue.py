@@ -0,0 +1,371 @@
+# offline_queue.py
+# Offline booth mode: while the vote server cannot be reached, ballots are
+# sealed and appended to a local queue, then uploaded in MSG_SYNC batches once
+# the server is back.
+#
+#   python offline_queue.py --status
+#   python offline_queue.py --sync [--host H --port P]
+#   python offline_queue.py --bench 20000 [--sync]
+#
+# - record = length (u32) | voter_id (u64) | nonce (12) | AES-GCM ciphertext of
+#   (sign, cast time); sealed with the election master key and the voter id as
+#   associated data, so a record only opens on a server holding that key and
+#   cannot be moved to another voter
+# - every append is fsynced; a torn last record is cut off when the queue opens
+# - sync is idempotent: the server dedupes on voter_id and answers Accepted,
+#   Duplicate or Rejected per ballot. Accepted and Duplicate ballots leave the
+#   queue, Rejected ones are moved to offline_ballots.rejected next to it
+# - with a shard map each ballot goes to the shard of its voter's zone; one
+#   that shard rejects is offered to the other shards before it is set aside
+import argparse
+import base64
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+import crypto_utils
+import protocol as proto
+
+QUEUE_PATH = Path("database") / "offline_ballots.queue"
+OFFLINE_MODE = True       # let booths take ballots while the server is unreachable
+BOOTH_ID = ""             # shown in the server log for each sync; defaults to the host name
+SYNC_CHUNK = 5000         # ballots per MSG_SYNC request (~480 KB of payload)
+SYNC_INTERVAL = 30        # seconds between background sync attempts
+
+_HEAD = struct.Struct('<IQ')          # record length (after this field), voter_id
+_BODY = struct.Struct('<16sq')        # sign (NUL padded), cast time (ns since epoch)
+_NONCE = 12
+_TAG = 16
+
+
+def _ad(voter_id):
+    return b"ballot:" + str(int(voter_id)).encode('ascii')
+
+
+def seal_ballot(key, voter_id, sign, cast_ns=None):
+    """One queue record for voter_id's ballot. Raises ValueError for a sign the record cannot hold."""
+    sign = str(sign).encode('utf-8')
+    if len(sign) > _BODY.size - 8:
+        raise ValueError(f"candidate sign longer than {_BODY.size - 8} bytes: {sign!r}")
+    body = _BODY.pack(sign, cast_ns or time.time_ns())
+    nonce, ciphertext = crypto_utils.encrypt_bytes_aes_gcm(key, body, _ad(voter_id))
+    return _HEAD.pack(_NONCE + len(ciphertext) + 8, int(voter_id)) + nonce + ciphertext
+
+
+def split_records(blob):
+    """[(voter_id, record bytes)] for the complete records at the start of blob."""
+    out = []
+    pos = 0
+    while pos + _HEAD.size <= len(blob):
+        length, vid = _HEAD.unpack_from(blob, pos)
+        end = pos + 4 + length
+        if length < 8 + _NONCE + _TAG or end > len(blob):
+            break
+        out.append((vid, blob[pos:end]))
+        pos = end
+    return out
+
+
+def open_record(key, record):
+    """(voter_id, sign, cast_ns) of a sealed record; raises if it does not authenticate."""
+    _, vid = _HEAD.unpack_from(record)
+    nonce = record[_HEAD.size:_HEAD.size + _NONCE]
+    body = crypto_utils.decrypt_bytes_aes_gcm(key, nonce, record[_HEAD.size + _NONCE:], _ad(vid))
+    sign, cast_ns = _BODY.unpack(body)
+    return vid, sign.rstrip(b'\0').decode('utf-8'), cast_ns
+
+
+class OfflineQueue:
+    """The booth's durable queue of sealed ballots (one file, append-only between syncs)."""
+
+    def __init__(self, path=QUEUE_PATH, key=None):
+        self.path = Path(path)
+        self._key = key             # callable returning the master key
+        self.lock = threading.Lock()
+        self.voters = set()         # voter ids with a queued ballot
+        self.size = 0
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        blob = self.path.read_bytes()
+        records = split_records(blob)
+        good = sum(len(r) for _, r in records)
+        if good != len(blob):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+        self.voters = {vid for vid, _ in records}
+        self.size = good
+
+    def key(self):
+        if self._key is None:
+            import dframe as df
+            self._key = df._get_master_key_interactive
+        return self._key()
+
+    def __len__(self):
+        return len(self.voters)
+
+    def has(self, voter_id):
+        try:
+            return int(voter_id) in self.voters
+        except (TypeError, ValueError):
+            return False
+
+    def append(self, voter_id, sign):
+        """Seal and durably queue one ballot. Returns False if this voter already has one queued."""
+        record = seal_ballot(self.key(), voter_id, sign)
+        with self.lock:
+            if int(voter_id) in self.voters:
+                return False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self.voters.add(int(voter_id))
+            self.size += len(record)
+        return True
+
+    def pending(self):
+        """(bytes covered, [(voter_id, record)]) of everything queued now."""
+        with self.lock:
+            if not self.size:
+                return 0, []
+            with open(self.path, 'rb') as f:
+                blob = f.read(self.size)
+        return len(blob), split_records(blob)
+
+    def drop_synced(self, upto, rejected=(), keep=()):
+        """
+        Remove the first upto bytes (already answered by the server) except
+        the keep records; rejected records are kept aside.
+        """
+        with self.lock:
+            if rejected:
+                with open(self.path.with_suffix('.rejected'), 'ab') as f:
+                    f.write(b''.join(rejected))
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(self.path, 'rb') as f:
+                f.seek(upto)
+                rest = b''.join(keep) + f.read()
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(rest)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.voters = {vid for vid, _ in split_records(rest)}
+            self.size = len(rest)
+
+    def sync(self, client, chunk=SYNC_CHUNK):
+        """
+        Upload the queue over client (anything with request(), e.g. a
+        SessionClient) in MSG_SYNC requests of up to chunk ballots. A client
+        with sync_targets() (shards.ShardedVoteClient) routes every ballot to
+        its voter's shard. Returns {"Accepted": n, "Duplicate": n, "Rejected": n};
+        raises the last connection error after keeping the unanswered ballots.
+        """
+        covered, records = self.pending()
+        route = getattr(client, 'sync_targets', None)
+        targets = [route(vid) if route else [None] for vid, _ in records]
+        answers = {}          # record index -> Accepted | Duplicate | Rejected
+        error = None
+        todo = list(range(len(records)))
+        while todo:
+            groups = {}
+            for i in todo:
+                target = targets[i].pop(0)
+                groups.setdefault(None if target is None else target['name'], (target, []))[1].append(i)
+            for target, part in groups.values():
+                for n in range(0, len(part), chunk):
+                    try:
+                        self._upload(client, target, [(i, records[i][1]) for i in part[n:n + chunk]], answers)
+                    except (OSError, proto.ProtocolError) as e:
+                        error = e
+                        break
+            # a ballot one shard does not know may belong to another
+            todo = [i for i in todo if answers.get(i) == 'Rejected' and targets[i]]
+
+        summary = {'Accepted': 0, 'Duplicate': 0, 'Rejected': 0}
+        for status in answers.values():
+            summary[status] += 1
+        if answers:
+            self.drop_synced(covered,
+                             rejected=[r for i, (_, r) in enumerate(records) if answers.get(i) == 'Rejected'],
+                             keep=[r for i, (_, r) in enumerate(records) if i not in answers])
+        if error is not None:
+            raise error
+        return summary
+
+    def _upload(self, client, target, part, answers):
+        """One MSG_SYNC request for part ([(index, record)]); stores each record's status in answers."""
+        blob = b''.join(r for _, r in part)
+        payload = {'booth': BOOTH_ID or _hostname(), 'records': base64.b64encode(blob).decode('ascii')}
+        if target is None:
+            reply = client.request(proto.MSG_SYNC, payload)
+        else:
+            reply = client.request(proto.MSG_SYNC, payload, shard=target)
+        if reply.get('status') == "Malformed":
+            # the server could not split the upload into records: narrow it down
+            # and set aside the single record it cannot read
+            if len(part) == 1:
+                print("Offline ballot unreadable by the server:", reply.get('error'))
+                answers[part[0][0]] = 'Rejected'
+                return
+            half = len(part) // 2
+            self._upload(client, target, part[:half], answers)
+            self._upload(client, target, part[half:], answers)
+            return
+        results = reply.get('results', [])
+        if reply.get('status') != "OK" or len(results) != len(part):
+            raise proto.ProtocolError("sync refused: " + str(reply.get('error', reply.get('status'))))
+        for (i, _), status in zip(part, results):
+            answers[i] = status if status in ('Accepted', 'Duplicate') else 'Rejected'
+
+
+def _hostname():
+    import socket
+    return socket.gethostname()
+
+
+_queue = None
+_sync_thread = None
+
+
+def get_queue():
+    """The booth's OfflineQueue (opened on first use)."""
+    global _queue
+    if _queue is None:
+        _queue = OfflineQueue()
+    return _queue
+
+
+def sync_in_background(client_factory=None):
+    """
+    Upload the queue on a daemon thread, retrying every SYNC_INTERVAL until it
+    is empty. The default client is vote_client.open_client(), so a booth with
+    a shard map syncs every ballot to its voter's shard.
+    """
+    global _sync_thread
+    def run():
+        from vote_client import open_client
+        while len(get_queue()):
+            client = None
+            try:
+                client = client_factory() if client_factory else open_client()
+                client.connect()
+                summary = get_queue().sync(client)
+                print("Offline ballots synced:", summary)
+            except Exception as e:
+                print("Offline sync failed, will retry:", e)
+                time.sleep(SYNC_INTERVAL)
+            finally:
+                if client is not None:
+                    client.close()
+    if len(get_queue()) and (_sync_thread is None or not _sync_thread.is_alive()):
+        _sync_thread = threading.Thread(target=run, name="offline-sync", daemon=True)
+        _sync_thread.start()
+
+
+class OfflineClient:
+    """
+    VoteClient stand-in used while the server is unreachable: checks the
+    booth's local roll and queues the ballot. Only votes it has queued itself
+    are known here; cross-booth double votes are resolved by the server's
+    dedupe at sync time.
+    """
+    protocol = "offline"
+
+    def __init__(self, queue=None):
+        self.queue = queue or get_queue()
+        self._voter_id = None
+
+    def connect(self):
+        return True
+
+    def authenticate(self, voter_id, passw):
+        import dframe as df
+        if not df.verify(voter_id, passw):
+            return "InvalidVoter"
+        if self.queue.has(voter_id) or not df.isEligible(voter_id):
+            return "VoteCasted"
+        self._voter_id = voter_id
+        return "Authenticate"
+
+    def cast_vote(self, sign, voter_id=None):
+        if voter_id is None:
+            voter_id = self._voter_id
+        try:
+            ok = voter_id is not None and self.queue.append(voter_id, sign)
+        except Exception as e:
+            print("Offline ballot not stored:", e)
+            ok = False
+        return "Successful" if ok else "Vote Update Failed"
+
+    def close(self):
+        self._voter_id = None
+
+
+def bench(n, client=None):
+    """
+    Seal n ballots into a scratch queue and open them again. With client, the
+    ballots are sealed with the master key for the first n eligible voters of
+    the local roll and synced, so they are real votes: use a test server.
+    """
+    q = OfflineQueue(QUEUE_PATH.with_name("bench.queue"))
+    for p in (q.path, q.path.with_suffix('.rejected')):
+        p.unlink(missing_ok=True)
+    if client is None:
+        key = crypto_utils.generate_key()
+        voters = range(900000000, 900000000 + n)
+    else:
+        import dframe as df
+        key = q.key()
+        roll = df.list_voters()
+        voters = [int(v) for v in roll.loc[roll['hasVoted'].astype(int) == 0, 'voter_id'][:n]]
+    t0 = time.perf_counter()
+    records = [seal_ballot(key, vid, 'nota') for vid in voters]
+    with open(q.path, 'wb') as f:
+        f.write(b''.join(records))
+        os.fsync(f.fileno())
+    t1 = time.perf_counter()
+    opened = [open_record(key, r) for _, r in split_records(b''.join(records))]
+    t2 = time.perf_counter()
+    print(f"seal: {len(records) / (t1 - t0):,.0f} ballots/s   open: {len(opened) / (t2 - t1):,.0f} ballots/s")
+    if client is not None:
+        q._load()
+        t3 = time.perf_counter()
+        summary = q.sync(client)
+        t4 = time.perf_counter()
+        print(f"sync: {len(records) / (t4 - t3):,.0f} ballots/s", summary)
+    q.path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline booth ballot queue")
+    parser.add_argument('--status', action='store_true', help='Show how many ballots are queued')
+    parser.add_argument('--sync', action='store_true', help='Upload the queue (or, with --bench, the benchmark ballots)')
+    parser.add_argument('--bench', type=int, metavar='N', help='Measure seal / open throughput for N ballots; with --sync also upload them (casts real votes: test servers only)')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    args = parser.parse_args()
+
+    client = None
+    if args.sync:
+        from vote_client import SessionClient, get_session, open_client, SERVER_PORT
+        if args.host or args.port:
+            client = SessionClient(get_session(args.host, args.port or SERVER_PORT))
+        else:
+            client = open_client()
+        client.connect()
+    if args.bench:
+        bench(args.bench, client)
+    else:
+        if args.sync:
+            print(get_queue().sync(client))
+        print(len(get_queue()), "ballot(s) queued in", QUEUE_PATH)
@@ -0,0 +1,228 @@
+# passwords.py
+# Salted voter password hashes and a short-lived cache of successful checks.
+#
+#   python passwords.py --calibrate [--budget-ms 100]
+#   python passwords.py --migrate [--storage csv|sqlite] [--workers N]
+#
+# - stored form: pbkdf2_sha256$<iterations>$<salt b64>$<hash b64> in the
+#   voter's passw column; PBKDF2-HMAC-SHA256 comes from crypto_utils
+#   (cryptography), or hashlib when that is not installed (same bytes)
+# - the iteration count is calibrated once so one check costs about
+#   PASSWORD_HASH_BUDGET_MS on this machine, and kept in password_cost.json;
+#   every hash records its own count, so recalibrating never breaks old ones
+# - rows still holding a plaintext password verify as before until
+#   --migrate hashes them all (rows picked with one vectorized mask, hashed
+#   in a process pool, written back in one store write)
+# - VerifyCache remembers a successful check for VERIFY_CACHE_TTL seconds, so
+#   the repeated verify / isEligible calls of one login cost one hash
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from lazy_imports import optional_import
+
+PASSWORD_HASH_BUDGET_MS = 100       # target cost of one password check
+PASSWORD_MIN_ITERATIONS = 100_000
+PASSWORD_COST_PATH = Path("database") / "password_cost.json"
+VERIFY_CACHE_TTL = 120              # seconds a successful check is remembered
+VERIFY_CACHE_MAX_ENTRIES = 10000
+
+_PREFIX = "pbkdf2_sha256$"
+_SALT_BYTES = 16
+
+# ----------------- hashing ----------------- #
+
+def _pbkdf2(password, salt, iterations):
+    crypto = optional_import('crypto_utils')
+    if crypto is not None:
+        return crypto.derive_key_from_passphrase(password, salt, iterations)
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+def is_hashed(stored):
+    return str(stored).startswith(_PREFIX)
+
+
+def calibrate(budget_ms=PASSWORD_HASH_BUDGET_MS, probe=20_000):
+    """Iterations for one PBKDF2 check to take about budget_ms here (best of three probes)."""
+    best = min(_time_probe(probe) for _ in range(3))
+    iterations = int(probe * budget_ms / 1000.0 / best) // 1000 * 1000
+    return max(PASSWORD_MIN_ITERATIONS, iterations)
+
+
+def _time_probe(iterations):
+    t0 = time.perf_counter()
+    _pbkdf2("calibration", b"\0" * _SALT_BYTES, iterations)
+    return time.perf_counter() - t0
+
+
+_iterations = None
+_iterations_lock = threading.Lock()
+
+
+def iterations():
+    """The calibrated iteration count for new hashes (calibrated and saved on first use)."""
+    global _iterations
+    with _iterations_lock:
+        if _iterations is None:
+            try:
+                _iterations = int(json.loads(PASSWORD_COST_PATH.read_text(encoding='utf-8'))['iterations'])
+            except (OSError, ValueError, KeyError):
+                _iterations = save_calibration(calibrate())
+        return _iterations
+
+
+def save_calibration(n, budget_ms=PASSWORD_HASH_BUDGET_MS):
+    PASSWORD_COST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = PASSWORD_COST_PATH.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'iterations': n, 'budget_ms': budget_ms}), encoding='utf-8')
+    os.replace(tmp, PASSWORD_COST_PATH)
+    return n
+
+
+def hash_password(password, n=None):
+    """Stored form of password with a fresh salt."""
+    n = n or iterations()
+    salt = secrets.token_bytes(_SALT_BYTES)
+    digest = _pbkdf2(str(password), salt, n)
+    return (_PREFIX + str(n) + "$" + base64.b64encode(salt).decode('ascii')
+            + "$" + base64.b64encode(digest).decode('ascii'))
+
+
+def check_password(stored, password):
+    """True if password matches the stored hash (or, for an unmigrated row, the stored plaintext)."""
+    stored, password = str(stored), str(password)
+    if not is_hashed(stored):
+        return stored != '' and hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+    try:
+        n, salt, digest = stored[len(_PREFIX):].split('$')
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+        n = int(n)
+    except ValueError:
+        return False
+    return hmac.compare_digest(_pbkdf2(password, salt, n), digest)
+
+
+def _hash_many(args):
+    passwords, n = args
+    return [hash_password(p, n) for p in passwords]
+
+
+def hash_passwords(passwords, workers=None, chunk=256):
+    """hash_password for a list, spread over a process pool when it is long."""
+    passwords = [str(p) for p in passwords]
+    n = iterations()
+    if len(passwords) <= chunk:
+        return _hash_many((passwords, n))
+    parts = [(passwords[i:i + chunk], n) for i in range(0, len(passwords), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [h for hashed in pool.map(_hash_many, parts) for h in hashed]
+
+
+def migrate(workers=None):
+    """Hash every plaintext password of the active storage backend. Returns the number of rows hashed."""
+    import dframe as df
+    roll = df.list_voters()
+    plain = roll['passw'].astype(str)
+    mask = (plain != '') & ~plain.str.startswith(_PREFIX)
+    todo = roll.loc[mask, ['voter_id', 'passw']]
+    if todo.empty:
+        return 0
+    hashed = hash_passwords(todo['passw'].tolist(), workers)
+    df.get_backend().set_passwords(list(zip(todo['voter_id'].astype(str), hashed)))
+    df.clear_verify_cache()
+    return len(todo)
+
+# ----------------- verified-session cache ----------------- #
+
+class VerifyCache:
+    """
+    voter_id -> (HMAC of the password under a per-process key, expiry,
+    eligibility or None). Neither the password nor its stored hash is kept.
+    A ballot must invalidate its voter, so a cached eligibility never
+    outlives the vote.
+    """
+
+    def __init__(self, ttl=VERIFY_CACHE_TTL, max_entries=VERIFY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._key = secrets.token_bytes(32)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _tag(self, password):
+        return hmac.new(self._key, str(password).encode('utf-8'), hashlib.sha256).digest()
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() > entry[1]:
+            del self._entries[key]
+            return None
+        return entry
+
+    def verified(self, voter_id, password):
+        """True if this password was checked for voter_id within the TTL."""
+        tag = self._tag(password)
+        with self._lock:
+            entry = self._fresh(str(voter_id))
+            return entry is not None and hmac.compare_digest(entry[0], tag)
+
+    def put(self, voter_id, password):
+        tag = self._tag(password)
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                for key in [k for k, e in self._entries.items() if now > e[1]]:
+                    del self._entries[key]
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[str(voter_id)] = [tag, now + self.ttl, None]
+
+    def eligible(self, voter_id):
+        """Cached isEligible result for a recently verified voter, or None."""
+        with self._lock:
+            entry = self._fresh(str(voter_id))
+            return None if entry is None else entry[2]
+
+    def set_eligible(self, voter_id, eligible):
+        with self._lock:
+            entry = self._fresh(str(voter_id))
+            if entry is not None:
+                entry[2] = bool(eligible)
+
+    def invalidate(self, voter_id):
+        with self._lock:
+            self._entries.pop(str(voter_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Voter password hashing")
+    parser.add_argument('--calibrate', action='store_true', help='Measure and save the iteration count for the budget')
+    parser.add_argument('--budget-ms', type=float, default=PASSWORD_HASH_BUDGET_MS)
+    parser.add_argument('--migrate', action='store_true', help='Hash every plaintext password in the roll')
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default=None, help='Storage backend to migrate')
+    parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: all cores)')
+    args = parser.parse_args()
+
+    if args.calibrate:
+        n = save_calibration(calibrate(args.budget_ms), args.budget_ms)
+        print(f"{n} PBKDF2 iterations (~{args.budget_ms:.0f} ms per check), saved to {PASSWORD_COST_PATH}")
+    if args.migrate:
+        import dframe as df
+        df.set_backend(args.storage or df.STORAGE_BACKEND)
+        t0 = time.perf_counter()
+        done = migrate(args.workers)
+        df.flush_voters()
+        print(f"Hashed {done} passwords in {time.perf_counter() - t0:.1f}s at {iterations()} iterations")
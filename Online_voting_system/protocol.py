@@ -0,0 +1,148 @@
+# protocol.py
+# Length-prefixed wire protocol shared by Server.py and the booth clients.
+#
+#   frame   = header + payload
+#   header  = magic b'OV' | version (u8) | message type (u8) | payload length (u32, big endian)
+#   payload = UTF-8 JSON object (may be empty)
+#
+# A connection carries any number of request frames; the server answers each
+# one with a RESULT frame, in order. A request may carry an optional "rid"
+# which is echoed in its reply so clients can pipeline. The one exception is
+# MSG_SUBSCRIBE: after its RESULT the server only pushes MSG_TALLY frames.
+#
+# The tally is for the admin screen and the shard coordinator, not for the
+# booths: MSG_RESULT and MSG_SUBSCRIBE carry {"token"}, the observer token in
+# RESULTS_TOKEN_PATH, and are answered NotAuthorized without it. The server
+# creates the file on first start; copy it to the machines that read results
+# (shards.py --split copies it to every shard).
+import base64
+import json
+import os
+import secrets
+import struct
+from pathlib import Path
+
+PROTOCOL_VERSION = 1
+MAGIC = b'OV'
+HEADER = struct.Struct('!2sBBI')
+MAX_PAYLOAD = 1 << 20   # 1 MiB; larger frames are rejected as corrupt
+
+# message types
+MSG_HELLO  = 0   # server -> client banner: {"version"}
+MSG_AUTH   = 1   # {"voter_id", "passw"}  -> RESULT {"status": Authenticate | VoteCasted | InvalidVoter}
+MSG_VOTE   = 2   # {"voter_id", "sign"}   -> RESULT {"status": Successful | Vote Update Failed}
+MSG_RESULT = 3   # reply to every request; as a request ({"token"}) it asks for the tally -> {"status": OK | NotAuthorized, "counts"}
+MSG_BATCH  = 4   # {"requests": [{"type", "payload"}, ...]} -> RESULT {"status", "results": [...]}
+MSG_MATCH  = 5   # match_service.py job: {"op": verify | identify, "image", "shape", ...} -> RESULT {"status", "score" | "hits"}
+MSG_VERIFY_BIO = 6   # {"voter_id", "descriptors"} (after AUTH) -> RESULT {"status": Match | NoMatch | NoTemplate | NotAuthenticated, "score", "name"}
+MSG_SUBSCRIBE = 7    # {"token"} -> RESULT {"status", "version", "counts"}; the connection then only carries MSG_TALLY pushes
+MSG_TALLY  = 8   # server -> subscriber push: {"base", "version", "delta": {sign: n}} (empty delta = heartbeat)
+MSG_PING   = 9   # {} -> RESULT {"status": "OK"}; keeps an idle booth session open
+MSG_SYNC   = 10  # {"booth", "records": base64 offline_queue records} -> RESULT {"status": OK | Malformed, "results": [Accepted | Duplicate | Rejected], "accepted"}
+MSG_LOGOUT = 11  # {"voter_id"} -> RESULT {"status": "OK"}; ends a voter's turn on a shared booth connection
+
+# Compatibility switch used by both sides when nothing else is configured:
+#   "framed" - this protocol
+#   "text"   - the original banner / 'voter_id password' / sign exchange over bare recv(1024)
+WIRE_PROTOCOL = "framed"
+
+RESULTS_TOKEN_PATH = Path("database") / "results_token"
+
+
+def load_results_token(create=False, path=None):
+    """The observer token, or None if there is none here (create=True makes one)."""
+    path = Path(path or RESULTS_TOKEN_PATH)
+    try:
+        return path.read_text(encoding='ascii').strip() or None
+    except FileNotFoundError:
+        if not create:
+            return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return load_results_token(path=path)     # another process made it first
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(secrets.token_urlsafe(32))
+    return load_results_token(path=path)
+
+
+class ProtocolError(Exception):
+    """Malformed, oversized or unsupported frame."""
+
+
+def encode_frame(msg_type, payload=None):
+    body = json.dumps(payload or {}).encode('utf-8')
+    if len(body) > MAX_PAYLOAD:
+        raise ProtocolError(f"payload too large ({len(body)} bytes)")
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, len(body)) + body
+
+
+def decode_header(header):
+    """Return (msg_type, payload_length) from a HEADER.size byte string."""
+    magic, version, msg_type, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError("bad magic (text-protocol peer?)")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"payload too large ({length} bytes)")
+    return msg_type, length
+
+
+def decode_payload(body):
+    if not body:
+        return {}
+    try:
+        payload = json.loads(body.decode('utf-8'))
+    except ValueError as e:
+        raise ProtocolError(f"bad payload: {e}")
+    if not isinstance(payload, dict):
+        raise ProtocolError("payload must be a JSON object")
+    return payload
+
+
+def encode_descriptors(descriptors):
+    """ORB descriptors (n, 32) uint8 -> base64 text for a JSON payload (~21 KB for 500 keypoints)."""
+    return base64.b64encode(descriptors.tobytes()).decode('ascii')
+
+
+def decode_descriptors(text, width=32):
+    """Inverse of encode_descriptors; returns a (n, width) uint8 numpy array."""
+    import numpy as np
+    raw = base64.b64decode(text)
+    if len(raw) % width:
+        raise ProtocolError("descriptor payload is not a whole number of rows")
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, width)
+
+# --- blocking sockets --- #
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def send_frame(sock, msg_type, payload=None):
+    sock.sendall(encode_frame(msg_type, payload))
+
+
+def recv_frame(sock):
+    """Read one frame; returns (msg_type, payload dict). Raises ConnectionError on EOF."""
+    msg_type, length = decode_header(_recv_exact(sock, HEADER.size))
+    return msg_type, decode_payload(_recv_exact(sock, length))
+
+# --- asyncio streams --- #
+
+async def read_frame(reader):
+    """asyncio counterpart of recv_frame. Raises asyncio.IncompleteReadError on EOF."""
+    msg_type, length = decode_header(await reader.readexactly(HEADER.size))
+    return msg_type, decode_payload(await reader.readexactly(length))
+
+
+def write_frame(writer, msg_type, payload=None):
+    writer.write(encode_frame(msg_type, payload))
@@ -1,74 +1,18 @@
 # register_with_eye.py (camera index selection; email option removed)
 import tkinter as tk
 from tkinter import ttk, Label, Entry, Button, Frame, Message, LEFT, Spinbox
-import numpy as np
-import cv2
 import dframe as df    # updated dframe.py (must provide save_eye_template, list_voters, load_eye_template, taking_data_voter)
+import eye_gallery
+import eye_index
+from biometric import describe, fuse_templates, MATCH_THRESHOLD, ENROL_FRAMES
+import camera
 import re
 
-# ORB + capture logic; descriptors will be saved via df.save_eye_template()
-ORB_N_FEATURES = 500
-MATCH_THRESHOLD = 10
+# capture logic; ORB descriptors come from biometric and are saved via df.save_eye_template()
 
 def capture_eye_image(camera_index=0, window_name="Capture Eye - press 'c' to capture, 'q' to cancel"):
-    """Capture ROI from the specified camera_index and return grayscale ROI or None."""
-    try:
-        cam_index = int(camera_index)
-    except Exception:
-        cam_index = 0
-
-    cap = cv2.VideoCapture(cam_index)
-    if not cap.isOpened():
-        print(f"Camera {cam_index} not available.")
-        return None
-    captured = None
-    while True:
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            break
-        h, w = frame.shape[:2]
-        cv2.rectangle(frame, (int(w*0.25), int(h*0.2)), (int(w*0.75), int(h*0.8)), (255,255,255), 2)
-        cv2.putText(frame, f"Cam {cam_index} - Place eye in box. Press 'c' to capture, 'q' to cancel.", (10,30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 1)
-        cv2.imshow(window_name, frame)
-        k = cv2.waitKey(1) & 0xFF
-        if k == ord('c'):
-            roi = frame[int(h*0.2):int(h*0.8), int(w*0.25):int(w*0.75)]
-            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-            captured = gray
-            break
-        elif k == ord('q'):
-            break
-    cap.release()
-    cv2.destroyAllWindows()
-    return captured
-
-def make_descriptors(img_gray):
-    if img_gray is None:
-        return None
-    orb = cv2.ORB_create(ORB_N_FEATURES)
-    kps, des = orb.detectAndCompute(img_gray, None)
-    return des
-
-from cv2 import BFMatcher
-
-def match_templates(des1, des2):
-    if des1 is None or des2 is None:
-        return 0
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    try:
-        matches = bf.knnMatch(des1, des2, k=2)
-    except cv2.error:
-        return 0
-    good = []
-    for m_n in matches:
-        if len(m_n) < 2:
-            continue
-        m, n = m_n
-        if m.distance < 0.75 * n.distance:
-            good.append(m)
-    return len(good)
-
+    """Capture ROI from the specified camera_index (kept open by camera.py) and return grayscale ROI or None."""
+    return camera.capture_eye_image(camera_index, window_name)
 
 def reg_server(root, frame1, name, gender, zone, city, passw, age, descriptors, raw_image):
     # Basic checks
@@ -88,20 +32,18 @@ def reg_server(root, frame1, name, gender, zone, city, passw, age, descriptors,
         msg.grid(row = 13, column = 0, columnspan = 5)
         return -1
 
-    # check for duplicates: same password AND matching eye template
+    # check for duplicates: matching eye template anywhere in the electorate
     try:
-        voters_df = df.list_voters()
-        candidates = voters_df[voters_df['passw'].astype(str) == str(passw)]
-        for _, r in candidates.iterrows():
-            vid = r['voter_id']
-            stored = df.load_eye_template(vid)
-            if stored is None:
-                continue
-            score = match_templates(descriptors, stored)
-            if score >= MATCH_THRESHOLD:
-                msg = Message(frame1, text=f"A voter with the same password and eye template already exists (Voter ID: {vid}).", width=500)
-                msg.grid(row = 13, column = 0, columnspan = 5)
-                return -1
+        if eye_index.index_built():
+            # sublinear LSH lookup once the 1:N index exists
+            hits = eye_index.identify(descriptors, MATCH_THRESHOLD, limit=1)
+        else:
+            hits = eye_gallery.get_gallery().search(descriptors, MATCH_THRESHOLD, limit=1)
+        if hits:
+            vid = hits[0][0]
+            msg = Message(frame1, text=f"A voter with a matching eye template already exists (Voter ID: {vid}).", width=500)
+            msg.grid(row = 13, column = 0, columnspan = 5)
+            return -1
     except Exception as e:
         print("Duplicate check failed (continuing):", e)
 
@@ -176,22 +118,24 @@ def Register(root, frame1):
 
     # camera spinbox (0..10)
     Spinbox(frame1, from_=0, to=10, textvariable=camera_var, width=5).grid(row=2, column=2, sticky='w')
+    camera.get_camera(camera_var.get())   # open the default camera while the form is filled in
 
     captured = {"img": None, "des": None}
 
     def on_capture():
         cam_idx = camera_var.get()
-        img = capture_eye_image(cam_idx)
-        if img is None:
+        # several frames fused into one template (biometric.fuse_templates)
+        imgs = camera.capture_eye_burst(cam_idx, ENROL_FRAMES, "Capture Eye - press 'c' to capture, 'q' to cancel")
+        if not imgs:
             Message(frame1, text=f"Capture cancelled or camera {cam_idx} not available.", width=500).grid(row = 12, column = 0, columnspan = 5)
             return
-        des = make_descriptors(img)
+        des = fuse_templates(describe(imgs))
         if des is None:
             Message(frame1, text="No keypoints found. Try recapturing with better lighting.", width=500).grid(row = 12, column = 0, columnspan = 5)
             return
-        captured['img'] = img
+        captured['img'] = imgs[0]
         captured['des'] = des
-        Message(frame1, text=f"Eye captured successfully from camera {cam_idx}. Now press Register.", width=500).grid(row = 12, column = 0, columnspan = 5)
+        Message(frame1, text=f"Eye captured successfully from camera {cam_idx} ({len(imgs)} frames, {len(des)} features). Now press Register.", width=500).grid(row = 12, column = 0, columnspan = 5)
 
     reg_btn = Button(frame1, text="Capture Eye", command=on_capture, width=12)
     reg_btn.grid(row = 10, column = 2)
@@ -0,0 +1,380 @@
+# shards.py
+# Sharded deployment: voters are partitioned by zone across several Server.py
+# processes (or machines), each with its own database/ directory.
+#
+#   python shards.py --init-map 3 [--host 127.0.0.1] [--base-port 4101]
+#   python shards.py --split      # write database/shards/<name>/database/
+#   python shards.py --serve      # one local Server.py per shard
+#   python shards.py --results    # merged tally of every shard
+#
+# - database/shard_map.json lists the shards ({"name", "host", "port",
+#   "zones", "ids"}); a zone not listed goes to crc32(zone) % number of shards
+# - --split gives every shard its own block of SHARD_ID_SPAN voter ids above
+#   the split roll ("ids": [first, last], also written to the shard's
+#   database/voter_ids.json), so voters registered on different shards never
+#   share an id and a new voter's id names their shard
+# - booths connect to the shard of BOOTH_ZONE through ShardedVoteClient; a
+#   voter registered in another zone is found by asking the other shards
+# - CoordinatorBackend answers dframe.show_result() with the sum of every
+#   shard's MSG_RESULT, so the admin screens work unchanged on a coordinator
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+import dframe as df
+import protocol as proto
+import vote_client
+from vote_client import VoteClient
+
+SHARD_MAP = Path("database") / "shard_map.json"
+SHARDS_DIR = Path("database") / "shards"
+BOOTH_ZONE = ""           # zone of this booth; "" connects to the first shard
+RESULT_TIMEOUT = 5        # seconds a shard gets to answer MSG_RESULT
+SHARD_ID_SPAN = 1_000_000   # voter ids reserved for each shard's new registrations
+
+
+class ShardError(Exception):
+    """
+    A shard could not be reached, so a merged answer would be incomplete, or
+    an operation that belongs to the shards was asked of the coordinator.
+    """
+
+
+def _zone_key(zone):
+    return str(zone).strip().lower()
+
+
+class ShardMap:
+    """Zone -> shard routing table."""
+
+    def __init__(self, shards):
+        if not shards:
+            raise ValueError("a shard map needs at least one shard")
+        self.shards = [dict(s, zones=[_zone_key(z) for z in s.get('zones', [])]) for s in shards]
+        self._by_zone = {z: s for s in self.shards for z in s['zones']}
+
+    @classmethod
+    def load(cls, p=SHARD_MAP):
+        return cls(json.loads(Path(p).read_text(encoding='utf-8'))['shards'])
+
+    def save(self, p=SHARD_MAP):
+        p = Path(p)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'shards': self.shards}, indent=2), encoding='utf-8')
+        os.replace(tmp, p)
+
+    def shard_for_zone(self, zone):
+        key = _zone_key(zone)
+        shard = self._by_zone.get(key)
+        if shard is None:
+            shard = self.shards[zlib.crc32(key.encode('utf-8')) % len(self.shards)]
+        return shard
+
+    def shard_names(self, zones):
+        """Shard name for every zone in a pandas Series (one lookup per distinct zone)."""
+        names = {z: self.shard_for_zone(z)['name'] for z in zones.unique()}
+        return zones.map(names)
+
+    def shard_for_voter(self, voter_id):
+        """The shard whose id block holds voter_id (registered after the split), or None."""
+        try:
+            vid = int(voter_id)
+        except (TypeError, ValueError):
+            return None
+        for shard in self.shards:
+            ids = shard.get('ids')
+            if ids and ids[0] <= vid <= ids[1]:
+                return shard
+        return None
+
+    def assign_id_ranges(self, above, span=SHARD_ID_SPAN):
+        """
+        Give every shard a disjoint block of span ids, all greater than above
+        (the highest id in the roll being split). Blocks already in the map
+        are kept if they still lie above it.
+        """
+        blocks = [s.get('ids') for s in self.shards]
+        if all(blocks) and min(b[0] for b in blocks) > above:
+            return
+        start = (int(above) // span + 1) * span + 1
+        for i, shard in enumerate(self.shards):
+            shard['ids'] = [start + i * span, start + (i + 1) * span - 1]
+
+
+def build_shard_map(zone_counts, n, host="127.0.0.1", base_port=4101):
+    """
+    Spread zones over n shards, largest zone first onto the emptiest shard, so
+    shards carry similar numbers of voters. zone_counts: {zone: voters}.
+    """
+    shards = [{'name': f"shard{i}", 'host': host, 'port': base_port + i, 'zones': []} for i in range(n)]
+    load = [0] * n
+    for zone, count in sorted(zone_counts.items(), key=lambda kv: -kv[1]):
+        i = load.index(min(load))
+        shards[i]['zones'].append(zone)
+        load[i] += count
+    return ShardMap(shards)
+
+
+def shard_dir(shard, root=SHARDS_DIR):
+    """Working directory of a shard's server (its data is in <dir>/database/)."""
+    return Path(root) / shard['name']
+
+
+def split_roll(shard_map, root=SHARDS_DIR):
+    """
+    Write each shard's voterList.csv and cand_list.csv from this node's roll,
+    and its block of new voter ids (voter_ids.json; the blocks are added to
+    shard_map, which the caller saves). Candidates go to every shard;
+    existing Vote Counts stay with the first shard so the merged tally equals
+    the unsharded one. Eye templates are copied with their voters only.
+    Returns {shard name: voters}.
+    """
+    voters = df.list_voters()
+    names = shard_map.shard_names(voters['zone'])
+    cands = df._read_csv_safe(df.path / 'cand_list.csv')
+    counts = df.show_result()
+    ids = pd.to_numeric(voters['voter_id'], errors='coerce')
+    shard_map.assign_id_ranges(int(ids.max()) if ids.notna().any() else 10000)
+    token = proto.load_results_token(create=True)     # one observer token for merge_results
+    done = {}
+    for i, shard in enumerate(shard_map.shards):
+        data = shard_dir(shard, root) / "database"
+        (data / "eye_templates").mkdir(parents=True, exist_ok=True)
+        part = voters[names == shard['name']]
+        part.to_csv(data / "voterList.csv", index=False)
+        first, last = shard['ids']
+        (data / df.VOTER_ID_RANGE.name).write_text(json.dumps({'first': first, 'last': last}), encoding='utf-8')
+        (data / proto.RESULTS_TOKEN_PATH.name).write_text(token, encoding='ascii')
+        c = cands.copy()
+        if not c.empty and 'sign' in c.columns:
+            c['Vote Count'] = [counts.get(str(s), 0) if i == 0 else 0 for s in c['sign']]
+        c.to_csv(data / "cand_list.csv", index=False)
+        for vid in part.loc[part['eye_template'] != '', 'voter_id']:
+            src = df.get_eye_template_path(vid)
+            if src and Path(src).parent == df.EYE_TEMPLATES_DIR:
+                shutil.copy2(src, data / "eye_templates" / Path(src).name)
+        if df.EYE_TEMPLATE_PACK.exists():
+            df.get_template_store().copy_to(data / df.EYE_TEMPLATE_PACK.name, part['voter_id'])
+        done[shard['name']] = len(part)
+    return done
+
+
+def serve(shard_map, root=SHARDS_DIR, server_args=()):
+    """Start one Server.py per shard, each in its own shard directory. Returns the Popen objects."""
+    server = Path(__file__).resolve().parent / "Server.py"
+    procs = []
+    for shard in shard_map.shards:
+        cmd = [sys.executable, str(server), '--host', shard['host'], '--port', str(shard['port'])] + list(server_args)
+        procs.append(subprocess.Popen(cmd, cwd=str(shard_dir(shard, root))))
+        print("Started", shard['name'], "on", shard['host'] + ":" + str(shard['port']), "zones:", ', '.join(shard['zones']) or '(hashed)')
+    return procs
+
+
+def shard_results(shard, timeout=RESULT_TIMEOUT):
+    """One shard's tally over MSG_RESULT. Raises ShardError if it cannot be reached."""
+    client = VoteClient(shard['host'], shard['port'], timeout=timeout)
+    try:
+        if not client.connect():
+            raise ShardError(f"{shard['name']}: unexpected banner")
+        return client.results()
+    except (OSError, proto.ProtocolError) as e:
+        raise ShardError(f"{shard['name']} ({shard['host']}:{shard['port']}): {e}")
+    finally:
+        client.close()
+
+
+def merge_results(shard_map, timeout=RESULT_TIMEOUT):
+    """Sum of every shard's tally, queried in parallel. Raises ShardError if any shard is missing."""
+    with ThreadPoolExecutor(max_workers=len(shard_map.shards)) as pool:
+        parts = list(pool.map(lambda s: shard_results(s, timeout), shard_map.shards))
+    merged = {}
+    for counts in parts:
+        for sign, n in counts.items():
+            merged[sign] = merged.get(sign, 0) + int(n)
+    return merged
+
+
+class ShardedVoteClient:
+    """
+    VoteClient routed through a ShardMap. Connects to the shard of the booth's
+    zone; a voter registered after the split logs in on the shard owning their
+    id, anyone else starts on the booth's shard. A voter that shard does not
+    know (InvalidVoter) is tried on the other shards, and the rest of their
+    session stays on the shard that accepted them.
+    """
+
+    def __init__(self, shard_map=None, zone=None, timeout=None):
+        self.shard_map = shard_map or ShardMap.load()
+        zone = BOOTH_ZONE if zone is None else zone
+        self.home = self.shard_map.shard_for_zone(zone) if zone else self.shard_map.shards[0]
+        self.timeout = timeout
+        self.clients = {}     # shard name -> connected VoteClient
+        self.active = None
+        self.protocol = "framed"
+
+    def _client(self, shard):
+        client = self.clients.get(shard['name'])
+        if client is None:
+            if vote_client.POOLED_SESSION:
+                client = vote_client.SessionClient(vote_client.get_session(shard['host'], shard['port']))
+            else:
+                client = VoteClient(shard['host'], shard['port'], timeout=self.timeout)
+            if not client.connect():
+                client.close()
+                raise ConnectionError(f"{shard['name']}: unexpected banner")
+            self.clients[shard['name']] = client
+        return client
+
+    def connect(self):
+        self.active = self._client(self.home)
+        return True
+
+    def authenticate(self, voter_id, passw):
+        first = self.shard_map.shard_for_voter(voter_id) or self.home
+        reply = self._client(first).authenticate(voter_id, passw)
+        self.active = self.clients[first['name']]
+        if reply != "InvalidVoter":
+            return reply
+        for shard in self.shard_map.shards:
+            if shard is first:
+                continue
+            try:
+                client = self._client(shard)
+            except OSError as e:
+                print("Shard unreachable:", shard['name'], e)
+                continue
+            reply = client.authenticate(voter_id, passw)
+            if reply != "InvalidVoter":
+                self.active = client
+                return reply
+        return "InvalidVoter"
+
+    def cast_vote(self, sign, voter_id=None):
+        return self.active.cast_vote(sign, voter_id)
+
+    def request(self, msg_type, payload=None, shard=None):
+        """One framed request to shard (a shard map entry; default the booth's home shard)."""
+        return self._client(shard or self.home).request(msg_type, payload)
+
+    def sync_targets(self, voter_id):
+        """
+        Shards to offer voter_id's offline ballot to (offline_queue.sync): the
+        shard owning their id, else the shard of their zone in this node's
+        roll, first; then the others.
+        """
+        first = self.shard_map.shard_for_voter(voter_id)
+        if first is None:
+            row = df.get_voter_row(voter_id)
+            first = self.shard_map.shard_for_zone(row['zone']) if row and row.get('zone') else self.home
+        return [first] + [s for s in self.shard_map.shards if s is not first]
+
+    def verify_biometric(self, descriptors, voter_id=None):
+        return self.active.verify_biometric(descriptors, voter_id)
+
+    def results(self):
+        return merge_results(self.shard_map, self.timeout or RESULT_TIMEOUT)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        self.clients = {}
+        self.active = None
+
+
+class CoordinatorBackend(df.StorageBackend):
+    """
+    Backend for the coordinator node (dframe.set_backend(CoordinatorBackend())):
+    show_result() is the merged tally of every shard. Voter operations belong
+    to the shards; here they raise ShardError saying where to run them.
+    """
+
+    def __init__(self, shard_map=None, timeout=RESULT_TIMEOUT):
+        self.shard_map = shard_map or ShardMap.load()
+        self.timeout = timeout
+
+    def show_result(self):
+        return merge_results(self.shard_map, self.timeout)
+
+    def verify(self, vid, passw):
+        raise ShardError("voters log in on their zone's shard, not on the coordinator")
+
+    def isEligible(self, vid):
+        raise ShardError("eligibility is kept by the voter's shard; the coordinator has no roll")
+
+    def vote_update(self, sign, vid):
+        raise ShardError("ballots are cast on the voter's shard (ShardedVoteClient), not on the coordinator")
+
+    def vote_update_many(self, ballots):
+        raise ShardError("ballot batches are committed by each shard's server, not by the coordinator")
+
+    def taking_data_voter(self, name, gender, zone, city, passw, age=18):
+        raise ShardError("register a voter on the shard of their zone")
+
+    def next_voter_id(self):
+        raise ShardError("voter ids are assigned by each shard")
+
+    def add_voters_bulk(self, df_new):
+        raise ShardError("import rolls before splitting them (shards.py --split), or into each shard")
+
+    def set_passwords(self, pairs):
+        raise ShardError("passwords live on the shards: run passwords.py --migrate on each one")
+
+    def set_eye_template_filename(self, voter_id, filename):
+        raise ShardError("eye templates are enrolled on the voter's shard")
+
+    def get_voter_row(self, voter_id):
+        raise ShardError("the coordinator holds no voter rows; ask the voter's shard")
+
+    def list_voters(self):
+        raise ShardError("the coordinator holds no voter roll; each shard lists its own")
+
+    def count_reset(self):
+        raise ShardError("reset the counts on every shard; the coordinator only merges them")
+
+    def reset_voter_list(self):
+        raise ShardError("the voter roll is reset on each shard, not on the coordinator")
+
+    def reset_cand_list(self):
+        raise ShardError("the candidate list is reset on each shard, not on the coordinator")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zone-sharded vote servers")
+    parser.add_argument('--map', default=str(SHARD_MAP), help='Shard map file')
+    parser.add_argument('--init-map', type=int, metavar='N', help='Write a map spreading the roll\'s zones over N shards')
+    parser.add_argument('--host', default="127.0.0.1", help='Host for --init-map shards')
+    parser.add_argument('--base-port', type=int, default=4101, help='Port of the first --init-map shard')
+    parser.add_argument('--split', action='store_true', help='Write every shard\'s database from this roll')
+    parser.add_argument('--serve', action='store_true', help='Run one local Server.py per shard until Ctrl+C')
+    parser.add_argument('--results', action='store_true', help='Print the merged tally')
+    args, server_args = parser.parse_known_args()
+
+    if args.init_map:
+        zones = df.list_voters()['zone'].map(_zone_key).value_counts()
+        build_shard_map(zones.to_dict(), args.init_map, args.host, args.base_port).save(args.map)
+        print("Wrote", args.map)
+    shard_map = ShardMap.load(args.map)
+    if args.split:
+        for name, n in split_roll(shard_map).items():
+            print(f"{name}: {n} voters")
+        shard_map.save(args.map)
+    if args.serve:
+        procs = serve(shard_map, server_args=server_args)
+        try:
+            for p in procs:
+                p.wait()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.wait()
+    if args.results:
+        for sign, n in merge_results(shard_map).items():
+            print(f"{sign:>8}: {n}")
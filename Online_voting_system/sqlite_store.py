@@ -0,0 +1,222 @@
+# sqlite_store.py
+# SQLite storage backend for dframe (select with dframe.set_backend("sqlite")
+# or STORAGE_BACKEND = "sqlite").
+#
+# - WAL journal mode: readers never block the writer or each other;
+#   synchronous=FULL fsyncs the WAL on every commit, so a vote (or a group
+#   commit batch) is durable before it is reported Successful
+# - voter_id is the INTEGER PRIMARY KEY, so every lookup is one b-tree probe
+# - the SQL below is constant text, so sqlite3's statement cache reuses the
+#   prepared statements on every call
+# - a vote is one transaction: conditional hasVoted update + tally increment
+import sqlite3
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import dframe as df
+import passwords
+from dframe import StorageBackend, VOTER_COLS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS voters (
+    voter_id     INTEGER PRIMARY KEY,
+    name         TEXT NOT NULL DEFAULT '',
+    gender       TEXT NOT NULL DEFAULT '',
+    zone         TEXT NOT NULL DEFAULT '',
+    city         TEXT NOT NULL DEFAULT '',
+    age          INTEGER NOT NULL DEFAULT 18,
+    passw        TEXT NOT NULL DEFAULT '',
+    hasVoted     INTEGER NOT NULL DEFAULT 0,
+    eye_template TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS tally (
+    sign  TEXT PRIMARY KEY,
+    name  TEXT NOT NULL DEFAULT '',
+    votes INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_SQL_VOTER       = "SELECT voter_id, name, gender, zone, city, age, passw, hasVoted, eye_template FROM voters WHERE voter_id = ?"
+_SQL_PASSW       = "SELECT passw FROM voters WHERE voter_id = ?"
+_SQL_HAS_VOTED   = "SELECT hasVoted FROM voters WHERE voter_id = ?"
+_SQL_CLAIM       = "UPDATE voters SET hasVoted = 1 WHERE voter_id = ? AND hasVoted = 0"
+_SQL_COUNT       = "UPDATE tally SET votes = votes + 1 WHERE sign = ?"
+_SQL_RESULT      = "SELECT sign, votes FROM tally ORDER BY rowid"
+_SQL_SET_EYE     = "UPDATE voters SET eye_template = ? WHERE voter_id = ?"
+_SQL_SET_PASSW   = "UPDATE voters SET passw = ? WHERE voter_id = ?"
+_SQL_ADD_VOTER   = ("INSERT INTO voters (voter_id, name, gender, zone, city, age, passw, hasVoted, eye_template) "
+                    "SELECT COALESCE(MAX(voter_id), 10000) + 1, ?, ?, ?, ?, ?, ?, 0, '' FROM voters")
+_SQL_ADD_IN_RANGE = ("INSERT INTO voters (voter_id, name, gender, zone, city, age, passw, hasVoted, eye_template) "
+                     "SELECT COALESCE(MAX(voter_id), ? - 1) + 1, ?, ?, ?, ?, ?, ?, 0, '' FROM voters "
+                     "WHERE voter_id BETWEEN ? AND ?")
+_SQL_NEXT_IN_RANGE = "SELECT COALESCE(MAX(voter_id), ? - 1) + 1 FROM voters WHERE voter_id BETWEEN ? AND ?"
+_SQL_ALL_VOTERS  = "SELECT voter_id, name, gender, zone, city, age, passw, hasVoted, eye_template FROM voters ORDER BY voter_id"
+
+
+class SqliteBackend(StorageBackend):
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not self.db_path.exists()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        if fresh:
+            self.import_csv()
+
+    def _conn(self):
+        """One connection per thread (sqlite3 connections must not be shared)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30,
+                                   check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def import_csv(self):
+        """Seed the database from voterList.csv / cand_list.csv (one transaction)."""
+        voters = df._normalize_voter_df(df._read_csv_safe(df.path / 'voterList.csv'))
+        cands = df._read_csv_safe(df.path / 'cand_list.csv')
+        rows = [(int(r['voter_id']), r['name'], r['gender'], r['zone'], r['city'],
+                 int(r['age']), r['passw'], int(r['hasVoted']), r['eye_template'])
+                for r in voters.to_dict('records') if str(r['voter_id']).isdigit()]
+        tally = []
+        if not cands.empty and 'sign' in cands.columns:
+            names = cands['Name'] if 'Name' in cands.columns else [''] * len(cands)
+            if 'Vote Count' in cands.columns:
+                counts = pd.to_numeric(cands['Vote Count'], errors='coerce').fillna(0).astype(int)
+            else:
+                counts = [0] * len(cands)
+            tally = [(str(s), str(n), int(c)) for s, n, c in zip(cands['sign'], names, counts)]
+
+        def load(conn):
+            conn.executemany("INSERT OR REPLACE INTO voters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT OR REPLACE INTO tally (sign, name, votes) VALUES (?, ?, ?)", tally)
+        self._write(load)
+        print(f"Imported {len(rows)} voters and {len(tally)} candidates into {self.db_path}")
+
+    # --- StorageBackend --- #
+
+    def verify(self, vid, passw):
+        try:
+            row = self._conn().execute(_SQL_PASSW, (int(vid),)).fetchone()
+        except (TypeError, ValueError):
+            return False
+        return row is not None and passwords.check_password(row[0], passw)
+
+    def isEligible(self, vid):
+        try:
+            row = self._conn().execute(_SQL_HAS_VOTED, (int(vid),)).fetchone()
+        except (TypeError, ValueError):
+            return False
+        return row is not None and int(row[0]) == 0
+
+    def vote_update(self, sign, vid):
+        return self.vote_update_many([(sign, vid)])[0]
+
+    def vote_update_many(self, ballots):
+        def apply(conn):
+            results = []
+            for sign, vid in ballots:
+                try:
+                    vid = int(vid)
+                except (TypeError, ValueError):
+                    results.append(False)
+                    continue
+                # savepoint per ballot: an unknown sign undoes only this voter's claim
+                conn.execute("SAVEPOINT ballot")
+                if conn.execute(_SQL_CLAIM, (vid,)).rowcount == 1 and \
+                        conn.execute(_SQL_COUNT, (str(sign),)).rowcount == 1:
+                    conn.execute("RELEASE ballot")
+                    results.append(True)
+                else:
+                    conn.execute("ROLLBACK TO ballot")
+                    conn.execute("RELEASE ballot")
+                    results.append(False)
+            return results
+        return self._write(apply)
+
+    def show_result(self):
+        return {str(sign): int(votes) for sign, votes in self._conn().execute(_SQL_RESULT)}
+
+    def taking_data_voter(self, name, gender, zone, city, passw, age=18):
+        age = int(age) if age is not None else 18
+        ids = df.voter_id_range()
+        if ids is None:
+            return self._write(lambda conn: conn.execute(
+                _SQL_ADD_VOTER, (name, gender, zone, city, age, passw)).lastrowid)
+
+        def add(conn):
+            vid = conn.execute(_SQL_ADD_IN_RANGE, (ids[0], name, gender, zone, city, age, passw) + ids).lastrowid
+            if vid > ids[1]:
+                raise RuntimeError(f"voter ids {ids[0]}-{ids[1]} of this data directory are used up")
+            return vid
+        return self._write(add)
+
+    def next_voter_id(self):
+        ids = df.voter_id_range()
+        if ids is None:
+            return int(self._conn().execute("SELECT COALESCE(MAX(voter_id), 10000) + 1 FROM voters").fetchone()[0])
+        vid = int(self._conn().execute(_SQL_NEXT_IN_RANGE, (ids[0],) + ids).fetchone()[0])
+        if vid > ids[1]:
+            raise RuntimeError(f"voter ids {ids[0]}-{ids[1]} of this data directory are used up")
+        return vid
+
+    def add_voters_bulk(self, df_new):
+        df.check_new_voter_ids(df_new['voter_id'])
+        cols = [df_new[c].astype(int if c in ('voter_id', 'age', 'hasVoted') else str).tolist() for c in VOTER_COLS]
+        rows = list(zip(*cols))
+        self._write(lambda conn: conn.executemany("INSERT INTO voters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows))
+        return len(rows)
+
+    def set_passwords(self, pairs):
+        rows = [(stored, int(vid)) for vid, stored in pairs]
+        return self._write(lambda conn: conn.executemany(_SQL_SET_PASSW, rows).rowcount)
+
+    def set_eye_template_filename(self, voter_id, filename):
+        return self._write(lambda conn: conn.execute(
+            _SQL_SET_EYE, (filename if filename else '', int(voter_id))).rowcount == 1)
+
+    def get_voter_row(self, voter_id):
+        try:
+            row = self._conn().execute(_SQL_VOTER, (int(voter_id),)).fetchone()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        row = dict(zip(VOTER_COLS, row))
+        row['voter_id'] = str(row['voter_id'])
+        return row
+
+    def list_voters(self):
+        voters = pd.DataFrame(self._conn().execute(_SQL_ALL_VOTERS).fetchall(), columns=VOTER_COLS)
+        voters['voter_id'] = voters['voter_id'].astype(str)
+        return voters
+
+    def count_reset(self):
+        def reset(conn):
+            conn.execute("UPDATE voters SET hasVoted = 0")
+            conn.execute("UPDATE tally SET votes = 0")
+        self._write(reset)
+
+    def reset_voter_list(self):
+        self._write(lambda conn: conn.execute("DELETE FROM voters"))
+
+    def reset_cand_list(self):
+        self._write(lambda conn: conn.execute("DELETE FROM tally"))
@@ -0,0 +1,82 @@
+# template_cache.py
+# Bounded LRU of decrypted eye-template descriptors, used by
+# dframe.load_eye_template so repeat verifications and duplicate checks skip
+# disk read, key lookup and AES-GCM decrypt.
+#
+# - entries expire after TEMPLATE_CACHE_TTL seconds
+# - total descriptor bytes are capped at TEMPLATE_CACHE_MAX_BYTES (LRU eviction)
+# - every entry remembers the (size, mtime_ns) of its file; a stat that no
+#   longer matches (another process re-enrolled the voter) is a miss
+# - cached arrays are read-only; callers that need to modify one must copy it
+import threading
+import time
+from collections import OrderedDict
+
+TEMPLATE_CACHE_TTL = 600                    # seconds
+TEMPLATE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 MiB of descriptors
+TEMPLATE_CACHE_MAX_ENTRIES = 50000
+
+
+class TemplateCache:
+    def __init__(self, ttl=TEMPLATE_CACHE_TTL, max_bytes=TEMPLATE_CACHE_MAX_BYTES,
+                 max_entries=TEMPLATE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # voter_id -> (descriptors, file_sig, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, voter_id, file_sig):
+        """Return the cached descriptors for voter_id if fresh and still matching file_sig, else None."""
+        key = str(voter_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            des, sig, expires_at = entry
+            if sig != file_sig or time.monotonic() > expires_at:
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return des
+
+    def put(self, voter_id, file_sig, descriptors):
+        """Cache descriptors (made read-only) for voter_id; arrays larger than the cap are not cached."""
+        if descriptors is None or file_sig is None:
+            return
+        size = int(getattr(descriptors, 'nbytes', 0))
+        if size > self.max_bytes:
+            return
+        descriptors.setflags(write=False)
+        key = str(voter_id)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (descriptors, file_sig, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, voter_id):
+        with self._lock:
+            self._drop(str(voter_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= int(getattr(entry[0], 'nbytes', 0))
@@ -0,0 +1,436 @@
+# template_store.py
+# Packed eye-template store: every voter's descriptors in one file
+# (database/eye_templates.pack) instead of one <vid>.enc / <vid>.npz each, so
+# loading the gallery is one mmap instead of a file open + zip + inflate per
+# voter.
+#
+#   python template_store.py --migrate [--remove-old] | --compact | --stats
+#
+# - a fixed HEADER_SIZE header, then append-only records:
+#   [payload_len u32][vid_len u16][flags u8][pad][nonce 12s][voter id][payload]
+#   the payload is the raw (N, 32) uint8 descriptor matrix, AES-GCM encrypted
+#   per record with the voter id as associated data, so a record copied under
+#   another voter id fails authentication
+# - the header points at an offset index (voter id -> record offset) written
+#   every STORE_INDEX_EVERY appends; records after it are found by scanning
+#   record headers, the same snapshot + tail scheme as the ballot ledger
+# - reads go through a read-only mmap; a save appends its record and then
+#   commits it by rewriting data_end in the header, so a torn append is
+#   ignored. Other processes see new records on their next call (one stat)
+# - re-enrolment and deletion leave dead records; compact() rewrites the file
+#   without them once they are more than half of it
+# - dframe uses the store as soon as the file exists (EYE_TEMPLATE_STORE =
+#   "auto"), so --migrate switches a deployment over in one step
+import argparse
+import contextlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from crypto_utils import encrypt_bytes_aes_gcm, decrypt_bytes_aes_gcm
+except Exception:
+    encrypt_bytes_aes_gcm = decrypt_bytes_aes_gcm = None
+
+STORE_MAGIC = b'OVTS'
+STORE_VERSION = 1
+HEADER_SIZE = 64
+DESCRIPTOR_BYTES = 32               # ORB (biometric.DESCRIPTOR_BYTES)
+STORE_INDEX_EVERY = 1000            # appended records before a fresh offset index is written
+STORE_COMPACT_MIN_BYTES = 1 << 20   # never compact files smaller than this
+STORE_LOCK_TIMEOUT = 10.0           # seconds to wait for another writer
+STORE_LOCK_STALE = 30.0             # a writer lock older than this was abandoned
+
+# magic, version, flags, generation, data_end, index_offset, index_len, indexed_end
+_HEADER = struct.Struct('<4sHHIQQQQ')
+# payload_len, vid_len, flags, nonce
+_RECORD = struct.Struct('<IHBx12s')
+REC_ENCRYPTED = 1
+REC_DELETED = 2
+_NO_NONCE = bytes(12)
+
+
+@contextlib.contextmanager
+def writer_lock(lock):
+    """Cross-process writer lock (an O_EXCL lock file, so it also works on Windows)."""
+    deadline = time.monotonic() + STORE_LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(lock).st_mtime > STORE_LOCK_STALE:
+                    os.remove(lock)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"locked by another writer: {lock}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+
+class PackedTemplateStore:
+    def __init__(self, path, key_fn=None):
+        self.path = Path(path)
+        self.key_fn = key_fn            # returns the AES key; None writes plaintext records
+        self._lock = threading.RLock()
+        self._mm = None
+        self._index = {}                # voter id -> record offset
+        self._stat = None               # (ino, size, mtime_ns) the in-memory state matches
+        self.generation = 0             # bumped by every compaction
+        self.data_end = HEADER_SIZE
+        self._index_offset = 0
+        self._index_len = 0
+        self._unindexed = 0             # records after the last offset index
+        self.dead_bytes = 0
+        with self._lock:
+            if not self.path.exists():
+                self._create()
+            self._load()
+
+    def __len__(self):
+        return len(self._index)
+
+    # --- file layout --- #
+
+    def _create(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.path, 'xb') as f:
+                f.write(self._header_bytes(0, HEADER_SIZE, 0, 0))
+                f.flush()
+                os.fsync(f.fileno())
+        except FileExistsError:
+            pass        # another process created it first
+
+    def _header_bytes(self, generation, data_end, index_offset, index_len):
+        head = _HEADER.pack(STORE_MAGIC, STORE_VERSION, 0, generation, data_end,
+                            index_offset, index_len, index_offset + index_len if index_len else HEADER_SIZE)
+        return head.ljust(HEADER_SIZE, b'\0')
+
+    def _file_stat(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _read_header(self):
+        with open(self.path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+        if len(head) < _HEADER.size:
+            raise ValueError(f"{self.path} is not a template store (short header)")
+        fields = _HEADER.unpack_from(head)
+        if fields[0] != STORE_MAGIC or fields[1] != STORE_VERSION:
+            raise ValueError(f"{self.path} is not a version {STORE_VERSION} template store")
+        return fields[3:]
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load(self):
+        """(Re)build the in-memory index from the header's offset index plus a scan of the records after it."""
+        self._stat = self._file_stat()
+        generation, data_end, index_offset, index_len, indexed_end = self._read_header()
+        self._remap()
+        self._index, self.dead_bytes = {}, 0
+        if index_len:
+            meta = json.loads(bytes(self._mm[index_offset:index_offset + index_len]))
+            self._index = meta['index']
+            self.dead_bytes = meta['dead']
+        self.generation = generation
+        self._index_offset, self._index_len = index_offset, index_len
+        self._unindexed = 0
+        self.data_end = indexed_end
+        self._scan(data_end)
+
+    def _record_at(self, off):
+        """(payload_len, vid_len, flags, nonce) of the record at off."""
+        return _RECORD.unpack_from(self._mm, off)
+
+    def _record_size(self, off):
+        plen, vlen, _, _ = self._record_at(off)
+        return _RECORD.size + vlen + plen
+
+    def _scan(self, end):
+        """Fold the records between self.data_end and end into the index."""
+        pos = self.data_end
+        while pos < end:
+            plen, vlen, flags, _ = self._record_at(pos)
+            body = pos + _RECORD.size
+            vid = bytes(self._mm[body:body + vlen]).decode('utf-8')
+            old = self._index.pop(vid, None)
+            if old is not None:
+                self.dead_bytes += self._record_size(old)
+            size = _RECORD.size + vlen + plen
+            if flags & REC_DELETED:
+                self.dead_bytes += size
+            else:
+                self._index[vid] = pos
+            self._unindexed += 1
+            pos += size
+        self.data_end = max(self.data_end, end)
+
+    def refresh(self):
+        """Pick up records appended (or a compaction done) by another process; cheap when nothing changed."""
+        with self._lock:
+            st = self._file_stat()
+            if st == self._stat:
+                return False
+            generation, data_end, _, _, _ = self._read_header()
+            if st[0] != self._stat[0] or generation != self.generation or data_end < self.data_end:
+                self._load()
+            else:
+                self._remap()
+                self._scan(data_end)
+                self._stat = st
+            return True
+
+    def _writer_lock(self):
+        return writer_lock(self.path.with_name(self.path.name + '.lock'))
+
+    # --- reads --- #
+
+    def voter_ids(self):
+        self.refresh()
+        with self._lock:
+            return list(self._index)
+
+    def sig(self, voter_id):
+        """Signature of voter_id's current record (changes on every save), or None."""
+        self.refresh()
+        with self._lock:
+            off = self._index.get(str(voter_id))
+            return None if off is None else (self.path.name, self.generation, off)
+
+    def get(self, voter_id):
+        """voter_id's descriptors as a read-only (N, 32) uint8 array, or None. Raises if decryption fails."""
+        vid = str(voter_id)
+        self.refresh()
+        with self._lock:
+            off = self._index.get(vid)
+            if off is None:
+                return None
+            plen, vlen, flags, nonce = self._record_at(off)
+            start = off + _RECORD.size + vlen
+            payload = bytes(self._mm[start:start + plen])
+        if flags & REC_ENCRYPTED:
+            if self.key_fn is None or decrypt_bytes_aes_gcm is None:
+                raise RuntimeError(f"template for {vid} is encrypted but no key is configured")
+            payload = decrypt_bytes_aes_gcm(self.key_fn(), nonce, payload, associated_data=vid.encode('utf-8'))
+        return np.frombuffer(payload, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+
+    # --- writes --- #
+
+    def _encode(self, voter_id, descriptors, encrypt):
+        vid = str(voter_id).encode('utf-8')
+        plain = np.ascontiguousarray(descriptors, dtype=np.uint8).reshape(-1, DESCRIPTOR_BYTES).tobytes()
+        if encrypt:
+            nonce, payload = encrypt_bytes_aes_gcm(self.key_fn(), plain, associated_data=vid)
+            return _RECORD.pack(len(payload), len(vid), REC_ENCRYPTED, nonce) + vid + payload
+        return _RECORD.pack(len(plain), len(vid), 0, _NO_NONCE) + vid + plain
+
+    def put_many(self, items, encrypt=None):
+        """Store [(voter_id, descriptors)] with one append and one commit."""
+        if encrypt is None:
+            encrypt = self.key_fn is not None
+        if encrypt and (self.key_fn is None or encrypt_bytes_aes_gcm is None):
+            raise RuntimeError("encryption requested but no key/crypto is available")
+        records = [self._encode(vid, des, encrypt) for vid, des in items if des is not None]
+        self._append(records)
+        return len(records)
+
+    def put(self, voter_id, descriptors, encrypt=None):
+        return self.put_many([(voter_id, descriptors)], encrypt) == 1
+
+    def delete(self, voter_id):
+        """Drop voter_id's template (appends a tombstone); False if there was none."""
+        self.refresh()
+        vid = str(voter_id).encode('utf-8')
+        with self._lock:
+            if str(voter_id) not in self._index:
+                return False
+            self._append([_RECORD.pack(0, len(vid), REC_DELETED, _NO_NONCE) + vid])
+        return True
+
+    def _commit_header(self, f, data_end):
+        f.seek(0)
+        f.write(self._header_bytes(self.generation, data_end, self._index_offset, self._index_len))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _append(self, records):
+        if not records:
+            return
+        with self._lock, self._writer_lock():
+            self.refresh()      # another writer may have moved data_end
+            blob = b''.join(records)
+            with open(self.path, 'r+b') as f:
+                f.seek(self.data_end)
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+                self._commit_header(f, self.data_end + len(blob))
+            self._remap()
+            self._scan(self.data_end + len(blob))
+            if self.dead_bytes * 2 > self.data_end and self.data_end > STORE_COMPACT_MIN_BYTES:
+                self._compact_locked()
+            elif self._unindexed >= STORE_INDEX_EVERY:
+                self._write_index_locked()
+            self._stat = self._file_stat()
+
+    def _write_index_locked(self):
+        dead = self.dead_bytes + self._index_len     # the previous index block becomes dead space
+        block = json.dumps({'index': self._index, 'dead': dead}, separators=(',', ':')).encode('utf-8')
+        offset = self.data_end
+        with open(self.path, 'r+b') as f:
+            f.seek(offset)
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+            self._index_offset, self._index_len = offset, len(block)
+            self._commit_header(f, offset + len(block))
+        self.dead_bytes = dead
+        self.data_end = offset + len(block)
+        self._unindexed = 0
+        self._remap()
+
+    def write_index(self):
+        """Persist the offset index now (opening the store then needs no record scan)."""
+        with self._lock, self._writer_lock():
+            self.refresh()
+            self._write_index_locked()
+            self._stat = self._file_stat()
+
+    def _write_live(self, dest, vids, generation):
+        """Write a new store file at dest with the current records of vids (copied as they are). Returns their number."""
+        index, pos = {}, HEADER_SIZE
+        with open(dest, 'wb') as f:
+            f.write(bytes(HEADER_SIZE))
+            for vid in vids:
+                off = self._index.get(vid)
+                if off is None:
+                    continue
+                size = self._record_size(off)
+                f.write(self._mm[off:off + size])
+                index[vid] = pos
+                pos += size
+            block = json.dumps({'index': index, 'dead': 0}, separators=(',', ':')).encode('utf-8')
+            f.write(block)
+            f.seek(0)
+            f.write(self._header_bytes(generation, pos + len(block), pos, len(block)))
+            f.flush()
+            os.fsync(f.fileno())
+        return len(index)
+
+    def _compact_locked(self):
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        self._write_live(tmp, list(self._index), self.generation + 1)
+        self._mm.close()
+        self._mm = None
+        os.replace(tmp, self.path)
+        self._load()
+
+    def copy_to(self, path, voter_ids):
+        """Write a store at path holding only voter_ids' templates (e.g. one shard's). Returns how many it holds."""
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        self.refresh()
+        with self._lock:
+            n = self._write_live(tmp, [str(v) for v in voter_ids], 0)
+        os.replace(tmp, path)
+        return n
+
+    def compact(self):
+        """Rewrite the file with live records only."""
+        with self._lock, self._writer_lock():
+            self.refresh()
+            self._compact_locked()
+
+    def stats(self):
+        self.refresh()
+        with self._lock:
+            return {'path': str(self.path), 'voters': len(self._index), 'bytes': self.data_end,
+                    'dead_bytes': self.dead_bytes, 'unindexed': self._unindexed,
+                    'generation': self.generation}
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+
+# ----------------- migration ----------------- #
+
+MIGRATE_BATCH = 1000
+
+
+def migrate(remove_old=False):
+    """Copy every per-file template (database/eye_templates/<vid>.enc|.npz) into the packed store."""
+    import dframe as df
+    vids = sorted(df._list_template_files())
+    store = df.get_template_store()
+    t0 = time.perf_counter()
+    moved, failed = [], []
+    for i in range(0, len(vids), MIGRATE_BATCH):
+        items = []
+        for vid in vids[i:i + MIGRATE_BATCH]:
+            des = df._load_template_file(vid)
+            if des is None:
+                failed.append(vid)
+            else:
+                items.append((vid, des))
+        store.put_many(items, encrypt=df._encrypted_templates())
+        moved.extend(vid for vid, _ in items)
+    store.write_index()
+    for vid in moved:
+        df.set_eye_template_filename(vid, store.path.name)
+    df.flush_voters()
+    df.invalidate_eye_template()
+    print(f"Migrated {len(moved)} template(s) into {store.path} in {time.perf_counter() - t0:.1f}s")
+    if failed:
+        print(f"{len(failed)} template(s) could not be read and were left in place:", ', '.join(failed[:20]))
+    if remove_old:
+        removed = 0
+        for vid in moved:
+            if np.array_equal(store.get(vid), df._load_template_file(vid)):
+                for encrypted in (True, False):
+                    p = df.EYE_TEMPLATES_DIR / df._template_basename_for_vid(vid, encrypted)
+                    if p.exists():
+                        os.remove(p)
+                removed += 1
+            else:
+                print("Packed copy differs, keeping the file for", vid)
+        print(f"Removed {removed} per-voter template file(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packed eye-template store")
+    parser.add_argument('--migrate', action='store_true', help='Move per-voter template files into the packed store')
+    parser.add_argument('--remove-old', action='store_true', help='With --migrate: delete the migrated files')
+    parser.add_argument('--compact', action='store_true', help='Drop dead records')
+    parser.add_argument('--stats', action='store_true')
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate(args.remove_old)
+    elif args.compact or args.stats:
+        import dframe as df
+        store = df.get_template_store()
+        if args.compact:
+            store.compact()
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        parser.print_help()
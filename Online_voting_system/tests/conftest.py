@@ -0,0 +1,58 @@
+# conftest.py
+# dframe keeps its files under the relative path "database" and its state in
+# module globals, so every test runs in an empty directory of its own and
+# starts (and ends) with a store that has forgotten everything.
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dframe as df
+import passwords
+
+CANDIDATES = [('bjp', 'Narendra Modi'), ('cong', 'Rahul Gandhi'), ('aap', 'Arvind Kejriwal')]
+
+
+def forget(store):
+    """Drop dframe's in-memory state, as if this were a new process."""
+    if store._ledger_fh is not None:
+        store._ledger_fh.close()
+    if store._ledger_writer is not None:
+        store._ledger_writer.close()
+    store._ledger_fh = store._ledger_writer = None
+    store._voter_index = store._voter_sig = None
+    store._journal_entries, store._journal_dirty = 0, False
+    store._ledger_seen = store._snapshot_offset = store._unsynced = 0
+    store._cand_signs, store._tally = [], store._ShardedTally({})
+    store.clear_verify_cache()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """dframe on the CSV backend, with CANDIDATES and no voters, in tmp_path/database."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(passwords, '_iterations', 1000)
+    df.set_backend('csv')
+    forget(df)
+    df._ensure_dir()
+    pd.DataFrame([(s, n, 0) for s, n in CANDIDATES], columns=df.CAND_COLS).to_csv(
+        df.path / 'cand_list.csv', index=False)
+    yield df
+    forget(df)
+
+
+@pytest.fixture
+def restart(store):
+    """Call to reload the store from disk only."""
+    return lambda: forget(store)
+
+
+@pytest.fixture
+def voters(store):
+    """Register n voters (password 'pw<i>'); returns their ids."""
+    def register(n):
+        return [store.taking_data_voter(f"Voter {i}", 'F', 'North', 'Pune', f"pw{i}", 30) for i in range(n)]
+    return register
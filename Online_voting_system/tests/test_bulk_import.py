@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+
+import bulk_import
+
+ROWS = [{'name': f"Voter {i}", 'gender': 'F', 'zone': 'North', 'city': 'Pune', 'age': 20 + i, 'passw': f"pw{i}"}
+        for i in range(7)]
+
+
+@pytest.fixture
+def roll_csv(store, tmp_path):
+    p = tmp_path / 'roll.csv'
+    pd.DataFrame(ROWS).to_csv(p, index=False)
+    return p
+
+
+def _names(store):
+    return list(store.list_voters()['name'])
+
+
+def test_csv_import_assigns_ids_and_hashes(store, roll_csv):
+    store.taking_data_voter('Before', 'M', 'South', 'Goa', 'x')
+    imported, first = bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1)
+    assert (imported, first) == (7, 10002)
+    roll = store.list_voters()
+    assert list(roll['voter_id']) == [str(v) for v in range(10001, 10009)]
+    assert store.verify(10002, 'pw0') and store.verify(10008, 'pw6')
+    assert not roll['passw'].str.startswith('pw').any()
+
+
+def test_parquet_nulls_become_empty_fields(store, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    p = tmp_path / 'roll.parquet'
+    # written by another tool: no pandas metadata, PINs stored as integers
+    pq.write_table(pa.table({'name': pa.array(['Asha', None]), 'zone': pa.array(['North', None]),
+                             'city': pa.array([None, 'Goa']), 'age': pa.array([30, None], pa.int64()),
+                             'passw': pa.array([None, 4321], pa.int64())}), p)
+    assert bulk_import.import_voter_roll(p, workers=1) == (2, 10001)
+    a, b = store.get_voter_row(10001), store.get_voter_row(10002)
+    assert (a['name'], a['city'], a['passw'], a['age']) == ('Asha', '', '', 30)
+    assert (b['name'], b['zone'], b['age']) == ('', '', 18)
+    assert not any(store.verify(10001, p) for p in ('None', 'nan', '<NA>', ''))
+    assert store.verify(10002, '4321')
+
+
+def test_rerun_of_a_finished_import_is_a_no_op(store, roll_csv):
+    bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1)
+    assert bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1) == (0, 10001)
+    assert len(_names(store)) == 7
+
+
+def test_resume_after_a_crash_before_the_write(store, roll_csv, monkeypatch):
+    backend = store.get_backend()
+    real, calls = backend.add_voters_bulk, []
+
+    def crash_on_second(batch):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise OSError("disk gone")
+        return real(batch)
+    monkeypatch.setattr(backend, 'add_voters_bulk', crash_on_second)
+    with pytest.raises(OSError):
+        bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1)
+    monkeypatch.setattr(backend, 'add_voters_bulk', real)
+    assert bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1) == (4, 10001)
+    assert _names(store) == [r['name'] for r in ROWS]
+
+
+def test_resume_after_a_crash_between_write_and_checkpoint(store, roll_csv, monkeypatch):
+    real, saves = bulk_import._save_checkpoint, []
+
+    def crash_after_second_write(source, rows_done, first_vid, pending=None):
+        saves.append(pending)
+        if rows_done == 6 and pending is None:
+            raise KeyboardInterrupt
+        return real(source, rows_done, first_vid, pending)
+    monkeypatch.setattr(bulk_import, '_save_checkpoint', crash_after_second_write)
+    with pytest.raises(KeyboardInterrupt):
+        bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1)
+    monkeypatch.setattr(bulk_import, '_save_checkpoint', real)
+
+    # voters registered at a booth before the import is restarted
+    gui = [store.taking_data_voter(f"Booth {i}", 'M', 'South', 'Goa', 'x') for i in range(2)]
+    assert bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1) == (1, 10001)
+    names = _names(store)
+    assert sorted(n for n in names if n.startswith('Voter')) == sorted(r['name'] for r in ROWS)
+    assert names.count('Booth 0') == 1 and gui == [10007, 10008]
+
+
+def test_changed_source_starts_over(store, roll_csv):
+    bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1)
+    pd.DataFrame(ROWS[:2]).to_csv(roll_csv, index=False)
+    assert bulk_import.import_voter_roll(roll_csv, chunksize=3, workers=1) == (2, 10008)
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+import Server
+
+SIGNS = ['bjp', 'cong', 'aap']
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def backend(request, store, monkeypatch):
+    """The test store on each storage backend, with the server's tally over it."""
+    if request.param == 'sqlite':
+        store.set_backend('sqlite').import_csv()
+    monkeypatch.setattr(Server, 'live_tally', Server.LiveTally())
+    monkeypatch.setattr(Server, 'committer', None)
+    yield store
+    store.set_backend('csv')
+
+
+def test_racing_double_votes_count_once(backend, voters, restart):
+    ids = voters(12)
+    Server.live_tally.load()
+    threads, start = 8, threading.Barrier(8)
+    replies = [[] for _ in range(threads)]
+
+    def booth(n):
+        start.wait()
+        for vid in ids:
+            replies[n].append((vid, Server.cast_vote(SIGNS[(vid + n) % 3], vid)))
+
+    workers = [threading.Thread(target=booth, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    accepted = [vid for r in replies for vid, status in r if status == "Successful"]
+    assert sorted(accepted) == sorted(ids)
+    assert not any(backend.isEligible(vid) for vid in ids)
+    tally = backend.show_result()
+    assert sum(tally.values()) == len(ids)
+    assert Server.live_tally.snapshot() == (len(ids), tally)
+    restart()
+    assert backend.show_result() == tally
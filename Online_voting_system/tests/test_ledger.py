@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+
+def test_ballots_survive_restart(store, restart, voters):
+    a, b, c = voters(3)
+    assert store.vote_update('bjp', a)
+    assert store.vote_update_many([('cong', b), ('bjp', c), ('aap', b)]) == [True, True, False]
+    restart()
+    assert store.show_result() == {'bjp': 2, 'cong': 1, 'aap': 0}
+    assert not store.isEligible(a) and not store.isEligible(b)
+    assert not store.vote_update('aap', a)
+
+
+def test_torn_tail_is_ignored_then_truncated(store, restart, voters):
+    a, b = voters(2)
+    assert store.vote_update('bjp', a)
+    whole = store.BALLOT_LEDGER.stat().st_size
+    with open(store.BALLOT_LEDGER, 'ab') as f:
+        f.write(store._pack_ballot(b, 'cong')[:10])
+    restart()
+    assert store.show_result()['cong'] == 0
+    assert store.isEligible(b)
+    assert store.vote_update('cong', b)
+    assert store.BALLOT_LEDGER.stat().st_size == whole + store._BALLOT.size
+    restart()
+    assert store.show_result() == {'bjp': 1, 'cong': 1, 'aap': 0}
+
+
+def test_compaction_is_not_counted_twice(store, restart, voters):
+    a, b, c = voters(3)
+    store.vote_update('bjp', a)
+    store.vote_update('cong', b)
+    store.compact_ledger()
+    snap = json.loads(store.TALLY_SNAPSHOT.read_text(encoding='utf-8'))
+    assert snap['offset'] == store.BALLOT_LEDGER.stat().st_size
+    assert snap['counts'] == {'bjp': 1, 'cong': 1, 'aap': 0}
+    store.vote_update('bjp', c)
+    restart()
+    assert store.show_result() == {'bjp': 2, 'cong': 1, 'aap': 0}
+    assert store.get_voter_row(a)['hasVoted'] == 1
+    assert not store.isEligible(c)
+
+
+def test_compaction_mirrors_counts_into_cand_list(store, voters):
+    (a,) = voters(1)
+    store.vote_update('aap', a)
+    store.compact_ledger()
+    rows = store._read_csv_safe(store.path / 'cand_list.csv')
+    assert dict(zip(rows['sign'], rows['Vote Count'].astype(int))) == {'bjp': 0, 'cong': 0, 'aap': 1}
+
+
+def test_count_reset_empties_the_ledger(store, restart, voters):
+    a, b = voters(2)
+    store.vote_update('bjp', a)
+    store.count_reset()
+    restart()
+    assert store.show_result() == {'bjp': 0, 'cong': 0, 'aap': 0}
+    assert store.isEligible(a) and store.vote_update('cong', a)
+
+
+def test_sign_too_long_for_a_record_is_refused(store, voters):
+    (a,) = voters(1)
+    with pytest.raises(ValueError):
+        store._pack_ballot(a, 'x' * (store.SIGN_MAX_BYTES + 1))
+    assert not store.vote_update('x' * (store.SIGN_MAX_BYTES + 1), a)
+    assert store.isEligible(a)
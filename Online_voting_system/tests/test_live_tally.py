@@ -0,0 +1,139 @@
+import pytest
+
+import Server
+
+
+@pytest.fixture
+def tally(monkeypatch):
+    """A LiveTally seeded from a stubbed show_result()."""
+    stored = {'bjp': 5, 'cong': 3}
+    monkeypatch.setattr(Server.df, 'show_result', lambda: dict(stored))
+    live = Server.LiveTally()
+    live.stored = stored
+    return live
+
+
+def _subscriber(tally):
+    wakes = []
+    sub = Server.TallySubscriber(lambda: wakes.append(1))
+    return sub, wakes, tally.subscribe(sub)
+
+
+def _fold(counts, version, update):
+    """What the admin screen does with one push; None means 'subscribe again'."""
+    if 'counts' in update:
+        return dict(update['counts']), update['version']
+    if update['base'] != version:
+        return None
+    counts = dict(counts)
+    for sign, n in update['delta'].items():
+        counts[sign] = counts.get(sign, 0) + n
+    return counts, update['version']
+
+
+def test_subscribe_returns_the_base_of_the_first_delta(tally):
+    tally.load()
+    tally.apply(['bjp'])
+    sub, _, (version, counts) = _subscriber(tally)
+    assert (version, counts) == (1, {'bjp': 6, 'cong': 3})
+    tally.apply(['cong', 'cong'])
+    assert sub.take() == {'base': 1, 'version': 3, 'delta': {'cong': 2}}
+
+
+def test_deltas_are_merged_until_taken(tally):
+    sub, wakes, (version, counts) = _subscriber(tally)
+    tally.apply(['bjp'])
+    tally.apply(['cong', 'bjp'])
+    tally.apply(['aap'])
+    assert len(wakes) == 3
+    assert sub.take() == {'base': version, 'version': version + 4, 'delta': {'bjp': 2, 'cong': 1, 'aap': 1}}
+
+
+def test_heartbeat_is_an_empty_delta_at_the_same_version(tally):
+    sub, _, (version, _) = _subscriber(tally)
+    tally.apply(['bjp'])
+    sub.take()
+    assert sub.take() == {'base': version + 1, 'version': version + 1, 'delta': {}}
+
+
+def test_folding_every_push_tracks_the_server(tally):
+    sub, _, (version, counts) = _subscriber(tally)
+    for batch in (['bjp'], ['cong', 'cong'], [], ['aap', 'bjp']):
+        tally.apply(batch)
+        counts, version = _fold(counts, version, sub.take())
+    assert (version, counts) == tally.snapshot()
+
+
+def test_missed_push_is_detected_by_its_base(tally):
+    sub, _, (version, counts) = _subscriber(tally)
+    tally.apply(['bjp'])
+    sub.take()                      # lost on the way to the screen
+    tally.apply(['cong'])
+    assert _fold(counts, version, sub.take()) is None
+
+
+def test_reload_resends_full_counts(tally):
+    sub, _, (version, counts) = _subscriber(tally)
+    tally.apply(['bjp'])
+    tally.stored.update(bjp=0, cong=0)
+    tally.load()
+    update = sub.take()
+    assert update == {'base': version, 'version': version + 1, 'counts': {'bjp': 0, 'cong': 0}}
+    tally.apply(['cong'])
+    counts, version = _fold(counts, version, update)
+    assert _fold(counts, version, sub.take()) == ({'bjp': 0, 'cong': 1}, version + 1)
+
+
+def test_unsubscribed_gets_nothing(tally):
+    sub, wakes, _ = _subscriber(tally)
+    tally.unsubscribe(sub)
+    tally.apply(['bjp'])
+    assert not wakes and sub.take()['delta'] == {}
+
+
+def test_first_apply_seeds_from_storage_without_counting_twice(tally):
+    tally.stored['bjp'] += 1        # committed before the tally was ever read
+    tally.apply(['bjp'])
+    assert tally.snapshot()[1] == {'bjp': 6, 'cong': 3}
+
+
+@pytest.fixture
+def observer(store, monkeypatch):
+    """The tally handlers over the test store, and the observer token they accept."""
+    monkeypatch.setattr(Server, 'live_tally', Server.LiveTally())
+    Server.live_tally.load()
+    return Server.proto.load_results_token(create=True)
+
+
+def _session():
+    return {'authed': set(), 'bio_ok': set()}
+
+
+def test_results_need_the_observer_token(observer):
+    proto = Server.proto
+    for payload in ({}, {'token': 'guess'}, {'token': None}):
+        assert Server.handle_request(_session(), proto.MSG_RESULT, payload)['status'] == "NotAuthorized"
+    reply = Server.handle_request(_session(), proto.MSG_RESULT, {'token': observer, 'rid': 4})
+    assert reply == {'status': "OK", 'version': 0, 'counts': {'bjp': 0, 'cong': 0, 'aap': 0}, 'rid': 4}
+
+
+def test_results_in_a_batch_need_the_observer_token(observer):
+    proto = Server.proto
+    batch = {'requests': [{'type': proto.MSG_RESULT, 'payload': {}},
+                          {'type': proto.MSG_RESULT, 'payload': {'token': observer}}]}
+    first, second = Server.handle_request(_session(), proto.MSG_BATCH, batch)['results']
+    assert first['status'] == "NotAuthorized" and second['status'] == "OK"
+
+
+def test_subscribe_without_the_token_gets_an_error_frame(observer):
+    import socket
+    proto = Server.proto
+    server_end, client_end = socket.socketpair()
+    try:
+        Server.push_tally(server_end, {'rid': 9})
+        msg_type, reply = proto.recv_frame(client_end)
+        assert (msg_type, reply['status'], reply['rid']) == (proto.MSG_RESULT, "NotAuthorized", 9)
+        assert not Server.live_tally.subscribers
+    finally:
+        server_end.close()
+        client_end.close()
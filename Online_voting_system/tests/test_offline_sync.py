@@ -0,0 +1,123 @@
+import base64
+
+import pytest
+
+import offline_queue
+import Server
+
+KEY = b'k' * 32
+
+
+@pytest.fixture
+def server(store, monkeypatch):
+    """Server.sync_ballots over the test store, holding KEY as the master key."""
+    store.set_master_key(KEY)
+    monkeypatch.setattr(Server, 'live_tally', Server.LiveTally())
+    Server.live_tally.load()
+    yield Server
+    store.forget_master_key()
+
+
+class LocalClient:
+    """request() answered by the server module in this process."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def request(self, msg_type, payload=None):
+        assert msg_type == offline_queue.proto.MSG_SYNC
+        return self.server.sync_ballots(payload)
+
+
+def _upload(server, *records):
+    return server.sync_ballots({'booth': 'test', 'records': base64.b64encode(b''.join(records)).decode('ascii')})
+
+
+def test_split_records_stops_at_an_incomplete_record():
+    one = offline_queue.seal_ballot(KEY, 7, 'bjp')
+    two = offline_queue.seal_ballot(KEY, 8, 'cong')
+    assert offline_queue.split_records(one + two) == [(7, one), (8, two)]
+    assert offline_queue.split_records(one + two[:-1]) == [(7, one)]
+    assert offline_queue.split_records(one + two[:5]) == [(7, one)]
+    assert offline_queue.split_records(b'') == []
+
+
+def test_split_records_stops_at_an_impossible_length():
+    one = offline_queue.seal_ballot(KEY, 7, 'bjp')
+    bogus = offline_queue._HEAD.pack(4, 9) + b'\0' * 40
+    assert offline_queue.split_records(one + bogus + one) == [(7, one)]
+
+
+def test_record_opens_only_for_its_voter():
+    record = offline_queue.seal_ballot(KEY, 7, 'aap', cast_ns=123)
+    assert offline_queue.open_record(KEY, record) == (7, 'aap', 123)
+    moved = offline_queue._HEAD.pack(len(record) - 4, 8) + record[offline_queue._HEAD.size:]
+    with pytest.raises(Exception):
+        offline_queue.open_record(KEY, moved)
+
+
+def test_sign_too_long_for_a_record_is_refused():
+    with pytest.raises(ValueError):
+        offline_queue.seal_ballot(KEY, 7, 'x' * 17)
+
+
+def test_sync_ballots_answers_each_record(server, store, voters):
+    a, b = voters(2)
+    reply = _upload(server,
+                    offline_queue.seal_ballot(KEY, a, 'bjp'),
+                    offline_queue.seal_ballot(KEY, b, 'nota'),           # unknown sign
+                    offline_queue.seal_ballot(KEY, 999, 'cong'),         # unknown voter
+                    offline_queue.seal_ballot(b'x' * 32, b, 'cong'))     # other election key
+    assert reply == {'status': "OK", 'results': ["Accepted", "Rejected", "Rejected", "Rejected"], 'accepted': 1}
+    assert store.show_result() == {'bjp': 1, 'cong': 0, 'aap': 0}
+    assert server.live_tally.snapshot() == (1, {'bjp': 1, 'cong': 0, 'aap': 0})
+
+
+def test_sync_ballots_is_idempotent(server, store, voters):
+    a, b = voters(2)
+    records = [offline_queue.seal_ballot(KEY, a, 'bjp'), offline_queue.seal_ballot(KEY, b, 'cong')]
+    assert _upload(server, *records)['results'] == ["Accepted", "Accepted"]
+    assert _upload(server, *records) == {'status': "OK", 'results': ["Duplicate", "Duplicate"], 'accepted': 0}
+    assert store.show_result() == {'bjp': 1, 'cong': 1, 'aap': 0}
+
+
+def test_sync_ballots_refuses_a_malformed_upload(server, store, voters):
+    a, b = voters(2)
+    torn = offline_queue.seal_ballot(KEY, b, 'cong')[:-3]
+    reply = _upload(server, offline_queue.seal_ballot(KEY, a, 'bjp'), torn)
+    assert reply['status'] == "Malformed"
+    assert store.show_result() == {'bjp': 0, 'cong': 0, 'aap': 0}
+    assert store.isEligible(a)
+
+
+def test_sync_ballots_takes_any_booth_name(server, store, voters):
+    a, b = voters(2)
+    for booth, vid in ((7, a), (None, b)):
+        blob = base64.b64encode(offline_queue.seal_ballot(KEY, vid, 'bjp')).decode('ascii')
+        assert server.sync_ballots({'booth': booth, 'records': blob})['accepted'] == 1
+
+
+def test_queue_sync_drops_answered_and_sets_aside_rejected(server, store, voters, tmp_path):
+    a, b = voters(2)
+    queue = offline_queue.OfflineQueue(tmp_path / 'booth.queue', key=lambda: KEY)
+    assert queue.append(a, 'bjp') and queue.append(999, 'cong')
+    assert not queue.append(a, 'aap')
+    store.vote_update('aap', b)
+    assert queue.append(b, 'cong')
+
+    summary = queue.sync(LocalClient(server), chunk=2)
+    assert summary == {'Accepted': 1, 'Duplicate': 1, 'Rejected': 1}
+    assert len(queue) == 0 and (tmp_path / 'booth.queue').stat().st_size == 0
+    assert [vid for vid, _ in offline_queue.split_records((tmp_path / 'booth.rejected').read_bytes())] == [999]
+    assert store.show_result() == {'bjp': 1, 'cong': 0, 'aap': 1}
+
+
+def test_queue_cuts_a_torn_last_record_on_open(tmp_path):
+    path = tmp_path / 'booth.queue'
+    queue = offline_queue.OfflineQueue(path, key=lambda: KEY)
+    queue.append(7, 'bjp')
+    with open(path, 'ab') as f:
+        f.write(offline_queue.seal_ballot(KEY, 8, 'cong')[:20])
+    queue = offline_queue.OfflineQueue(path, key=lambda: KEY)
+    assert len(queue) == 1 and queue.has(7) and not queue.has(8)
+    assert path.stat().st_size == queue.size
@@ -0,0 +1,99 @@
+import hashlib
+
+import pytest
+
+import passwords
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashes(monkeypatch, tmp_path):
+    monkeypatch.setattr(passwords, '_iterations', 1000)
+    monkeypatch.setattr(passwords, 'PASSWORD_COST_PATH', tmp_path / 'password_cost.json')
+
+
+def test_hash_round_trip():
+    stored = passwords.hash_password('s3cret')
+    assert passwords.is_hashed(stored)
+    assert stored.startswith('pbkdf2_sha256$1000$')
+    assert passwords.check_password(stored, 's3cret')
+    assert not passwords.check_password(stored, 's3cret ')
+    assert not passwords.check_password(stored, '')
+
+
+def test_every_hash_gets_its_own_salt():
+    assert passwords.hash_password('same') != passwords.hash_password('same')
+
+
+def test_hash_keeps_its_iteration_count(monkeypatch):
+    stored = passwords.hash_password('pw', 2000)
+    monkeypatch.setattr(passwords, '_iterations', 3000)    # recalibrated since
+    assert passwords.check_password(stored, 'pw')
+
+
+def test_crypto_and_hashlib_derive_the_same_bytes():
+    import crypto_utils
+    salt = b'\1' * passwords._SALT_BYTES
+    assert passwords._pbkdf2('pw', salt, 1000) == hashlib.pbkdf2_hmac('sha256', b'pw', salt, 1000)
+    assert crypto_utils.derive_key_from_passphrase('pw', salt, 1000) == passwords._pbkdf2('pw', salt, 1000)
+
+
+def test_unmigrated_plaintext_row():
+    assert passwords.check_password('pw', 'pw')
+    assert not passwords.check_password('pw', 'PW')
+    assert not passwords.check_password('', '')
+
+
+@pytest.mark.parametrize('stored', ['pbkdf2_sha256$', 'pbkdf2_sha256$x$AA==$AA==', 'pbkdf2_sha256$1000$!!$AA=='])
+def test_malformed_hash_never_matches(stored):
+    assert not passwords.check_password(stored, 'pw')
+
+
+def test_calibration_is_saved_and_reused(monkeypatch):
+    monkeypatch.setattr(passwords, '_iterations', None)
+    monkeypatch.setattr(passwords, 'calibrate', lambda: 123000)
+    assert passwords.iterations() == 123000
+    monkeypatch.setattr(passwords, '_iterations', None)
+    monkeypatch.setattr(passwords, 'calibrate', lambda: pytest.fail("calibrated twice"))
+    assert passwords.iterations() == 123000
+
+
+def test_hash_passwords_in_a_pool():
+    hashed = passwords.hash_passwords([f"pw{i}" for i in range(5)], workers=2, chunk=2)
+    assert [passwords.check_password(h, f"pw{i}") for i, h in enumerate(hashed)] == [True] * 5
+
+
+def test_verify_cache(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(passwords.time, 'monotonic', lambda: now[0])
+    cache = passwords.VerifyCache(ttl=10)
+    cache.put('7', 'pw')
+    assert cache.verified(7, 'pw') and not cache.verified(7, 'other') and not cache.verified(8, 'pw')
+    assert cache.eligible(7) is None
+    cache.set_eligible(7, True)
+    assert cache.eligible(7) is True
+    cache.invalidate(7)
+    assert not cache.verified(7, 'pw') and cache.eligible(7) is None
+    cache.put(7, 'pw')
+    now[0] += 11
+    assert not cache.verified(7, 'pw')
+
+
+def test_verify_cache_stays_bounded():
+    cache = passwords.VerifyCache(max_entries=3)
+    for vid in range(5):
+        cache.put(vid, 'pw')
+    assert len(cache._entries) == 3 and cache.verified(4, 'pw')
+
+
+def test_login_hashes_once_and_a_ballot_forgets_it(store, voters, monkeypatch):
+    (vid,) = voters(1)
+    assert store.get_voter_row(vid)['passw'].startswith('pbkdf2_sha256$')
+    calls = []
+    real = passwords._pbkdf2
+    monkeypatch.setattr(passwords, '_pbkdf2', lambda *a: calls.append(1) or real(*a))
+    assert not store.verify(vid, 'wrong')
+    assert store.verify(vid, 'pw0') and store.verify(vid, 'pw0') and store.isEligible(vid)
+    assert len(calls) == 2
+    assert store.vote_update('bjp', vid)
+    assert not store.isEligible(vid)
+    assert store.verify(vid, 'pw0') and len(calls) == 3
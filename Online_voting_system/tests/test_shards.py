@@ -0,0 +1,127 @@
+import json
+import socket
+import time
+
+import numpy as np
+import pytest
+
+import shards
+
+ZONES = {'North': 3, 'South': 2, 'East': 2}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_listening(shard, procs, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        assert all(p.poll() is None for p in procs), "a shard server exited"
+        try:
+            socket.create_connection((shard['host'], shard['port']), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise AssertionError(f"{shard['name']} did not start")
+
+
+@pytest.fixture
+def roll(store):
+    """Voters in ZONES (password 'pw'); returns {zone: [voter ids]}."""
+    return {zone: [store.taking_data_voter(f"{zone} {i}", 'F', zone, 'Pune', 'pw') for i in range(n)]
+            for zone, n in ZONES.items()}
+
+
+@pytest.fixture
+def cluster(store, roll, tmp_path):
+    """Three local shard servers split from roll; yields the ShardMap."""
+    shard_map = shards.build_shard_map(ZONES, 3)
+    for shard in shard_map.shards:
+        shard['port'] = _free_port()
+    shards.split_roll(shard_map, root=tmp_path / 'shards')
+    procs = shards.serve(shard_map, root=tmp_path / 'shards', server_args=['--group-commit-ms', '0'])
+    try:
+        for shard in shard_map.shards:
+            _wait_listening(shard, procs)
+        yield shard_map
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=30)
+
+
+def test_split_gives_every_shard_its_zones_and_an_id_block(store, roll, tmp_path):
+    shard_map = shards.build_shard_map(ZONES, 2)
+    counts = shards.split_roll(shard_map, root=tmp_path / 'shards')
+    assert sorted(counts.values()) == [3, 4]
+    blocks = [s['ids'] for s in shard_map.shards]
+    assert blocks[0][0] > max(v for ids in roll.values() for v in ids)
+    assert blocks[0][1] < blocks[1][0]
+    for shard in shard_map.shards:
+        data = tmp_path / 'shards' / shard['name'] / 'database'
+        assert json.loads((data / 'voter_ids.json').read_text()) == dict(zip(('first', 'last'), shard['ids']))
+        zones = {z.lower() for z in store._read_csv_safe(data / 'voterList.csv')['zone']}
+        assert zones == set(shard['zones'])
+
+
+def test_registration_stays_in_the_shard_block(store, restart, roll, tmp_path, monkeypatch):
+    shard_map = shards.build_shard_map(ZONES, 2)
+    shards.split_roll(shard_map, root=tmp_path / 'shards')
+    shard = shard_map.shards[1]
+    monkeypatch.chdir(tmp_path / 'shards' / shard['name'])
+    restart()
+    first, last = shard['ids']
+    vid = store.taking_data_voter('New', 'M', shard['zones'][0], 'Goa', 'pw')
+    assert vid == first and store.get_backend().next_voter_id() == first + 1
+    assert shard_map.shard_for_voter(vid) is shard
+    bad = store.list_voters().head(1).assign(voter_id=str(shard_map.shards[0]['ids'][0]))
+    with pytest.raises(ValueError):
+        store.get_backend().add_voters_bulk(bad)
+
+
+def test_split_copies_only_the_shards_templates(store, roll, tmp_path, monkeypatch):
+    monkeypatch.setattr(store, 'USE_ENCRYPTION', False)
+    pack = store.get_template_store()
+    everyone = [v for ids in roll.values() for v in ids]
+    pack.put_many([(v, np.full((4, 32), v % 251, np.uint8)) for v in everyone])
+    shard_map = shards.build_shard_map(ZONES, 2)
+    shards.split_roll(shard_map, root=tmp_path / 'shards')
+    monkeypatch.setattr(store, '_template_store', None)
+    for shard in shard_map.shards:
+        from template_store import PackedTemplateStore
+        copy = PackedTemplateStore(tmp_path / 'shards' / shard['name'] / 'database' / store.EYE_TEMPLATE_PACK.name)
+        mine = sorted(str(v) for z, ids in roll.items() if z.lower() in shard['zones'] for v in ids)
+        assert sorted(copy.voter_ids()) == mine
+        assert (copy.get(mine[0]) == int(mine[0]) % 251).all()
+        copy.close()
+    pack.close()
+
+
+def test_votes_through_the_sharded_client_merge(cluster, roll):
+    booth = shards.ShardedVoteClient(cluster, zone='North', timeout=10)
+    booth.connect()
+    try:
+        ballots = [(roll['North'][0], 'bjp'), (roll['South'][0], 'cong'), (roll['East'][0], 'bjp'),
+                   (roll['East'][1], 'aap')]
+        for vid, sign in ballots:
+            assert booth.authenticate(vid, 'pw') == "Authenticate"
+            assert booth.cast_vote(sign, vid) == "Successful"
+        assert booth.authenticate(roll['South'][0], 'pw') == "VoteCasted"
+        assert booth.authenticate(99, 'pw') == "InvalidVoter"
+    finally:
+        booth.close()
+    assert shards.merge_results(cluster, timeout=10) == {'bjp': 2, 'cong': 1, 'aap': 1}
+    per_shard = [shards.shard_results(s, timeout=10) for s in cluster.shards]
+    assert sorted(sum(c.values()) for c in per_shard) == sorted(
+        sum(1 for vid, _ in ballots if any(vid in ids for z, ids in roll.items() if z.lower() in s['zones']))
+        for s in cluster.shards)
+
+
+def test_merge_fails_when_a_shard_is_down(cluster):
+    down = dict(cluster.shards[0], port=_free_port())
+    with pytest.raises(shards.ShardError):
+        shards.merge_results(shards.ShardMap([down] + cluster.shards[1:]), timeout=2)
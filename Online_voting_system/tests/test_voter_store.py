@@ -0,0 +1,116 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _journal_lines(store):
+    if not store.VOTER_JOURNAL.exists():
+        return []
+    return store.VOTER_JOURNAL.read_text(encoding='utf-8').splitlines()
+
+
+def _csv_ids(store):
+    return list(store._read_csv_safe(store.path / 'voterList.csv')['voter_id'])
+
+
+def test_registrations_are_journaled_not_rewritten(store, voters):
+    a, b = voters(2)
+    store.set_eye_template_filename(a, f"{a}.enc")
+    assert _csv_ids(store) == []
+    assert [json.loads(line)['op'] for line in _journal_lines(store)] == ['add', 'add', 'set']
+    assert (a, b) == (10001, 10002)
+
+
+def test_journal_is_replayed_on_load(store, restart, voters):
+    a, b = voters(2)
+    store.set_eye_template_filename(b, f"{b}.npz")
+    restart()
+    assert store.get_voter_row(a)['name'] == 'Voter 0'
+    assert store.get_voter_row(b)['eye_template'] == f"{b}.npz"
+    assert store.verify(a, 'pw0')
+    assert store.taking_data_voter('New', 'M', 'South', 'Goa', 'x') == b + 1
+
+
+def test_torn_journal_line_is_dropped(store, restart, voters):
+    a, b = voters(2)
+    lines = _journal_lines(store)
+    with open(store.VOTER_JOURNAL, 'wb') as f:
+        f.write((lines[0] + '\n' + lines[1][:25]).encode('utf-8'))
+    restart()
+    assert store.get_voter_row(a) is not None and store.get_voter_row(b) is None
+    assert store.VOTER_JOURNAL.read_text(encoding='utf-8') == lines[0] + '\n'
+    assert store.taking_data_voter('Again', 'F', 'North', 'Pune', 'x') == b
+    restart()
+    assert store.get_voter_row(b)['name'] == 'Again'
+
+
+def test_flush_folds_the_journal_into_the_csv(store, restart, voters):
+    a, b = voters(2)
+    store.vote_update('bjp', a)
+    store.flush_voters()
+    assert not store.VOTER_JOURNAL.exists()
+    assert _csv_ids(store) == [str(a), str(b)]
+    restart()
+    assert [store.get_voter_row(v)['hasVoted'] for v in (a, b)] == [1, 0]
+
+
+def test_journal_compacts_when_large(store, monkeypatch, voters):
+    monkeypatch.setattr(store, 'VOTER_JOURNAL_COMPACT_EVERY', 3)
+    voters(4)
+    assert len(_csv_ids(store)) == 3
+    assert len(_journal_lines(store)) == 1
+
+
+def test_compaction_keeps_entries_it_has_not_read(store, voters):
+    a, b = voters(2)
+    with open(store.VOTER_JOURNAL, 'ab') as f:
+        # appended behind this process's back (not possible under the roll lock)
+        f.write((json.dumps({'op': 'set', 'voter_id': str(a), 'fields': {'city': 'Goa'}}) + '\n').encode('utf-8'))
+    store._voter_sig = store._voter_files_sig()
+    store._compact_voters()
+    assert [json.loads(line)['fields'] for line in _journal_lines(store)] == [{'city': 'Goa'}]
+    store._voter_index = None
+    assert store.get_voter_row(a)['city'] == 'Goa'
+
+
+_PROCESS = textwrap.dedent('''
+    import os, sys, time
+    import dframe as df
+    wait_for, then_touch, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    ids = [df.taking_data_voter("Voter " + then_touch, "F", "North", "Pune", "pw") for _ in range(count)]
+    open(then_touch, "w").close()
+    while wait_for and not os.path.exists(wait_for):
+        time.sleep(0.02)
+    print(" ".join(map(str, ids)))
+''')
+
+
+def _spawn(tmp_path, wait_for, then_touch, count):
+    env = dict(os.environ, PYTHONPATH=REPO)
+    return subprocess.Popen([sys.executable, '-c', _PROCESS, wait_for, then_touch, str(count)],
+                            cwd=tmp_path, env=env, stdout=subprocess.PIPE, text=True)
+
+
+def test_two_processes_keep_each_others_registrations(store, restart, tmp_path):
+    # A registers and stays up; B registers and exits; A exits last and
+    # flushes at exit, without having looked at the roll since B wrote.
+    (store.path / 'password_cost.json').write_text(json.dumps({'iterations': 1000}), encoding='utf-8')
+    a = _spawn(tmp_path, 'b.done', 'a.ready', 2)
+    while not (tmp_path / 'a.ready').exists():
+        assert a.poll() is None
+        time.sleep(0.02)
+    b = _spawn(tmp_path, '', 'b.done', 3)
+    out_b = b.communicate(timeout=60)[0].split()
+    out_a = a.communicate(timeout=60)[0].split()
+    assert a.returncode == b.returncode == 0
+
+    ids = sorted(out_a + out_b)
+    assert len(set(ids)) == 5
+    restart()
+    assert sorted(store.list_voters()['voter_id']) == ids
+    assert sorted(_csv_ids(store)) == ids and not store.VOTER_JOURNAL.exists()
@@ -0,0 +1,404 @@
+# vote_client.py
+# Booth-side connection to Server.py. Hides which wire protocol is in use
+# (protocol.WIRE_PROTOCOL) from the Tk screens in voterlogin_with_eye.py and
+# VotingPage.py, which only call authenticate / cast_vote / close.
+#
+# With POOLED_SESSION (framed protocol) every voter at a booth goes over one
+# long-lived BoothSession: requests are multiplexed by rid, a heartbeat keeps
+# the connection open between voters and a lost connection is reopened on the
+# next request. The screens get a SessionClient per voter, whose close() only
+# ends that voter's turn.
+import socket
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import protocol as proto
+
+SERVER_PORT = 4001
+POOLED_SESSION = True
+REQUEST_TIMEOUT = 30        # seconds to wait for a reply on the booth session
+HEARTBEAT_INTERVAL = 15     # idle seconds before the session sends MSG_PING (server drops at 60)
+RECONNECT_BACKOFF = (0.1, 0.5, 1, 2, 5)   # seconds between reconnect attempts
+
+
+def open_client(**kwargs):
+    """
+    Client for this booth: a ShardedVoteClient when a shard map exists
+    (see shards.py), else a SessionClient on the booth's BoothSession, or a
+    VoteClient of its own with POOLED_SESSION off or the text protocol.
+    """
+    import shards
+    if shards.SHARD_MAP.exists():
+        return shards.ShardedVoteClient(timeout=kwargs.get('timeout'))
+    if POOLED_SESSION and (kwargs.get('protocol') or proto.WIRE_PROTOCOL) != "text":
+        return SessionClient(get_session(kwargs.get('host'), kwargs.get('port', SERVER_PORT)))
+    return VoteClient(**kwargs)
+
+
+class VoteClient:
+    def __init__(self, host=None, port=SERVER_PORT, protocol=None, timeout=None):
+        self.host = host or socket.gethostname()
+        self.port = port
+        self.protocol = protocol or proto.WIRE_PROTOCOL
+        self.timeout = timeout
+        self.sock = None
+        self._rid = 0
+        self._voter_id = None   # last voter authenticated on this connection
+
+    def connect(self):
+        """Open the connection and check the server banner. Returns True on success."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.timeout:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect((self.host, self.port))
+        if self.protocol == "text":
+            return self.sock.recv(1024).decode() == "Connection Established"
+        msg_type, payload = proto.recv_frame(self.sock)
+        return msg_type == proto.MSG_HELLO and payload.get('version') == proto.PROTOCOL_VERSION
+
+    def request(self, msg_type, payload=None):
+        """Send one framed request and return the RESULT payload."""
+        payload = dict(payload or {})
+        self._rid += 1
+        payload['rid'] = self._rid
+        proto.send_frame(self.sock, msg_type, payload)
+        reply_type, reply = proto.recv_frame(self.sock)
+        if reply_type != proto.MSG_RESULT:
+            raise proto.ProtocolError(f"unexpected reply type {reply_type}")
+        return reply
+
+    def authenticate(self, voter_id, passw):
+        """Returns Authenticate / VoteCasted / InvalidVoter."""
+        if self.protocol == "text":
+            self.sock.send((str(voter_id) + " " + str(passw)).encode())
+            return self.sock.recv(1024).decode()
+        self._voter_id = voter_id
+        return self.request(proto.MSG_AUTH, {'voter_id': str(voter_id), 'passw': str(passw)})['status']
+
+    def cast_vote(self, sign, voter_id=None):
+        """Returns Successful / Vote Update Failed. voter_id defaults to the last authenticated voter."""
+        if self.protocol == "text":
+            self.sock.send(sign.encode())
+            return self.sock.recv(1024).decode()
+        if voter_id is None:
+            voter_id = self._voter_id
+        return self.request(proto.MSG_VOTE, {'voter_id': str(voter_id), 'sign': sign})['status']
+
+    def verify_biometric(self, descriptors, voter_id=None):
+        """
+        Send live ORB descriptors for a server-side eye match (framed protocol only).
+        Returns the RESULT payload: status Match / NoMatch / NoTemplate / NotAuthenticated, score, name.
+        """
+        if voter_id is None:
+            voter_id = self._voter_id
+        return self.request(proto.MSG_VERIFY_BIO, {'voter_id': str(voter_id),
+                                                   'descriptors': proto.encode_descriptors(descriptors)})
+
+    def results(self, token=None):
+        """
+        Current tally (framed protocol only). token defaults to this
+        machine's observer token; PermissionError if the server refuses it.
+        """
+        return _tally_reply(self.request(proto.MSG_RESULT, _tally_payload(token))).get('counts', {})
+
+    def subscribe_results(self, token=None):
+        """
+        Turn this connection into a results feed (framed protocol only).
+        Returns (version, counts); read the pushed updates with next_tally().
+        """
+        reply = _tally_reply(self.request(proto.MSG_SUBSCRIBE, _tally_payload(token)))
+        return reply.get('version', 0), reply.get('counts', {})
+
+    def next_tally(self):
+        """Block for the next MSG_TALLY push: {"base", "version", "delta"} (or "counts" after a server reload)."""
+        msg_type, payload = proto.recv_frame(self.sock)
+        if msg_type != proto.MSG_TALLY:
+            raise proto.ProtocolError(f"unexpected push type {msg_type}")
+        return payload
+
+    def batch(self, requests):
+        """Send several (msg_type, payload) requests in one frame; returns their replies in order."""
+        reqs = [{'type': t, 'payload': p or {}} for t, p in requests]
+        return self.request(proto.MSG_BATCH, {'requests': reqs}).get('results', [])
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+def _tally_payload(token):
+    return {'token': token or proto.load_results_token() or ''}
+
+
+def _tally_reply(reply):
+    if reply.get('status') != "OK":
+        raise PermissionError(reply.get('error') or reply.get('status'))
+    return reply
+
+
+class SessionClosed(ConnectionError):
+    """The booth session lost its connection before the reply arrived."""
+
+
+class BoothSession:
+    """
+    One persistent, multiplexed connection from a booth to the server.
+    Any thread may call request(); replies are matched to requests by rid in
+    a reader thread. generation is bumped on every reconnect, because the
+    server's per-connection login state does not survive one.
+    """
+
+    def __init__(self, host=None, port=SERVER_PORT, timeout=REQUEST_TIMEOUT, heartbeat=HEARTBEAT_INTERVAL):
+        self.host = host or socket.gethostname()
+        self.port = port
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.protocol = "framed"
+        self.sock = None
+        self.generation = 0
+        self._lock = threading.Lock()        # connect / send / pending
+        self._pending = {}                   # rid -> Future
+        self._rid = 0
+        self._last_used = time.monotonic()
+        self._closed = False
+        self._pinger = None
+        self.turn = None                     # SessionClient of the voter now at the booth
+
+    # --- connection --- #
+
+    def connect(self):
+        """Open the connection if it is not open. Returns True once connected."""
+        with self._lock:
+            if self.sock is not None:
+                return True
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            try:
+                msg_type, payload = proto.recv_frame(sock)
+                if msg_type != proto.MSG_HELLO or payload.get('version') != proto.PROTOCOL_VERSION:
+                    raise proto.ProtocolError("unexpected server banner")
+                sock.settimeout(None)    # the reader blocks; request() applies the timeout
+            except Exception:
+                sock.close()
+                raise
+            self.sock = sock
+            self.generation += 1
+            self._last_used = time.monotonic()
+            threading.Thread(target=self._reader, args=(sock,), name="booth-session-reader", daemon=True).start()
+            if self._pinger is None and self.heartbeat:
+                self._pinger = threading.Thread(target=self._heartbeat, name="booth-session-heartbeat", daemon=True)
+                self._pinger.start()
+            return True
+
+    def _drop(self, sock, error):
+        """Forget sock (if it is still the current one) and fail its outstanding requests."""
+        with self._lock:
+            if self.sock is not sock:
+                return
+            self.sock = None
+            pending, self._pending = self._pending, {}
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(SessionClosed(str(error)))
+
+    def _reader(self, sock):
+        try:
+            while True:
+                msg_type, payload = proto.recv_frame(sock)
+                if msg_type != proto.MSG_RESULT:
+                    raise proto.ProtocolError(f"unexpected reply type {msg_type}")
+                with self._lock:
+                    fut = self._pending.pop(payload.get('rid'), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(payload)
+        except (OSError, proto.ProtocolError) as e:
+            self._drop(sock, e)
+
+    def _heartbeat(self):
+        """Ping while idle and reopen a lost connection, so the next voter finds it ready."""
+        failures = 0
+        while not self._closed:
+            time.sleep(self.heartbeat if self.sock is not None else RECONNECT_BACKOFF[min(failures, len(RECONNECT_BACKOFF) - 1)])
+            if self._closed:
+                break
+            try:
+                if self.sock is None:
+                    self.connect()
+                elif time.monotonic() - self._last_used >= self.heartbeat:
+                    self.request(proto.MSG_PING)
+                failures = 0
+            except (OSError, proto.ProtocolError) as e:
+                failures += 1
+                if failures == 1:
+                    print("Booth session: server unreachable:", e)
+
+    # --- requests --- #
+
+    def send(self, msg_type, payload=None):
+        """Send one request; returns (Future of the RESULT payload, connection generation)."""
+        self.connect()
+        payload = dict(payload or {})
+        fut = Future()
+        with self._lock:
+            sock = self.sock
+            if sock is None:
+                raise SessionClosed("connection lost")
+            self._rid += 1
+            payload['rid'] = self._rid
+            self._pending[self._rid] = fut
+            generation = self.generation
+            try:
+                proto.send_frame(sock, msg_type, payload)
+            except OSError as e:
+                self._pending.pop(payload['rid'], None)
+                error = e
+            else:
+                error = None
+            self._last_used = time.monotonic()
+        if error is not None:
+            self._drop(sock, error)
+            raise SessionClosed(str(error))
+        return fut, generation
+
+    def call(self, msg_type, payload=None, retry=None):
+        """
+        Send one request and wait for it. Returns (RESULT payload, generation of
+        the connection that answered). Requests that change nothing on the
+        server are sent again once after a reconnect; a VOTE never is (its
+        outcome would be unknown).
+        """
+        if retry is None:
+            retry = msg_type != proto.MSG_VOTE
+        try:
+            fut, generation = self.send(msg_type, payload)
+            return self._wait(fut), generation
+        except SessionClosed:
+            if not retry:
+                raise
+            fut, generation = self.send(msg_type, payload)
+            return self._wait(fut), generation
+
+    def request(self, msg_type, payload=None):
+        """Send one request and return the RESULT payload."""
+        return self.call(msg_type, payload)[0]
+
+    def _wait(self, fut):
+        try:
+            return fut.result(self.timeout)
+        except FutureTimeout:
+            sock = self.sock
+            if sock is not None:
+                self._drop(sock, "no reply")
+            raise SessionClosed("no reply within " + str(self.timeout) + " s")
+
+    def close(self):
+        self._closed = True
+        if self.sock is not None:
+            self._drop(self.sock, "closed")
+
+
+_sessions = {}     # (host, port) -> BoothSession
+_sessions_lock = threading.Lock()
+
+
+def get_session(host=None, port=SERVER_PORT):
+    """The process-wide BoothSession for a server (created, not yet connected)."""
+    key = (host or socket.gethostname(), port)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = BoothSession(*key)
+        return session
+
+
+class SessionClient:
+    """
+    One voter's turn on a BoothSession, with the VoteClient interface.
+    A successful AUTH (and VERIFY_BIO) is remembered until the vote and
+    replayed first if the session reconnected in between. A turn that ends
+    without a ballot sends MSG_LOGOUT, so the login does not outlive it on
+    the shared connection.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.protocol = "framed"
+        self._voter_id = None
+        self._login = []            # (msg_type, payload) accepted for this voter
+        self._generation = None     # connection they were accepted on
+
+    def connect(self):
+        return self.session.connect()
+
+    def request(self, msg_type, payload=None):
+        return self.session.request(msg_type, payload)
+
+    def _ensure_login(self):
+        self.session.connect()
+        if self._login and self._generation != self.session.generation:
+            for msg_type, payload in self._login:
+                _, self._generation = self.session.call(msg_type, payload)
+
+    def authenticate(self, voter_id, passw):
+        """Returns Authenticate / VoteCasted / InvalidVoter."""
+        self._logout()
+        previous = self.session.turn
+        if previous is not None and previous is not self:
+            previous.close()        # the last voter left without closing their turn
+        self.session.turn = self
+        payload = {'voter_id': str(voter_id), 'passw': str(passw)}
+        reply, self._generation = self.session.call(proto.MSG_AUTH, payload)
+        self._voter_id = voter_id
+        self._login = [(proto.MSG_AUTH, payload)] if reply['status'] == "Authenticate" else []
+        return reply['status']
+
+    def verify_biometric(self, descriptors, voter_id=None):
+        """Server-side eye match; see VoteClient.verify_biometric."""
+        if voter_id is None:
+            voter_id = self._voter_id
+        self._ensure_login()
+        payload = {'voter_id': str(voter_id), 'descriptors': proto.encode_descriptors(descriptors)}
+        reply, self._generation = self.session.call(proto.MSG_VERIFY_BIO, payload)
+        if reply.get('status') == "Match":
+            self._login.append((proto.MSG_VERIFY_BIO, payload))
+        return reply
+
+    def cast_vote(self, sign, voter_id=None):
+        """Returns Successful / Vote Update Failed. voter_id defaults to the authenticated voter."""
+        if voter_id is None:
+            voter_id = self._voter_id
+        self._ensure_login()
+        reply, _ = self.session.call(proto.MSG_VOTE, {'voter_id': str(voter_id), 'sign': sign}, retry=False)
+        self._login = []
+        return reply['status']
+
+    def results(self, token=None):
+        return _tally_reply(self.session.request(proto.MSG_RESULT, _tally_payload(token))).get('counts', {})
+
+    def batch(self, requests):
+        reqs = [{'type': t, 'payload': p or {}} for t, p in requests]
+        return self.session.request(proto.MSG_BATCH, {'requests': reqs}).get('results', [])
+
+    def _logout(self):
+        login, self._login = self._login, []
+        if not login or self._generation != self.session.generation:
+            return      # nothing pending, or it went with the connection it was made on
+        try:
+            self.session.request(proto.MSG_LOGOUT, {'voter_id': login[0][1]['voter_id']})
+        except (OSError, proto.ProtocolError) as e:
+            print("Logout not confirmed (connection dropped, so the login is gone):", e)
+
+    def close(self):
+        """End this voter's turn; the booth session stays open for the next voter."""
+        self._logout()
+        self._voter_id = None
+        if self.session.turn is self:
+            self.session.turn = None
@@ -5,25 +5,32 @@
 
 import tkinter as tk
 from tkinter import Label, Entry, Button, Frame, LEFT, messagebox, Spinbox
-import socket
 import cv2
 import numpy as np
 import dframe as df   # must provide verify(), load_eye_template(), isEligible(), get_voter_row()
-from VotingPage import votingPg   # existing voting page callback
+from lazy_imports import lazy_import
+VotingPage = lazy_import('VotingPage')   # voting page callback; loads PIL once a voter reaches the ballot
+from vote_client import open_client
+offline_queue = lazy_import('offline_queue')   # booth-side ballot queue while the server is unreachable
+from biometric import make_descriptors, MATCH_THRESHOLD
+import match_service
+import camera
+
+# Match the eye on the vote server (MSG_VERIFY_BIO): the booth only sends live
+# ORB descriptors and needs neither the template store nor the master key.
+# False (or a text-protocol server) keeps the local 1:1 check.
+SERVER_BIOMETRIC = True
 
-ORB_N_FEATURES = 500
-MATCH_THRESHOLD = 10  # ~8-15 depending on camera/lighting
 
 def establish_connection():
     try:
-        host = socket.gethostname()
-        port = 4001
-        client_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        client_socket.connect((host, port))
-        message = client_socket.recv(1024)
-        if message.decode() == "Connection Established":
+        client_socket = open_client()
+        if client_socket.connect():
+            # back online: upload ballots taken while the server was unreachable
+            offline_queue.sync_in_background()
             return client_socket
         else:
+            client_socket.close()
             return 'Failed'
     except Exception as e:
         print("Connection Failed:", e)
@@ -40,85 +47,84 @@ def failed_return(root,frame1,client_socket,message):
         pass
 
 def capture_eye_image(camera_index=0, window_name="Verify Eye - press 'c' to capture, 'q' to cancel"):
-    """Capture ROI from specified camera index and return grayscale ROI or None."""
-    try:
-        cam_index = int(camera_index)
-    except Exception:
-        cam_index = 0
-
-    cap = cv2.VideoCapture(cam_index)
-    if not cap.isOpened():
-        print(f"Camera {cam_index} not available.")
-        return None
-    captured = None
-    while True:
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            break
-        h, w = frame.shape[:2]
-        cv2.rectangle(frame, (int(w*0.25), int(h*0.2)), (int(w*0.75), int(h*0.8)), (255,255,255), 2)
-        cv2.putText(frame, f"Cam {cam_index} - Place eye in box. Press 'c' to capture, 'q' to cancel.", (10,30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 1)
-        cv2.imshow(window_name, frame)
-        k = cv2.waitKey(1) & 0xFF
-        if k == ord('c'):
-            roi = frame[int(h*0.2):int(h*0.8), int(w*0.25):int(w*0.75)]
-            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-            captured = gray
-            break
-        elif k == ord('q'):
-            break
-    cap.release()
-    cv2.destroyAllWindows()
-    return captured
-
-def make_descriptors(img_gray):
-    if img_gray is None:
-        return None
-    orb = cv2.ORB_create(ORB_N_FEATURES)
-    kps, des = orb.detectAndCompute(img_gray, None)
-    return des
-
-def match_templates(des1, des2):
-    if des1 is None or des2 is None:
-        return 0
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    try:
-        matches = bf.knnMatch(des1, des2, k=2)
-    except cv2.error:
-        return 0
-    good = []
-    for m_n in matches:
-        if len(m_n) < 2:
-            continue
-        m, n = m_n
-        if m.distance < 0.75 * n.distance:
-            good.append(m)
-    return len(good)
+    """Capture ROI from specified camera index (kept open by camera.py) and return grayscale ROI or None."""
+    return camera.capture_eye_image(camera_index, window_name)
 
 def perform_eye_verification_for_id(voter_id, frame1, camera_index=0, threshold=MATCH_THRESHOLD):
     """
-    Load stored descriptors for voter_id and compare with live capture using chosen camera_index.
+    Compare a live capture from camera_index with voter_id's stored template.
+    Matching runs in match_service (or a background thread) while the UI stays live.
     Returns tuple (ok: bool, score: float)
     """
-    stored = df.load_eye_template(voter_id)
-    if stored is None:
+    if not df.has_eye_template(voter_id):
         Label(frame1, text="No eye template found for this voter. Use normal login.", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
         return False, 0.0
     live = capture_eye_image(camera_index)
     if live is None:
         Label(frame1, text=f"Live capture failed or cancelled (camera {camera_index}).", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
         return False, 0.0
-    live_des = make_descriptors(live)
-    if live_des is None:
+    Label(frame1, text="Matching...", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
+    try:
+        result = match_service.wait_responsive(frame1, match_service.verify_async(voter_id, live))
+    except Exception as e:
+        print("Eye matching failed:", e)
+        result = {'status': 'Error', 'score': 0.0}
+    if result['status'] == 'NoTemplate':
+        Label(frame1, text="No eye template found for this voter. Use normal login.", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
+        return False, 0.0
+    if result['status'] == 'NoDescriptors':
         Label(frame1, text="No descriptors in live capture. Try again with better lighting.", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
         return False, 0.0
-    m1 = match_templates(live_des, stored)
-    m2 = match_templates(stored, live_des)
-    avg = (m1 + m2) / 2.0
+    avg = result.get('score', 0.0)
     print("Match count avg:", avg)
     return (avg >= threshold), avg
 
+def identify_by_eye(root, frame1, voter_ID, camera_index=0, threshold=MATCH_THRESHOLD):
+    """
+    1:N identification: capture an eye, look it up in the eye index and fill in
+    the Voter ID field with the best match (the password is still required).
+    """
+    Label(frame1, text=f"Starting eye capture for identification (camera {camera_index})...", font=('Helvetica', 12, 'bold')).grid(row=7, column=1)
+    root.update()
+    live = capture_eye_image(camera_index)
+    if live is None:
+        Label(frame1, text="Live capture failed or cancelled. Try again.", font=('Helvetica', 12, 'bold')).grid(row=7, column=1)
+        return None
+    try:
+        result = match_service.wait_responsive(frame1, match_service.identify_async(live, threshold))
+    except Exception as e:
+        print("Eye identification failed:", e)
+        result = {'status': 'Error', 'hits': []}
+    if result['status'] == 'NoDescriptors':
+        Label(frame1, text="No descriptors in live capture. Try again with better lighting.", font=('Helvetica', 12, 'bold')).grid(row=7, column=1)
+        return None
+    hits = result.get('hits', [])
+    if not hits:
+        Label(frame1, text="No enrolled voter matches this eye.", font=('Helvetica', 12, 'bold')).grid(row=7, column=1)
+        return None
+    vid, score = hits[0]
+    print("Identified voter", vid, "score:", score)
+    row = df.get_voter_row(vid)
+    name = row.get('name', '') if row else ''
+    voter_ID.set(vid)
+    Label(frame1, text=f"Identified: {name} (ID {vid}). Enter password to continue.", font=('Helvetica', 12, 'bold')).grid(row=7, column=1)
+    return vid
+
+def server_eye_verification(frame1, client_socket, voter_id, camera_index=0):
+    """
+    Capture locally and let the server match the descriptors against its template.
+    Returns tuple (ok: bool, name: str)
+    """
+    live_des = make_descriptors(capture_eye_image(camera_index))
+    if live_des is None:
+        Label(frame1, text=f"Live capture failed or has no descriptors (camera {camera_index}).", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
+        return False, ''
+    reply = client_socket.verify_biometric(live_des, voter_id)
+    print("Server match score:", reply.get('score'))
+    if reply.get('status') == "NoTemplate":
+        Label(frame1, text="No eye template found for this voter. Use normal login.", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
+    return reply.get('status') == "Match", reply.get('name', '')
+
 def log_server(root, frame1, client_socket, voter_ID, password, camera_index=0):
     """
     Original server auth flow: server authenticates, then client performs eye verification using camera_index.
@@ -127,24 +133,28 @@ def log_server(root, frame1, client_socket, voter_ID, password, camera_index=0):
     if not (voter_ID and password):
         voter_ID = "0"
         password = "x"
-    message = voter_ID + " " + password
     try:
-        client_socket.send(message.encode())
+        message = client_socket.authenticate(voter_ID, password)
     except Exception as e:
         failed_return(root, frame1, client_socket, "Connection lost")
         return
-    message = client_socket.recv(1024)
-    message = message.decode()
 
     if message == "Authenticate":
-        ok, score = perform_eye_verification_for_id(voter_ID, frame1, camera_index=camera_index)
+        if SERVER_BIOMETRIC and client_socket.protocol != "text":
+            try:
+                ok, name = server_eye_verification(frame1, client_socket, voter_ID, camera_index=camera_index)
+            except Exception as e:
+                failed_return(root, frame1, client_socket, "Connection lost")
+                return
+        else:
+            ok, score = perform_eye_verification_for_id(voter_ID, frame1, camera_index=camera_index)
+            row = df.get_voter_row(voter_ID) if ok else None
+            name = row.get('name', '') if row else ''
         if ok:
             # show visual confirmation with voter name
-            row = df.get_voter_row(voter_ID)
-            name = row.get('name', '') if row else ''
             confirm = messagebox.askyesno("Confirm Identity", f"Matched Voter:\n\nID: {voter_ID}\nName: {name}\n\nProceed to voting?")
             if confirm:
-                votingPg(root, frame1, client_socket)
+                VotingPage.votingPg(root, frame1, client_socket)
             else:
                 # user cancelled
                 failed_return(root, frame1, client_socket, "User cancelled after identity confirmation")
@@ -164,12 +174,27 @@ def eye_verify_and_login(root, frame1, voter_ID, password, camera_index=0):
     2) If OK, perform local eye verification against stored template for voter_ID using camera_index
     3) If user confirms identity, establish connection to server and send credentials;
        if server returns Authenticate -> votingPg
+    With SERVER_BIOMETRIC both checks happen on the server instead (see log_server).
     """
     # local credential check first (fast)
     if not (voter_ID and password):
         Label(frame1, text="Enter Voter ID and Password before Eye Verify + Login.", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
         return
 
+    if SERVER_BIOMETRIC:
+        # credentials and eye are both checked by the server; no local store needed
+        client_socket = establish_connection()
+        if client_socket == 'Failed':
+            if not offline_queue.OFFLINE_MODE:
+                failed_return(root, frame1, client_socket, "Connection failed")
+                return
+            # offline: fall through to the local checks; the ballot is queued
+        elif client_socket.protocol != "text":
+            log_server(root, frame1, client_socket, voter_ID, password, camera_index=camera_index)
+            return
+        else:
+            client_socket.close()
+
     if not df.verify(voter_ID, password):
         Label(frame1, text="ID/Password do not match local records. Check and try.", font=('Helvetica', 12, 'bold')).grid(row=6, column=1)
         return
@@ -197,25 +222,22 @@ def eye_verify_and_login(root, frame1, voter_ID, password, camera_index=0):
 
     # proceed to server auth
     client_socket = establish_connection()
+    if client_socket == 'Failed' and offline_queue.OFFLINE_MODE:
+        print("Server unreachable: ballot will be queued offline")
+        client_socket = offline_queue.OfflineClient()
     if client_socket == 'Failed':
         failed_return(root, frame1, client_socket, "Connection failed")
         return
 
     # send credentials to server and handle response (same as log_server)
     try:
-        client_socket.send((voter_ID + " " + password).encode())
-    except Exception as e:
-        failed_return(root, frame1, client_socket, "Connection lost")
-        return
-
-    try:
-        message = client_socket.recv(1024).decode()
+        message = client_socket.authenticate(voter_ID, password)
     except Exception as e:
         failed_return(root, frame1, client_socket, "No response from server")
         return
 
     if message == "Authenticate":
-        votingPg(root, frame1, client_socket)
+        VotingPage.votingPg(root, frame1, client_socket)
     elif message == "VoteCasted":
         failed_return(root, frame1, client_socket, "Vote has Already been Cast")
     elif message == "InvalidVoter":
@@ -250,6 +272,7 @@ def voterLogin(root,frame1):
 
     # camera selection spinbox
     Spinbox(frame1, from_=0, to=10, textvariable=camera_var, width=5).grid(row=4, column=2, sticky='w')
+    camera.get_camera(camera_var.get())   # open the default camera while credentials are typed
 
     # Original Login (server auth then eye verification)
     sub = Button(frame1, text="Login", width=12, command = lambda: log_server(root, frame1, client_socket, voter_ID.get(), password.get(), camera_index=camera_var.get()))
@@ -259,6 +282,10 @@ def voterLogin(root,frame1):
     eye_login_btn = Button(frame1, text="Eye Verify + Login", width=16, command = lambda: eye_verify_and_login(root, frame1, voter_ID.get(), password.get(), camera_index=camera_var.get()))
     eye_login_btn.grid(row = 6, column = 3, padx=5, pady=8)
 
+    # 1:N lookup: who is this eye? (fills in the Voter ID)
+    identify_btn = Button(frame1, text="Identify by Eye", width=16, command = lambda: identify_by_eye(root, frame1, voter_ID, camera_index=camera_var.get()))
+    identify_btn.grid(row = 6, column = 4, padx=5, pady=8)
+
     Label(frame1, text="").grid(row = 5,column = 0)
 
     frame1.pack()